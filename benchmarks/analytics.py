@@ -0,0 +1,80 @@
+"""
+Portfolio analytics benchmark
+
+It compares the loop by asset used before (like the first version of
+GET /asset/portfolio) with the NumPy columns of the analytics helper, for one
+big portfolio and for the batch mode with many users. It doesn't use the database.
+
+Running: python3 -m benchmarks.analytics --holdings 10000 --users 10000
+"""
+
+import argparse
+import random
+import time
+import benchmarks.common  # pylint: disable=unused-import  # it sets the environment
+from db.models.asset import PortfolioItem
+from routers.helpers.analytics_helper import Holdings, analyze, batch_analyze
+
+
+def loop_analytics(assets: list, top: int) -> dict:
+    """Percentages, concentration and top exposure with a loop by asset"""
+    total = sum(asset["shares"] * asset["price"] for asset in assets)
+    items = []
+    for asset in assets:
+        item = PortfolioItem()
+        item.mnemonic = asset["mnemonic"]
+        item.percentage = (asset["shares"] * asset["price"] * 100) / total
+        items.append(item)
+
+    hhi = sum((item.percentage / 100) ** 2 for item in items)
+    exposure = sum(sorted((item.percentage for item in items), reverse=True)[:top])
+    return {"total": total, "concentration_index": hhi, "top_exposure": exposure}
+
+
+def timed(func, *args, repeat: int = 5) -> float:
+    """Best time in milliseconds of some runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(args):
+    """Run both ways and print the times"""
+    assets = [{"user_id": f"user{random.randrange(args.users)}", "mnemonic": f"M{i}",
+               "shares": random.randint(1, 1000), "price": random.uniform(1, 500)}
+              for i in range(args.holdings)]
+
+    def vectorized(documents, top):
+        return analyze(Holdings.from_documents(documents), top)
+
+    loop_ms = timed(loop_analytics, assets, args.top)
+    vector_ms = timed(vectorized, assets, args.top)
+    print(f"one portfolio of {args.holdings} holdings: loop {loop_ms:.2f} ms, "
+          f"numpy {vector_ms:.2f} ms ({loop_ms / vector_ms:.1f}x)")
+
+    def loop_batch(documents, top):
+        by_user = {}
+        for document in documents:
+            by_user.setdefault(document["user_id"], []).append(document)
+        return {user_id: loop_analytics(items, top) for user_id, items in by_user.items()}
+
+    def vectorized_batch(documents, top):
+        return batch_analyze(Holdings.from_documents(documents, with_user=True), top)
+
+    assets = [{**asset, "user_id": f"user{random.randrange(args.users)}"}
+              for asset in assets * max(1, (args.users * 20) // args.holdings)]
+    loop_ms = timed(loop_batch, assets, args.top, repeat=1)
+    vector_ms = timed(vectorized_batch, assets, args.top, repeat=1)
+    print(f"batch of {len(assets)} holdings for {args.users} users: loop {loop_ms:.2f} ms, "
+          f"numpy {vector_ms:.2f} ms ({loop_ms / vector_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--holdings", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--top", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+"""
+Bulk import benchmark
+
+It imports the same rows with one POST /asset/ call per row and with a single
+POST /asset/bulk call (CSV body), against the in-process MongoDB stand-in.
+The stand-in checks unique indexes scanning the whole collection, so they are
+only created with --indexes (a real server uses the B-tree instead).
+
+Running: python3 -m benchmarks.bulk_import --rows 1000
+"""
+
+import argparse
+import asyncio
+import time
+from benchmarks.common import api_client, create_user
+from db.indexes import create_indexes
+
+
+async def one_by_one(rows: int, headers: dict) -> float:
+    """Seconds to save the rows calling POST /asset/ for each one"""
+    async with api_client() as client:
+        start = time.perf_counter()
+        for i in range(rows):
+            response = await client.post("/asset/", headers=headers,
+                                         json={"mnemonic": f"M{i}", "price": 10.0, "shares": i})
+            response.raise_for_status()
+        return time.perf_counter() - start
+
+
+async def bulk(rows: int, headers: dict) -> float:
+    """Seconds to save the rows with a single POST /asset/bulk call"""
+    body = "mnemonic,price,shares\n" + "".join(f"M{i},10.0,{i}\n" for i in range(rows))
+
+    async with api_client() as client:
+        start = time.perf_counter()
+        response = await client.post("/asset/bulk", content=body,
+                                     headers={**headers, "Content-Type": "text/csv"})
+        response.raise_for_status()
+        assert response.json()["inserted"] == rows
+        return time.perf_counter() - start
+
+
+async def main(args):
+    """Compare both ways to save the rows"""
+    for label, func in (("POST /asset/", one_by_one), ("POST /asset/bulk", bulk)):
+        _, headers = await create_user()
+        if args.indexes:
+            await create_indexes()
+        elapsed = await func(args.rows, headers)
+        print(f"{label:17} {args.rows} rows in {elapsed:.3f}s ({args.rows / elapsed:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--indexes", action="store_true", help="create the unique indexes")
+    asyncio.run(main(parser.parse_args()))
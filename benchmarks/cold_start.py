@@ -0,0 +1,57 @@
+"""
+Cold start benchmark
+
+It starts fresh interpreters and measures how long it takes to import the app
+(what every worker, test module and CLI command pays) and to create the MongoDB
+client (what the lifespan handler pays once by worker). The client is created
+with the given URI but no command is sent, so the server doesn't need to exist;
+with a mongodb+srv URI the creation includes the DNS lookups.
+
+Running: python3 -m benchmarks.cold_start --runs 5 --uri mongodb://127.0.0.1:27017
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_APP = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+CREATE_CLIENT = """
+import time
+from db.client import db_client
+start = time.perf_counter()
+db_client.connect()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(code: str, uri: str, runs: int) -> float:
+    """Median milliseconds of the code in fresh interpreters"""
+    env = {**os.environ, "MONGO_URI": uri, "SECRET_KEY": os.getenv("SECRET_KEY", "-" * 32),
+           "ALGORITHM": "HS256", "ACCESS_TOKEN_DURATION": "30"}
+    times = [float(subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                                  capture_output=True, text=True).stdout.split()[-1])
+             for _ in range(runs)]
+    return statistics.median(times) * 1000
+
+
+def main(args):
+    """Print the import and the client creation times"""
+    print(f"import main        {measure(IMPORT_APP, args.uri, args.runs):8.1f} ms "
+          f"(no database work at import)")
+    print(f"create the client  {measure(CREATE_CLIENT, args.uri, args.runs):8.1f} ms "
+          f"(paid by the lifespan handler)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--uri", default="mongodb://127.0.0.1:27017")
+    main(parser.parse_args())
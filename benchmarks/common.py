@@ -0,0 +1,46 @@
+"""Shared setup for the benchmarks, it must be imported before the app"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+os.environ.setdefault("SECRET_KEY", "asset_map_benchmark_secret_key_0123")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_DURATION", "30")
+os.environ.setdefault("ADMIN_USERNAMES", "bench_admin")
+
+# pylint: disable=wrong-import-position
+import httpx
+import jwt
+from db.client import db_client
+from db.repository import users_repository, assets_repository
+from main import app
+from db.models.user import User
+from routers.helpers.users_helper import secret_key, algorithm, create_tokens
+
+
+async def create_user(username: str = "bench_user") -> tuple[str, dict]:
+    """Insert a user in an empty database, return its id and the authorization headers"""
+    for collection in await db_client.list_collection_names():
+        await db_client[collection].delete_many({})
+    await users_repository.clear()
+    await assets_repository.clear()
+
+    user = {"username": username, "email": f"{username}@asset.map", "password": "-"}
+    user_id = str(await users_repository.insert(user))
+    tokens = create_tokens(User(id=user_id, username=username, email=user["email"]))
+
+    return user_id, {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def auth_headers(username: str) -> dict:
+    """Authorization headers with a token without the user id, so the user is read
+       from the database in every request"""
+    access_token = {"sub": username, "exp": datetime.now(timezone.utc) + timedelta(minutes=30)}
+    token = jwt.encode(access_token, secret_key, algorithm=algorithm)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def api_client() -> httpx.AsyncClient:
+    """HTTP client calling the app in the same process"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
@@ -0,0 +1,91 @@
+"""
+Concurrency benchmark for the async data layer
+
+It runs the API against the in-process MongoDB stand-in and adds an artificial
+round trip latency to every database call, first blocking the event loop (like
+the synchronous PyMongo driver does) and then awaiting it (like Motor does).
+The identical reads in flight are coalesced, the queries saved are printed too.
+
+Running: python3 -m benchmarks.concurrency --requests 200 --latency 5
+"""
+
+import argparse
+import asyncio
+import time
+from mongomock_motor import AsyncCursor, AsyncMongoMockCollection
+from benchmarks.common import api_client, create_user
+from db.client import db_client
+from routers.helpers.singleflight_helper import single_flight
+
+
+def add_latency(latency: float, blocking: bool):
+    """Patch the stand-in so every round trip takes `latency` seconds"""
+    patched = [(AsyncMongoMockCollection, "find_one"), (AsyncCursor, "to_list")]
+
+    for cls, name in patched:
+        original = getattr(cls, name)
+
+        async def slow(self, *args, _original=original, **kwargs):
+            if blocking:
+                time.sleep(latency)
+            else:
+                await asyncio.sleep(latency)
+            return await _original(self, *args, **kwargs)
+
+        setattr(cls, name, slow)
+
+    def restore():
+        for cls, name in patched:
+            delattr(cls, name)
+
+    return restore
+
+
+async def seed(assets: int) -> dict:
+    """Insert a user with some assets and return the authorization headers"""
+    user_id, headers = await create_user()
+    await db_client.assets.insert_many([
+        {"user_id": user_id, "mnemonic": f"M{i}", "price": 10.0 + i, "shares": i + 1}
+        for i in range(assets)])
+    return headers
+
+
+async def run(requests: int, concurrency: int, headers: dict) -> float:
+    """Send `requests` GET /asset/ calls, `concurrency` at a time, return the seconds"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with api_client() as client:
+        async def call():
+            async with semaphore:
+                response = await client.get("/asset/", headers=headers)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(requests)))
+        return time.perf_counter() - start
+
+
+async def main(args):
+    """Compare a blocking driver with the async one"""
+    headers = await seed(args.assets)
+    latency = args.latency / 1000
+
+    for label, blocking in (("blocking driver", True), ("async driver", False)):
+        restore = add_latency(latency, blocking)
+        saved = single_flight.metrics()["saved"]
+        try:
+            elapsed = await run(args.requests, args.concurrency, headers)
+        finally:
+            restore()
+        print(f"{label:16} {args.requests} requests in {elapsed:.3f}s "
+              f"({args.requests / elapsed:.0f} req/s, "
+              f"{single_flight.metrics()['saved'] - saved} queries saved)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--assets", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=5, help="round trip in milliseconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Event stream benchmark for GET /asset/portfolio/events
+
+It opens many idle portfolio streams (one user each) and measures the memory
+used by each connection while it waits, and the time to publish an asset change
+to one user and a price feed to every user, compared with the number of
+portfolio reads the same clients would do polling. The stand-in finds the
+summaries with a scan, so opening many streams takes a while.
+
+Running: python3 -m benchmarks.events --connections 1000 --poll-seconds 5
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from benchmarks.common import create_user
+from db.client import db_client
+from routers.helpers.events_helper import portfolio_hub
+from routers.helpers.portfolio_helper import apply_asset_change, portfolio_stream, publish_summaries
+from routers.helpers.portfolio_helper import check_versions
+
+
+async def main(args):
+    """Open the streams, publish the events and print the costs"""
+    user_id, _ = await create_user()
+    user_ids = [f"{user_id}-{i}" for i in range(args.connections)]
+    await db_client.portfolios.insert_many([{"_id": uid, "version": 2, "total": 10.0,
+                                             "items": {"AAA": {"value": 10.0, "count": 1}}}
+                                            for uid in user_ids])
+    streams = [portfolio_stream(uid) for uid in user_ids]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    waiting = []
+    for stream in streams:
+        await stream.__anext__()
+        waiting.append(asyncio.ensure_future(stream.__anext__()))
+    await asyncio.sleep(0)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{portfolio_hub.metrics()['subscribers']} idle streams, {used / args.connections / 1024:.1f} KiB each")
+
+    start = time.perf_counter()
+    await check_versions()
+    print(f"Versions of {args.connections} streams checked in {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"(one query for each 1000, every EVENTS_PING_SECONDS)")
+
+    asset = {"mnemonic": "AAA", "price": 10.0, "shares": 1}
+    start = time.perf_counter()
+    await apply_asset_change(user_ids[0], asset, {**asset, "shares": 2})
+    await waiting[0]
+    print(f"Asset change pushed to one user in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    await publish_summaries(user_ids)
+    await asyncio.gather(*waiting[1:])
+    print(f"Price feed pushed to {args.connections} users in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"Polling every {args.poll_seconds} s the same clients would read "
+          f"{args.connections / args.poll_seconds:.0f} portfolios per second")
+
+    for stream in streams:
+        await stream.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--poll-seconds", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,278 @@
+"""
+Load benchmark for every endpoint
+
+It seeds the in-process MongoDB stand-in (a user with N assets and a year of
+history, M more users and some documents for the write endpoints) and calls each
+route of the users and assets routers with the given concurrency, reporting
+the p50/p95/p99 latency and the requests per second. The passwords use the
+real bcrypt cost, so login and the password endpoints include the hashing.
+
+The results can be saved as a JSON baseline, and checked against a previous
+baseline: the exit code is 1 when the p95 latency of a route is worse than the
+baseline multiplied by the threshold.
+
+Running: python3 -m benchmarks.load --requests 100 --concurrency 10 --assets 100 --rows 1000
+Without the MongoDB stand-in for users and assets: REPOSITORY_BACKEND=memory python3 -m benchmarks.load
+Saving a baseline: python3 -m benchmarks.load --save benchmarks/baseline.json
+Checking it: python3 -m benchmarks.load --check benchmarks/baseline.json --threshold 1.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import httpx
+from bson import ObjectId
+
+# The password requests wait for a worker instead of getting a 503
+os.environ.setdefault("PASSWORD_POOL_QUEUE_LIMIT", "100000")
+# Every request comes from the same client, it would be throttled
+os.environ.setdefault("THROTTLE_IP_PER_MINUTE", "0")
+os.environ.setdefault("THROTTLE_USERNAME_PER_MINUTE", "0")
+
+# pylint: disable=wrong-import-position
+from benchmarks.common import api_client, auth_headers, create_user
+from db.client import db_client
+from db.models.user import User
+from db.repository import users_repository, assets_repository
+from main import app
+from routers.helpers.helper import MAX_PAGE_SIZE
+from routers.helpers.history_helper import HISTORY_COLLECTION
+from routers.helpers.portfolio_helper import rebuild_summaries
+from routers.helpers.rollups_helper import reconcile_rollups
+from routers.helpers.users_helper import pwd_context, create_tokens
+
+PASSWORD = "bench_password"
+
+
+async def seed(args) -> dict:
+    """Insert the data used by the routes and return what they need to call them"""
+    user_id, headers = await create_user("bench_user")
+    await users_repository.update(ObjectId(user_id), {"password": pwd_context.hash(PASSWORD)})
+
+    # The reader has N assets and the writer gets the writes, so the reads don't change
+    for i in range(args.assets):
+        await assets_repository.insert({"user_id": user_id, "mnemonic": f"M{i}",
+                                        "price": 10.0 + i, "shares": i + 1})
+    now = datetime.now(timezone.utc)
+    await db_client[HISTORY_COLLECTION].insert_many([
+        {"ts": now - timedelta(days=day), "user_id": user_id, "total": 1000.0 + day}
+        for day in range(365)])
+
+    writer_id = str(await insert_user("bench_writer"))
+    writer_assets = [str(await assets_repository.insert({"user_id": writer_id, "mnemonic": f"W{i}",
+                                                         "price": 10.0, "shares": 1}))
+                     for i in range(args.requests * 2)]
+
+    await insert_user("bench_admin")
+    for i in range(args.rows):
+        await insert_user(f"user{i}")
+    target_id = await insert_user("bench_target")
+    deleted_users = [str(await insert_user(f"deleted{i}")) for i in range(args.requests)]
+
+    await rebuild_summaries()
+    await reconcile_rollups()
+
+    tokens = create_tokens(User(id=user_id, username="bench_user", email="bench_user@asset.map"))
+
+    return {"user_id": user_id, "headers": headers, "writer": auth_headers("bench_writer"),
+            "admin": auth_headers("bench_admin"), "target_id": str(target_id),
+            "deleted_users": deleted_users, "writer_assets": writer_assets,
+            "refresh_token": tokens["refresh_token"],
+            "assets": args.assets, "rows": args.rows, "bulk_rows": args.bulk_rows}
+
+
+async def insert_user(username: str):
+    """Insert a user without password and return its id"""
+    return await users_repository.insert({"username": username, "email": f"{username}@asset.map",
+                                          "password": "-"})
+
+
+async def first_event(path: str, headers: dict) -> httpx.Response:
+    """Open an event stream, read its first event and disconnect. httpx.ASGITransport
+       waits for the whole body and the stream never ends, so the app is called directly"""
+    received = asyncio.Event()
+    start, chunks = {}, []
+
+    async def receive():
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if b"\n\n" in b"".join(chunks) or not message.get("more_body", False):
+                received.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 0), "root_path": "",
+             "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+    await app(scope, receive, send)
+    return httpx.Response(start.get("status", 500), content=b"".join(chunks))
+
+
+# Each route: the name, the expected status and the function sending the request number i
+ROUTES = [
+    ("GET /user/", 200, lambda client, ctx, i: client.get(
+        f"/user/?limit={min(ctx['rows'], MAX_PAGE_SIZE)}", headers=ctx["headers"])),
+    ("GET /user/{user_id}", 200, lambda client, ctx, i: client.get(
+        f"/user/{ctx['user_id']}", headers=ctx["headers"])),
+    ("GET /user/password/metrics", 200, lambda client, ctx, i: client.get(
+        "/user/password/metrics", headers=ctx["headers"])),
+    ("GET /asset/", 200, lambda client, ctx, i: client.get(
+        f"/asset/?limit={min(ctx['assets'], MAX_PAGE_SIZE)}", headers=ctx["headers"])),
+    ("GET /asset/?fields", 200, lambda client, ctx, i: client.get(
+        f"/asset/?fields=mnemonic,shares&limit={min(ctx['assets'], MAX_PAGE_SIZE)}", headers=ctx["headers"])),
+    ("GET /asset/portfolio", 200, lambda client, ctx, i: client.get(
+        "/asset/portfolio?top=10&sort=percentage", headers=ctx["headers"])),
+    ("GET /asset/portfolio/history", 200, lambda client, ctx, i: client.get(
+        "/asset/portfolio/history?interval=week", headers=ctx["headers"])),
+    ("GET /asset/portfolio/events", 200, lambda client, ctx, i: first_event(
+        "/asset/portfolio/events", ctx["headers"])),
+    ("GET /asset/analytics", 200, lambda client, ctx, i: client.get(
+        "/asset/analytics", headers=ctx["headers"])),
+    ("POST /asset/rebalance", 200, lambda client, ctx, i: client.post(
+        "/asset/rebalance", headers=ctx["headers"],
+        json=[{"mnemonic": "M0", "percentage": 50}, {"mnemonic": "M1", "percentage": 50}])),
+    ("GET /asset/rollups", 200, lambda client, ctx, i: client.get(
+        "/asset/rollups?limit=100", headers=ctx["admin"])),
+    ("GET /asset/rollups/{mnemonic}", 200, lambda client, ctx, i: client.get(
+        f"/asset/rollups/M{i % ctx['assets']}", headers=ctx["admin"])),
+    ("POST /asset/rollups/reconcile", 200, lambda client, ctx, i: client.post(
+        "/asset/rollups/reconcile", headers=ctx["admin"])),
+    ("POST /user/login", 200, lambda client, ctx, i: client.post(
+        "/user/login", data={"username": "bench_user", "password": PASSWORD})),
+    ("POST /user/refresh", 200, lambda client, ctx, i: client.post(
+        "/user/refresh", json={"refresh_token": ctx["refresh_token"]})),
+    ("POST /user/", 201, lambda client, ctx, i: client.post(
+        "/user/", json={"username": f"new{i}", "email": f"new{i}@asset.map", "password": PASSWORD})),
+    ("PUT /user/", 200, lambda client, ctx, i: client.put(
+        "/user/", headers=ctx["headers"],
+        json={"id": ctx["target_id"], "username": "bench_target", "email": f"target{i}@asset.map"})),
+    ("PATCH /user/password/{user_id}", 204, lambda client, ctx, i: client.patch(
+        f"/user/password/{ctx['target_id']}", headers=ctx["headers"], json={"password": f"{PASSWORD}{i}"})),
+    ("DELETE /user/{user_id}", 204, lambda client, ctx, i: client.delete(
+        f"/user/{ctx['deleted_users'][i]}", headers=ctx["headers"])),
+    ("POST /asset/", 201, lambda client, ctx, i: client.post(
+        "/asset/", headers=ctx["writer"], json={"mnemonic": f"N{i}", "price": 10.0, "shares": i})),
+    ("PUT /asset/", 200, lambda client, ctx, i: client.put(
+        "/asset/", headers=ctx["writer"],
+        json={"id": ctx["writer_assets"][i], "mnemonic": f"W{i}", "price": 20.0, "shares": 2})),
+    ("POST /asset/{asset_id}/trade", 200, lambda client, ctx, i: client.post(
+        f"/asset/{ctx['writer_assets'][i]}/trade", headers=ctx["writer"],
+        json={"side": "buy", "shares": 1, "price": 30.0})),
+    ("DELETE /asset/{asset_id}", 204, lambda client, ctx, i: client.delete(
+        f"/asset/{ctx['writer_assets'][-i - 1]}", headers=ctx["writer"])),
+    ("POST /asset/bulk", 200, lambda client, ctx, i: client.post(
+        "/asset/bulk?upsert=true", headers={**ctx["writer"], "Content-Type": "text/csv"},
+        content="mnemonic,price,shares\n" + "".join(f"B{row},10.0,{i}\n" for row in range(ctx["bulk_rows"])))),
+    ("POST /asset/prices", 200, lambda client, ctx, i: client.post(
+        "/asset/prices", headers=ctx["admin"],
+        json=[{"mnemonic": f"M{row}", "price": 10.0 + i} for row in range(10)])),
+]
+
+
+def percentile(latencies: list, percent: int) -> float:
+    """Latency in milliseconds below which there are `percent` of the requests"""
+    if len(latencies) == 1:
+        return latencies[0] * 1000
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1] * 1000
+
+
+async def run_route(client, ctx: dict, route: tuple, requests: int, concurrency: int) -> dict:
+    """Send the requests of a route, `concurrency` at a time, and summarize the latency"""
+    _, expected, send = route
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def call(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(client, ctx, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {"requests": requests, "errors": errors, "rps": requests / elapsed,
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99)}
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Routes where the p95 latency is worse than the baseline by more than the threshold"""
+    found = []
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous and result["p95"] > previous["p95"] * threshold:
+            found.append(f"{name}: p95 {result['p95']:.2f} ms, baseline {previous['p95']:.2f} ms")
+        if result["errors"]:
+            found.append(f"{name}: {result['errors']} unexpected responses")
+    return found
+
+
+async def main(args) -> int:
+    """Run the routes one after the other and report, save or check the results"""
+    ctx = await seed(args)
+    routes = [route for route in ROUTES if re.search(args.routes, route[0])]
+    results = {}
+
+    print(f"{'route':32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} errors")
+    async with api_client() as client:
+        for route in routes:
+            result = await run_route(client, ctx, route, args.requests, args.concurrency)
+            results[route[0]] = result
+            print(f"{route[0]:32} {result['rps']:8.0f} {result['p50']:8.2f} {result['p95']:8.2f} "
+                  f"{result['p99']:8.2f} {result['errors']}")
+
+    report = {"created_at": datetime.now(timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "config": {"requests": args.requests, "concurrency": args.concurrency,
+                         "assets": args.assets, "rows": args.rows, "bulk_rows": args.bulk_rows},
+              "results": results}
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved in {args.save}")
+
+    if args.check:
+        with open(args.check, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["config"] != report["config"]:
+            print(f"Warning: the baseline was measured with {baseline['config']}")
+        found = regressions(results, baseline, args.threshold)
+        for item in found:
+            print(f"Regression in {item}")
+        return 1 if found else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=100, help="requests by route")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--assets", type=int, default=100, help="assets in the portfolio")
+    parser.add_argument("--rows", type=int, default=1000, help="users in the database")
+    parser.add_argument("--bulk-rows", type=int, default=100, help="rows in each bulk import")
+    parser.add_argument("--routes", default="", help="regular expression to select the routes")
+    parser.add_argument("--save", help="file to save the results as a baseline")
+    parser.add_argument("--check", help="baseline file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="allowed ratio between the p95 latency and the baseline")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,73 @@
+"""
+Serialization benchmark for the list endpoints
+
+It measures the cost by item of turning the database documents of GET /asset/
+and GET /user/ into the response body, first like FastAPI does with the
+response model (validation of the schema dicts, conversion to JSON types and
+the standard json module) and then with the fast path of the helper (the schema
+dicts encoded directly by orjson). It doesn't use the database.
+
+Running: python3 -m benchmarks.serialization --items 1000
+"""
+
+import argparse
+import json
+import time
+from bson import ObjectId
+from pydantic import TypeAdapter
+import benchmarks.common  # pylint: disable=unused-import  # it sets the environment
+from db.models.asset import Asset
+from db.models.user import User
+from db.schemas.asset import assets_schema
+from db.schemas.user import users_schema
+from routers.helpers.helper import dump_json
+
+
+def model_path(adapter: TypeAdapter, schema, documents: list) -> bytes:
+    """Like a route returning the schema dicts with a response model"""
+    content = adapter.validate_python(schema(documents))
+    return json.dumps(adapter.dump_python(content, mode="json"), ensure_ascii=False,
+                      allow_nan=False, separators=(",", ":")).encode()
+
+
+def fast_path(schema, documents: list) -> bytes:
+    """Like a route returning json_response with the schema dicts"""
+    return dump_json(schema(documents))
+
+
+def timed(func, *args, repeat: int = 20) -> float:
+    """Best time in seconds of some runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    """Run both ways for each endpoint and print the cost by item"""
+    user_id = str(ObjectId())
+    endpoints = {
+        "/asset/": (Asset, assets_schema,
+                    [{"_id": ObjectId(), "user_id": user_id, "mnemonic": f"M{i}",
+                      "price": 10.5 + i, "shares": i} for i in range(args.items)]),
+        "/user/": (User, users_schema,
+                   [{"_id": ObjectId(), "username": f"user{i}", "email": f"user{i}@asset.map"}
+                    for i in range(args.items)]),
+    }
+
+    for url, (model, schema, documents) in endpoints.items():
+        adapter = TypeAdapter(list[model])
+        assert json.loads(model_path(adapter, schema, documents)) == json.loads(fast_path(schema, documents))
+
+        before = timed(model_path, adapter, schema, documents) * 1e6 / args.items
+        after = timed(fast_path, schema, documents) * 1e6 / args.items
+        print(f"{url:8} response model {before:.2f} us/item, fast path {after:.2f} us/item "
+              f"({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--items", type=int, default=1000)
+    main(parser.parse_args())
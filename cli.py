@@ -0,0 +1,150 @@
+"""
+Command line tasks for AssetMap
+
+Some important notes:
+- Rebuild the portfolio summaries: python3 -m cli portfolio-summaries
+- Only report the drift of the summaries: python3 -m cli portfolio-summaries --dry-run
+- Report missing or unused indexes: python3 -m cli indexes [--create]
+- Apply a price feed: python3 -m cli prices <FILE.csv|FILE.ndjson>
+- Calculate the analytics of every user: python3 -m cli analytics [--top 5]
+- Save a snapshot of every portfolio: python3 -m cli snapshot
+- Reconcile the holdings rollups with the assets: python3 -m cli rollups [--dry-run]
+- Find the bcrypt cost for this host: python3 -m cli bcrypt-cost [--target-ms 250]
+"""
+
+import argparse
+import asyncio
+from db.indexes import create_indexes, index_report
+from routers.helpers.bulk_helper import CSV_MEDIA_TYPE
+from routers.helpers.helper import NDJSON_MEDIA_TYPE
+from routers.helpers.prices_helper import apply_prices, read_price_file
+from routers.helpers.analytics_helper import analyze_all_users
+from routers.helpers.history_helper import create_history_collection, take_snapshots
+from routers.helpers.portfolio_helper import rebuild_summaries
+from routers.helpers.rollups_helper import reconcile_rollups
+from routers.helpers.password_helper import calibrate_rounds
+
+
+async def portfolio_summaries(args) -> int:
+    """Rebuild the portfolio summaries from the assets and report the drift"""
+    report = await rebuild_summaries(args.user_id, dry_run=args.dry_run)
+
+    for item in report:
+        print(f"{item['user_id']}: total {item['stored_total']} -> {item['expected_total']}, "
+              f"drift in {', '.join(item['drift'])}")
+
+    action = "found" if args.dry_run else "fixed"
+    print(f"{len(report)} summaries with drift {action}")
+
+    return 1 if args.dry_run and report else 0
+
+
+async def indexes(args) -> int:
+    """Report the missing (and the duplicates that don't let the unique ones be created),
+       undeclared and unused indexes"""
+    if args.create:
+        await create_indexes()
+
+    report = await index_report()
+    for kind, names in report.items():
+        print(f"{kind}: {', '.join(names) if names else '-'}")
+
+    return 1 if report["missing"] else 0
+
+
+async def prices(args) -> int:
+    """Apply the prices of a CSV (mnemonic,price header) or NDJSON file"""
+    media_type = CSV_MEDIA_TYPE if args.file.endswith(".csv") else NDJSON_MEDIA_TYPE
+    quotes, errors = await read_price_file(args.file, media_type)
+
+    for error in errors:
+        print(error)
+
+    result = await apply_prices(quotes)
+    print(f"Version {result.version}: {result.quotes} prices, {result.assets_modified} assets "
+          f"and {result.portfolios_refreshed} portfolios updated")
+
+    return 1 if errors else 0
+
+
+async def analytics(args) -> int:
+    """Calculate the analytics of every user in one pass and save them"""
+    users = await analyze_all_users(args.top)
+    print(f"Analytics of {users} users saved")
+
+    return 0
+
+
+async def snapshot(_) -> int:
+    """Save the value and the weights of every portfolio in the history"""
+    await create_history_collection()
+    print(f"{await take_snapshots()} snapshots saved")
+
+    return 0
+
+
+async def rollups(args) -> int:
+    """Reconcile the holdings rollups with the assets and report the drift"""
+    report = await reconcile_rollups(dry_run=args.dry_run)
+
+    for item in report:
+        print(f"{item['mnemonic']}: drift in {', '.join(item['drift'])}")
+
+    action = "found" if args.dry_run else "fixed"
+    print(f"{len(report)} rollups with drift {action}")
+
+    return 1 if args.dry_run and report else 0
+
+
+async def bcrypt_cost(args) -> int:
+    """Measure the hash time of each bcrypt cost and suggest the highest within the target"""
+    rounds, times = calibrate_rounds(args.target_ms, max_rounds=args.max_rounds)
+
+    for cost, ms in times.items():
+        print(f"cost {cost}: {ms:.1f} ms")
+
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+    return 0 if times[rounds] <= args.target_ms else 1
+
+
+def main() -> int:
+    """Parse the arguments and run the task"""
+    parser = argparse.ArgumentParser(description="Command line tasks for AssetMap")
+    tasks = parser.add_subparsers(dest="task", required=True)
+
+    task = tasks.add_parser("portfolio-summaries", help=portfolio_summaries.__doc__)
+    task.add_argument("--user-id", help="only this user")
+    task.add_argument("--dry-run", action="store_true", help="only report the drift")
+    task.set_defaults(func=portfolio_summaries)
+
+    task = tasks.add_parser("indexes", help=indexes.__doc__)
+    task.add_argument("--create", action="store_true", help="create the missing indexes first")
+    task.set_defaults(func=indexes)
+
+    task = tasks.add_parser("prices", help=prices.__doc__)
+    task.add_argument("file", help="CSV or NDJSON file with the prices")
+    task.set_defaults(func=prices)
+
+    task = tasks.add_parser("analytics", help=analytics.__doc__)
+    task.add_argument("--top", type=int, default=5, help="number of assets for the top exposure")
+    task.set_defaults(func=analytics)
+
+    task = tasks.add_parser("snapshot", help=snapshot.__doc__)
+    task.set_defaults(func=snapshot)
+
+    task = tasks.add_parser("rollups", help=rollups.__doc__)
+    task.add_argument("--dry-run", action="store_true", help="only report the drift")
+    task.set_defaults(func=rollups)
+
+    task = tasks.add_parser("bcrypt-cost", help=bcrypt_cost.__doc__)
+    task.add_argument("--target-ms", type=float, default=250, help="maximum time to hash a password")
+    task.add_argument("--max-rounds", type=int, default=16, help="highest cost to measure")
+    task.set_defaults(func=bcrypt_cost)
+
+    args = parser.parse_args()
+    return asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,28 +2,114 @@
 
 import os
 from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
 import certifi
+from db.listeners import CommandMetrics
 
-# Load environment variables from .env file
+# Load environment variables from .env file, the other modules read them after importing this one
 load_dotenv()
 
 # Getting the MongoDB URI from the environment variable
 mongo_uri = os.getenv("MONGO_URI")
 
-# Create a MongoDB client (if there is no URI, use the default connection)
-if not mongo_uri:
-    db_client = MongoClient().asset_map
-else:
-    ca = certifi.where()
-    db_client = MongoClient(mongo_uri, tlsCAFile=ca).asset_map
-
-# Send a ping to confirm a successful connection
-try:
-    db_client.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except ConnectionFailure as e:
-    print(f"Error connecting to MongoDB: {e}")
-except OperationFailure as e:
-    print(f"Error executing ping command on MongoDB: {e}")
+# Client options that can be set with environment variables, the driver defaults are used otherwise
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+client_options = {option: int(os.environ[variable])
+                  for variable, option in CLIENT_OPTIONS.items() if os.getenv(variable)}
+# Read preference of the API queries (primary, primaryPreferred, secondaryPreferred...)
+if os.getenv("MONGO_READ_PREFERENCE"):
+    client_options["readPreference"] = os.environ["MONGO_READ_PREFERENCE"]
+
+# Commands slower than this are reported with their filter
+slow_query_ms = float(os.getenv("SLOW_QUERY_MS", "100"))
+command_metrics = CommandMetrics(slow_query_ms)
+
+# URIs with this scheme use an in-process stand-in instead of a real server
+MOCK_SCHEME = "mongomock://"
+
+DATABASE_NAME = "asset_map"
+
+
+def create_client():
+    """Create the async MongoDB client based on the MONGO_URI variable"""
+    if mongo_uri and mongo_uri.startswith(MOCK_SCHEME):
+        # Imported here because it is only needed for local runs and tests
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+
+    options = {**client_options, "event_listeners": [command_metrics]}
+
+    # If there is no URI, use the default connection
+    if not mongo_uri:
+        return AsyncIOMotorClient(**options)
+
+    return AsyncIOMotorClient(mongo_uri, tlsCAFile=certifi.where(), **options)
+
+
+class LazyDatabase:
+    """Class giving access to the database, the client is created by the
+       lifespan handler of the app or the first time it's used (CLI, scripts)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._client = None
+        self._database = None
+
+    @property
+    def connected(self) -> bool:
+        """Check if the client was created"""
+        return self._client is not None
+
+    def connect(self):
+        """Create the client if it doesn't exist yet"""
+        if self._client is None:
+            self._client = create_client()
+            self._database = self._client[self.name]
+        return self._database
+
+    def close(self):
+        """Close the client, the next use creates a new one"""
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._database = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.connect(), name)
+
+    def __getitem__(self, name: str):
+        return self.connect()[name]
+
+
+db_client = LazyDatabase(DATABASE_NAME)
+
+
+async def ping() -> bool:
+    """Send a ping to confirm a successful connection"""
+    try:
+        await db_client.command('ping')
+        print("Pinged your deployment. You successfully connected to MongoDB!")
+        return True
+    except ConnectionFailure as e:
+        print(f"Error connecting to MongoDB: {e}")
+    except OperationFailure as e:
+        print(f"Error executing ping command on MongoDB: {e}")
+    return False
+
+
+async def database_ready() -> bool:
+    """Check quietly if the database answers, for the readiness probe"""
+    try:
+        await db_client.command("ping")
+        return True
+    except PyMongoError:
+        return False
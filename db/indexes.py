@@ -0,0 +1,104 @@
+"""MongoDB indexes"""
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from db.client import db_client
+
+# The indexes required by the API, by collection
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "assets": [
+        # It's also used by the queries filtering only by user_id
+        IndexModel([("user_id", ASCENDING), ("mnemonic", ASCENDING)],
+                   name="user_id_mnemonic_unique", unique=True),
+        # Used by the price feed to update every holder of a mnemonic
+        IndexModel([("mnemonic", ASCENDING)], name="mnemonic"),
+    ],
+    # The reports of the rollups sort by these fields
+    "rollups": [
+        IndexModel([("value", DESCENDING)], name="value"),
+        IndexModel([("users", DESCENDING)], name="users"),
+        IndexModel([("shares", DESCENDING)], name="shares"),
+    ],
+    "revocations": [
+        # The revocations are removed when every token they revoke is expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    # The token buckets and the failed logins of the mongo throttle backend
+    "throttle": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "lockouts": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+async def create_indexes():
+    """Create the indexes that don't exist yet"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db_client[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            print(f"Error creating the indexes of {collection}: {e}")
+
+
+async def missing_unique_indexes() -> list:
+    """The unique indexes declared but not in the database, without them the
+       duplicated users and assets are saved (there is no check before inserting)"""
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = await db_client[collection].index_information()
+        missing += [f"{collection}.{index.document['name']}" for index in indexes
+                    if index.document.get("unique")
+                    and not existing.get(index.document["name"], {}).get("unique")]
+    return missing
+
+
+async def duplicated_keys(collection: str, index: IndexModel, limit: int = 5) -> list:
+    """Some of the values repeated in the fields of a unique index,
+       they don't let the index be created"""
+    fields = list(index.document["key"])
+    pipeline = [{"$group": {"_id": {field: f"${field}" for field in fields}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+                {"$limit": limit}]
+    return await db_client[collection].aggregate(pipeline).to_list(None)
+
+
+async def index_usage(collection: str) -> dict | None:
+    """Number of operations that used each index since the server started,
+       None if the server doesn't report it"""
+    try:
+        stats = await db_client[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+    except (OperationFailure, NotImplementedError):
+        return None
+
+    return {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+
+
+async def index_report() -> dict:
+    """Indexes declared but missing in the database (and the duplicated values that
+       don't let the unique ones be created), and indexes in the database that are
+       not declared or were never used"""
+    report = {"missing": [], "duplicated": [], "undeclared": [], "unused": []}
+
+    for collection, indexes in INDEXES.items():
+        existing = await db_client[collection].index_information()
+        declared = {index.document["name"] for index in indexes}
+        usage = await index_usage(collection)
+
+        report["missing"] += [f"{collection}.{name}" for name in sorted(declared - existing.keys())]
+        for index in indexes:
+            if index.document.get("unique") and index.document["name"] not in existing:
+                report["duplicated"] += [f"{collection}.{index.document['name']} {found['_id']} x{found['count']}"
+                                         for found in await duplicated_keys(collection, index)]
+        report["undeclared"] += [f"{collection}.{name}" for name in sorted(existing.keys() - declared)
+                                 if name != "_id_"]
+        if usage is not None:
+            report["unused"] += [f"{collection}.{name}" for name, ops in sorted(usage.items())
+                                 if ops == 0 and name != "_id_"]
+
+    return report
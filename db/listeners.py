@@ -0,0 +1,57 @@
+"""MongoDB command listeners"""
+
+from pymongo import monitoring
+from routers.helpers.metrics_helper import COMMAND_SECONDS, COMMAND_FAILURES, SLOW_COMMANDS
+
+# Fields with the filter of each command, used to report the slow ones
+FILTER_FIELDS = {"find": "filter", "count": "query", "distinct": "query",
+                 "findAndModify": "query", "aggregate": "pipeline"}
+
+
+def command_collection(command_name: str, command: dict) -> str:
+    """Collection used by a command, "-" for the commands without one"""
+    collection = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return collection if isinstance(collection, str) else "-"
+
+
+def command_filter(command_name: str, command: dict):
+    """Filter (or pipeline) of a command, for the writes the one of the first statement"""
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name])
+    for field in ("updates", "deletes"):
+        if command.get(field):
+            return command[field][0].get("q")
+    return None
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Class recording the duration of every MongoDB command by collection,
+       the commands slower than slow_ms are reported with their filter"""
+
+    def __init__(self, slow_ms: float):
+        self.slow_ms = slow_ms
+        self._started: dict[tuple, tuple] = {}
+
+    def started(self, event):
+        self._started[(event.connection_id, event.request_id)] = (
+            command_collection(event.command_name, event.command), event.command)
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def _finished(self, event, failed: bool):
+        """Record the duration of the command"""
+        collection, command = self._started.pop((event.connection_id, event.request_id), ("-", {}))
+        seconds = event.duration_micros / 1_000_000
+        COMMAND_SECONDS.observe(seconds, collection, event.command_name)
+
+        if failed:
+            COMMAND_FAILURES.inc(collection, event.command_name)
+
+        if seconds * 1000 >= self.slow_ms:
+            SLOW_COMMANDS.inc(collection, event.command_name)
+            print(f"Slow MongoDB command: {event.command_name} on {collection} took "
+                  f"{seconds * 1000:.1f} ms, filter: {command_filter(event.command_name, command)}")
@@ -0,0 +1,32 @@
+"""Analytics model"""
+
+from pydantic import BaseModel, Field
+
+
+class PortfolioAnalytics(BaseModel):
+    """Class representing the analytics of a portfolio"""
+
+    total: float
+    holdings: int
+    concentration_index: float = Field(description="Herfindahl-Hirschman index of the weights (0 to 1)")
+    effective_holdings: float = Field(description="Number of equally weighted assets with the same concentration")
+    top: int
+    top_exposure: float = Field(description="Percentage of the portfolio in the top N assets")
+
+
+class TargetAllocation(BaseModel):
+    """Class representing the percentage of the portfolio wanted for a mnemonic"""
+
+    mnemonic: str
+    percentage: float = Field(ge=0, le=100)
+
+
+class RebalanceTrade(BaseModel):
+    """Class representing the trade needed to reach the target of a mnemonic,
+       positive values are buys and negative values are sells"""
+
+    mnemonic: str
+    current_percentage: float
+    target_percentage: float
+    value: float
+    shares: int | None = Field(default=None)
@@ -1,12 +1,14 @@
 """Asset model"""
 
+from datetime import datetime
+from typing import Literal
 from pydantic import BaseModel, Field
 
 
 class NewAsset(BaseModel):
     """Class representing a new asset"""
 
-    mnemonic: str
+    mnemonic: str = Field(min_length=1) # It's a field name of the portfolio summary
     price: float
     shares: int
 
@@ -16,9 +18,19 @@ class Asset(NewAsset):
 
     id: str = Field(default=None)
     user_id: str = Field(default=None)
-    mnemonic: str
+    mnemonic: str = Field(min_length=1) # It's a field name of the portfolio summary
     price: float
     shares: int
+    avg_price: float | None = Field(default=None)
+
+
+class Trade(BaseModel):
+    """Class representing a buy or a sell of shares of an asset at a price,
+       the buys change the average price paid and the sells don't"""
+
+    side: Literal["buy", "sell"]
+    shares: int = Field(gt=0)
+    price: float = Field(gt=0)
 
 
 class PortfolioItem(BaseModel):
@@ -26,3 +38,39 @@ class PortfolioItem(BaseModel):
 
     mnemonic: str = Field(default=None)
     percentage: float = Field(default=None)
+
+
+class HistoryPoint(BaseModel):
+    """Class representing the value of a portfolio at a moment"""
+
+    ts: datetime
+    total: float
+    weights: dict[str, float] | None = Field(default=None)
+
+
+class BulkRowResult(BaseModel):
+    """Class representing the result of a row in a bulk import"""
+
+    row: int
+    mnemonic: str | None = Field(default=None)
+    status: str
+    error: str | None = Field(default=None)
+
+
+class BulkImportReport(BaseModel):
+    """Class representing the result of a bulk import"""
+
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    rows: list[BulkRowResult] = Field(default_factory=list)
+
+    def add(self, result: BulkRowResult):
+        """Add the result of a row and count it"""
+        if result.status == "inserted":
+            self.inserted += 1
+        elif result.status == "updated":
+            self.updated += 1
+        else:
+            self.failed += 1
+        self.rows.append(result)
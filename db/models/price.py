@@ -0,0 +1,22 @@
+"""Price model"""
+
+from datetime import datetime
+from pydantic import BaseModel
+
+
+class PriceQuote(BaseModel):
+    """Class representing the market price of a mnemonic"""
+
+    mnemonic: str
+    price: float
+
+
+class PriceUpdate(BaseModel):
+    """Class representing the result of applying a price feed"""
+
+    version: int
+    updated_at: datetime
+    quotes: int
+    assets_matched: int
+    assets_modified: int
+    portfolios_refreshed: int
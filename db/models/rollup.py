@@ -0,0 +1,21 @@
+"""Rollup model"""
+
+from datetime import datetime
+from pydantic import BaseModel
+
+
+class HoldingRollup(BaseModel):
+    """Class representing the holdings of every user in a mnemonic"""
+
+    mnemonic: str
+    shares: float
+    value: float
+    users: int
+    updated_at: datetime
+
+
+class RollupDrift(BaseModel):
+    """Class representing a rollup different from the assets"""
+
+    mnemonic: str
+    drift: list[str]
@@ -28,3 +28,9 @@ class PasswordUpdateRequest(BaseModel):
     """Class representing a password in database"""
 
     password: str
+
+
+class RefreshRequest(BaseModel):
+    """Class representing a request for new tokens"""
+
+    refresh_token: str
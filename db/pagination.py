@@ -0,0 +1,63 @@
+"""Keyset pagination
+
+The pages are sorted by _id and the cursor of the next page is an opaque token
+with the last _id of the page, so a page is read with the _id index without
+skipping the documents of the previous pages.
+"""
+
+import base64
+import binascii
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """The cursor is not a token of encode_cursor"""
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """Opaque token with the last Id of a page"""
+    return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Get the last Id of the previous page from the token"""
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, InvalidId, TypeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def page_filters(filters: dict, cursor: str | None) -> dict:
+    """Filters for the documents after the cursor (keyset pagination on _id)"""
+    if cursor is None:
+        return filters
+
+    return {**filters, "_id": {"$gt": decode_cursor(cursor)}}
+
+
+async def find_page(collection, filters: dict, projection: dict,
+                    limit: int | None, cursor: str | None) -> tuple[list, str | None]:
+    """Get a page of documents sorted by _id and the cursor of the next page"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    documents = await (collection.find(page_filters(filters, cursor), projection)
+                       .sort("_id", 1)
+                       .limit(limit + 1)
+                       .to_list(None))
+
+    if len(documents) <= limit:
+        return documents, None
+
+    documents = documents[:limit]
+    return documents, encode_cursor(documents[-1]["_id"])
+
+
+def find_documents(collection, filters: dict, projection: dict, limit: int | None, cursor: str | None):
+    """Database cursor of the documents after the cursor sorted by _id,
+       without a limit it has all of them"""
+    found = collection.find(page_filters(filters, cursor), projection).sort("_id", 1)
+    if limit:
+        found = found.limit(limit)
+    return found
@@ -0,0 +1,126 @@
+"""Repository interfaces
+
+The routers and the helpers read and write the users and the assets through
+these interfaces, so the storage can be MongoDB or the in-memory backend. Every
+backend has the same semantics: ObjectId ids, unique usernames and emails,
+unique mnemonics by user (DuplicateKeyError like MongoDB), the assets scoped by
+user and keyset pagination sorted by id.
+"""
+
+from abc import ABC, abstractmethod
+from bson import ObjectId
+
+# The mnemonic used to group the assets outside the top N of the portfolio
+OTHER_MNEMONIC = "OTHER"
+
+
+class UserRepository(ABC):
+    """Class representing the storage of the users"""
+
+    @abstractmethod
+    async def find_page(self, limit: int | None, cursor: str | None,
+                        projection: dict | None = None) -> tuple[list, str | None]:
+        """Get a page of users (id, username and email, or the id and the fields of the
+           projection) and the cursor of the next page"""
+
+    @abstractmethod
+    def stream(self, limit: int | None, cursor: str | None, projection: dict | None = None):
+        """Iterate the users (id, username and email, or the id and the fields of the
+           projection) after the cursor asynchronously"""
+
+    @abstractmethod
+    async def find_one(self, field: str, value) -> dict | None:
+        """Get the user with the value in the field (_id, username or email)"""
+
+    @abstractmethod
+    async def insert(self, user: dict) -> ObjectId:
+        """Save a new user and return its id"""
+
+    @abstractmethod
+    async def update(self, user_id: ObjectId, fields: dict) -> int:
+        """Set the fields of the user, it returns the number of modified users"""
+
+    @abstractmethod
+    async def delete(self, user_id: ObjectId) -> dict | None:
+        """Delete the user and return it"""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete all the users"""
+
+
+class AssetRepository(ABC):
+    """Class representing the storage of the assets"""
+
+    @abstractmethod
+    async def find_page(self, user_id: str, limit: int | None, cursor: str | None,
+                        projection: dict | None = None) -> tuple[list, str | None]:
+        """Get a page of assets of the user (only the id and the fields of the projection
+           with it) and the cursor of the next page"""
+
+    @abstractmethod
+    def stream(self, user_id: str, limit: int | None, cursor: str | None, projection: dict | None = None):
+        """Iterate the assets of the user (only the id and the fields of the projection
+           with it) after the cursor asynchronously"""
+
+    @abstractmethod
+    async def find_one(self, user_id: str, field: str, value) -> dict | None:
+        """Get the asset of the user with the value in the field"""
+
+    @abstractmethod
+    async def find_by_users(self, user_id: str | None = None) -> list:
+        """Get the mnemonic, price, shares and user of the assets of a user (all the users without it)"""
+
+    @abstractmethod
+    async def insert(self, asset: dict) -> ObjectId:
+        """Save a new asset and return its id"""
+
+    @abstractmethod
+    async def update(self, user_id: str, asset_id: ObjectId, fields: dict) -> dict | None:
+        """Set the fields of the asset of the user, it returns the asset before the change"""
+
+    @abstractmethod
+    async def trade(self, user_id: str, asset_id: ObjectId, shares: int, price: float) -> dict | None:
+        """Add the shares to the asset of the user atomically (negative to sell), a buy sets
+           the avg_price to the average paid for the old shares and the new ones at the price
+           (the price is the market price and doesn't change). It returns
+           the asset after the change, None if it doesn't exist or there are not enough shares"""
+
+    @abstractmethod
+    async def delete(self, user_id: str, asset_id: ObjectId) -> dict | None:
+        """Delete the asset of the user and return it"""
+
+    @abstractmethod
+    async def write_many(self, user_id: str, assets: list, upsert: bool) -> list:
+        """Save many assets of the user without stopping on errors. For each asset it returns
+           (status, error) with status inserted, updated, duplicated or failed"""
+
+    @abstractmethod
+    async def set_prices(self, prices: dict, fields: dict) -> tuple[int, int]:
+        """Set the price of each mnemonic and the extra fields in the assets of every user,
+           it returns the number of matched and modified assets"""
+
+    @abstractmethod
+    async def holders(self, mnemonics: list) -> list:
+        """Ids of the users with assets of the mnemonics"""
+
+    @abstractmethod
+    def summaries(self, user_ids: list | None = None):
+        """Iterate asynchronously the money and the count by mnemonic of each user
+           (all of them without user_ids), as {"_id": user_id, "total": 0.0,
+           "items": [{"mnemonic": "AAA", "value": 0.0, "count": 1}]}"""
+
+    @abstractmethod
+    def rollups(self, mnemonics: list | None = None):
+        """Iterate asynchronously the shares, the money and the number of holders of each
+           mnemonic across the users (all of them without mnemonics), as
+           {"_id": mnemonic, "shares": 0.0, "value": 0.0, "users": 1}"""
+
+    @abstractmethod
+    async def portfolio(self, user_id: str, top: int | None = None, sort: str | None = None) -> list:
+        """Percentage of the portfolio of the user for each asset, with top the N biggest
+           assets and the rest grouped as OTHER, sorted by percentage or mnemonic"""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete all the assets"""
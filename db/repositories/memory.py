@@ -0,0 +1,307 @@
+"""In-memory repositories
+
+They keep the documents in dicts indexed like the MongoDB collections, so the
+API, the tests and the benchmarks can run without any database server. The data
+is lost when the process stops.
+"""
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from db.repositories.base import UserRepository, AssetRepository, OTHER_MNEMONIC
+from db.schemas.asset import ASSET_PROJECTION
+from db.schemas.user import USER_PROJECTION
+from db.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def project(document: dict, projection: dict) -> dict:
+    """Copy of the document with the _id and the fields of the projection"""
+    return {"_id": document["_id"], **{field: document[field] for field in projection if field in document}}
+
+
+def duplicate_key_error(collection: str, key: dict) -> DuplicateKeyError:
+    """The same error MongoDB returns when a unique index rejects a write"""
+    values = ", ".join(f"{field}: {value!r}" for field, value in key.items())
+    return DuplicateKeyError(f"E11000 duplicate key error collection: asset_map.{collection} dup key: {{ {values} }}",
+                             DUPLICATE_KEY_ERROR, {"keyPattern": {field: 1 for field in key}, "keyValue": key})
+
+
+def documents_after(documents: dict, cursor: str | None) -> list:
+    """The documents sorted by id after the cursor"""
+    ids = sorted(documents)
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        ids = [document_id for document_id in ids if document_id > last_id]
+    return [documents[document_id] for document_id in ids]
+
+
+def page(documents: dict, projection: dict, limit: int | None, cursor: str | None) -> tuple[list, str | None]:
+    """A page of documents sorted by id and the cursor of the next page"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    found = documents_after(documents, cursor)
+
+    items = [project(document, projection) for document in found[:limit]]
+    next_cursor = encode_cursor(items[-1]["_id"]) if len(found) > limit else None
+    return items, next_cursor
+
+
+def stream(documents: dict, projection: dict, limit: int | None, cursor: str | None):
+    """Iterate the documents after the cursor, the cursor is checked before the first one"""
+    found = documents_after(documents, cursor)
+    if limit:
+        found = found[:limit]
+
+    async def iterate():
+        for document in found:
+            yield project(document, projection)
+
+    return iterate()
+
+
+class MemoryUserRepository(UserRepository):
+    """Class storing the users in memory with unique usernames and emails"""
+
+    # Checked in the same order as the unique indexes of the collection
+    UNIQUE_FIELDS = ("email", "username")
+
+    def __init__(self):
+        self._users: dict[ObjectId, dict] = {}
+        self._unique: dict[str, dict] = {field: {} for field in self.UNIQUE_FIELDS}
+
+    def _check_unique(self, user: dict, user_id: ObjectId | None = None):
+        """Raise DuplicateKeyError if another user has the username or the email"""
+        for field in self.UNIQUE_FIELDS:
+            owner = self._unique[field].get(user.get(field))
+            if field in user and owner is not None and owner != user_id:
+                raise duplicate_key_error("users", {field: user[field]})
+
+    def _index(self, user: dict, add: bool):
+        """Add or remove the user of the unique indexes"""
+        for field in self.UNIQUE_FIELDS:
+            if field in user:
+                if add:
+                    self._unique[field][user[field]] = user["_id"]
+                else:
+                    self._unique[field].pop(user[field], None)
+
+    async def find_page(self, limit, cursor, projection=None):
+        return page(self._users, projection or USER_PROJECTION, limit, cursor)
+
+    def stream(self, limit, cursor, projection=None):
+        return stream(self._users, projection or USER_PROJECTION, limit, cursor)
+
+    async def find_one(self, field, value):
+        if field == "_id":
+            user = self._users.get(value)
+        elif field in self._unique:
+            user = self._users.get(self._unique[field].get(value))
+        else:
+            user = next((user for user in self._users.values() if user.get(field) == value), None)
+        return dict(user) if user else None
+
+    async def insert(self, user):
+        self._check_unique(user)
+        user.setdefault("_id", ObjectId())
+        self._users[user["_id"]] = dict(user)
+        self._index(user, add=True)
+        return user["_id"]
+
+    async def update(self, user_id, fields):
+        user = self._users.get(user_id)
+        if user is None:
+            return 0
+
+        self._check_unique(fields, user_id)
+        if all(user.get(field) == value for field, value in fields.items()):
+            return 0
+
+        self._index(user, add=False)
+        user.update(fields)
+        self._index(user, add=True)
+        return 1
+
+    async def delete(self, user_id):
+        user = self._users.pop(user_id, None)
+        if user:
+            self._index(user, add=False)
+        return user
+
+    async def clear(self):
+        self.__init__()
+
+
+class MemoryAssetRepository(AssetRepository):
+    """Class storing the assets in memory, indexed by user and by mnemonic"""
+
+    def __init__(self):
+        self._by_user: dict[str, dict[ObjectId, dict]] = {}
+        self._by_key: dict[tuple, ObjectId] = {}
+        self._by_mnemonic: dict[str, dict[ObjectId, dict]] = {}
+
+    def _add(self, asset: dict):
+        """Save the asset in the indexes"""
+        self._by_user.setdefault(asset["user_id"], {})[asset["_id"]] = asset
+        self._by_key[(asset["user_id"], asset["mnemonic"])] = asset["_id"]
+        self._by_mnemonic.setdefault(asset["mnemonic"], {})[asset["_id"]] = asset
+
+    def _remove(self, asset: dict):
+        """Remove the asset from the indexes"""
+        del self._by_user[asset["user_id"]][asset["_id"]]
+        del self._by_key[(asset["user_id"], asset["mnemonic"])]
+        del self._by_mnemonic[asset["mnemonic"]][asset["_id"]]
+
+    def _user_assets(self, user_id: str) -> dict:
+        """Assets of the user by id"""
+        return self._by_user.get(user_id, {})
+
+    async def find_page(self, user_id, limit, cursor, projection=None):
+        return page(self._user_assets(user_id), projection or ASSET_PROJECTION, limit, cursor)
+
+    def stream(self, user_id, limit, cursor, projection=None):
+        return stream(self._user_assets(user_id), projection or ASSET_PROJECTION, limit, cursor)
+
+    async def find_one(self, user_id, field, value):
+        assets = self._user_assets(user_id)
+        if field == "_id":
+            asset = assets.get(value)
+        else:
+            asset = next((asset for asset in assets.values() if asset.get(field) == value), None)
+        return project(asset, ASSET_PROJECTION) if asset else None
+
+    async def find_by_users(self, user_id=None):
+        users = [self._user_assets(user_id)] if user_id else self._by_user.values()
+        return [{field: asset[field] for field in ("user_id", "mnemonic", "price", "shares")}
+                for assets in users for asset in assets.values()]
+
+    async def insert(self, asset):
+        key = (asset["user_id"], asset["mnemonic"])
+        if key in self._by_key:
+            raise duplicate_key_error("assets", {"user_id": key[0], "mnemonic": key[1]})
+
+        asset.setdefault("_id", ObjectId())
+        self._add(dict(asset))
+        return asset["_id"]
+
+    async def update(self, user_id, asset_id, fields):
+        asset = self._user_assets(user_id).get(asset_id)
+        if asset is None:
+            return None
+
+        mnemonic = fields.get("mnemonic", asset["mnemonic"])
+        if self._by_key.get((user_id, mnemonic), asset_id) != asset_id:
+            raise duplicate_key_error("assets", {"user_id": user_id, "mnemonic": mnemonic})
+
+        before = dict(asset)
+        self._remove(asset)
+        asset.update(fields)
+        self._add(asset)
+        return before
+
+    async def trade(self, user_id, asset_id, shares, price):
+        asset = self._user_assets(user_id).get(asset_id)
+        if asset is None or asset["shares"] + shares < 0:
+            return None
+
+        if shares > 0:
+            paid = asset.get("avg_price", asset["price"]) * asset["shares"]
+            asset["avg_price"] = (paid + price * shares) / (asset["shares"] + shares)
+        asset["shares"] += shares
+        return project(asset, ASSET_PROJECTION)
+
+    async def delete(self, user_id, asset_id):
+        asset = self._user_assets(user_id).get(asset_id)
+        if asset is not None:
+            self._remove(asset)
+        return asset
+
+    async def write_many(self, user_id, assets, upsert):
+        statuses = []
+        for asset in assets:
+            asset_id = self._by_key.get((user_id, asset["mnemonic"]))
+            if asset_id is None:
+                await self.insert({**asset, "user_id": user_id})
+                statuses.append(("inserted", None))
+            elif upsert:
+                await self.update(user_id, asset_id, {"price": asset["price"], "shares": asset["shares"]})
+                statuses.append(("updated", None))
+            else:
+                error = duplicate_key_error("assets", {"user_id": user_id, "mnemonic": asset["mnemonic"]})
+                statuses.append(("duplicated", str(error)))
+        return statuses
+
+    async def set_prices(self, prices, fields):
+        matched = modified = 0
+        for mnemonic, price in prices.items():
+            for asset in self._by_mnemonic.get(mnemonic, {}).values():
+                changes = {"price": price, **fields}
+                matched += 1
+                if any(asset.get(field) != value for field, value in changes.items()):
+                    asset.update(changes)
+                    modified += 1
+        return matched, modified
+
+    async def holders(self, mnemonics):
+        return list({asset["user_id"] for mnemonic in mnemonics
+                     for asset in self._by_mnemonic.get(mnemonic, {}).values()})
+
+    def summaries(self, user_ids=None):
+        users = self._by_user.keys() if user_ids is None else user_ids
+        groups = []
+
+        for user_id in users:
+            assets = self._user_assets(user_id)
+            if not assets:
+                continue
+            items = {}
+            for asset in assets.values():
+                item = items.setdefault(asset["mnemonic"], {"mnemonic": asset["mnemonic"], "value": 0, "count": 0})
+                item["value"] += asset["shares"] * asset["price"]
+                item["count"] += 1
+            groups.append({"_id": user_id, "total": sum(item["value"] for item in items.values()),
+                           "items": list(items.values())})
+
+        async def iterate():
+            for group in groups:
+                yield group
+
+        return iterate()
+
+    def rollups(self, mnemonics=None):
+        names = list(self._by_mnemonic) if mnemonics is None else mnemonics
+        groups = [{"_id": mnemonic,
+                   "shares": sum(asset["shares"] for asset in assets.values()),
+                   "value": sum(asset["shares"] * asset["price"] for asset in assets.values()),
+                   "users": len(assets)}
+                  for mnemonic in names if (assets := self._by_mnemonic.get(mnemonic))]
+
+        async def iterate():
+            for group in groups:
+                yield group
+
+        return iterate()
+
+    async def portfolio(self, user_id, top=None, sort=None):
+        values = [(asset["mnemonic"], asset["shares"] * asset["price"])
+                  for asset in self._user_assets(user_id).values()]
+        total = sum(value for _, value in values)
+        items = [{"mnemonic": mnemonic, "percentage": (value / total * 100) if total else 0}
+                 for mnemonic, value in values]
+
+        sort_keys = {"percentage": lambda item: (-item["percentage"], item["mnemonic"]),
+                     "mnemonic": lambda item: item["mnemonic"]}
+
+        if top is None:
+            return sorted(items, key=sort_keys[sort]) if sort else items
+
+        items.sort(key=sort_keys["percentage"])
+        top_items, other_items = items[:top], items[top:]
+        if sort:
+            top_items.sort(key=sort_keys[sort])
+        if other_items:
+            top_items.append({"mnemonic": OTHER_MNEMONIC,
+                              "percentage": sum(item["percentage"] for item in other_items)})
+        return top_items
+
+    async def clear(self):
+        self.__init__()
@@ -0,0 +1,218 @@
+"""MongoDB repositories"""
+
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from db.client import db_client
+from db.repositories.base import UserRepository, AssetRepository, OTHER_MNEMONIC
+from db.schemas.asset import ASSET_PROJECTION
+from db.schemas.user import USER_PROJECTION
+from db.pagination import find_documents, find_page
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Fields of the assets used by the analytics and the batch jobs
+HOLDINGS_PROJECTION = {"_id": 0, "user_id": 1, "mnemonic": 1, "price": 1, "shares": 1}
+
+# Supported sorting for the portfolio items
+PORTFOLIO_SORTS = {"percentage": {"percentage": -1, "mnemonic": 1},
+                   "mnemonic": {"mnemonic": 1}}
+
+
+def portfolio_pipeline(user_id: str, top: int | None = None, sort: str | None = None) -> list:
+    """Aggregation pipeline that calculates the percentage of the portfolio for each asset"""
+    value = {"$multiply": ["$shares", "$price"]}
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        # Total money in the portfolio and the money by asset
+        {"$group": {"_id": None,
+                    "total": {"$sum": value},
+                    "items": {"$push": {"mnemonic": "$mnemonic", "value": value}}}},
+        {"$unwind": "$items"},
+        # If the total is zero every asset is 0% instead of dividing by zero
+        {"$project": {"_id": 0,
+                      "mnemonic": "$items.mnemonic",
+                      "percentage": {"$cond": [{"$eq": ["$total", 0]},
+                                               0,
+                                               {"$multiply": [{"$divide": ["$items.value", "$total"]}, 100]}]}}}]
+
+    if top is None:
+        if sort:
+            pipeline.append({"$sort": PORTFOLIO_SORTS[sort]})
+        return pipeline
+
+    # The N biggest assets and one "other" item with the rest
+    top_items = [{"$sort": PORTFOLIO_SORTS["percentage"]}, {"$limit": top}]
+    if sort:
+        top_items.append({"$sort": PORTFOLIO_SORTS[sort]})
+
+    pipeline.append({"$facet": {
+        "top": top_items,
+        "other": [{"$sort": PORTFOLIO_SORTS["percentage"]},
+                  {"$skip": top},
+                  {"$group": {"_id": None, "percentage": {"$sum": "$percentage"}, "count": {"$sum": 1}}},
+                  {"$match": {"count": {"$gt": 0}}},
+                  {"$project": {"_id": 0, "mnemonic": {"$literal": OTHER_MNEMONIC}, "percentage": 1}}]}})
+    return pipeline
+
+
+def summaries_pipeline(match: dict | None = None) -> list:
+    """Aggregation pipeline that calculates the summaries from the assets collection"""
+    value = {"$multiply": ["$shares", "$price"]}
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$group": {"_id": {"user_id": "$user_id", "mnemonic": "$mnemonic"},
+                    "value": {"$sum": value},
+                    "count": {"$sum": 1}}},
+        {"$group": {"_id": "$_id.user_id",
+                    "total": {"$sum": "$value"},
+                    "items": {"$push": {"mnemonic": "$_id.mnemonic",
+                                        "value": "$value",
+                                        "count": "$count"}}}}]
+    return pipeline
+
+
+def rollups_pipeline(match: dict | None = None) -> list:
+    """Aggregation pipeline that sums the holdings of every user by mnemonic"""
+    pipeline = [{"$match": match}] if match else []
+    # A user has one asset by mnemonic, so each asset is one holder
+    pipeline.append({"$group": {"_id": "$mnemonic",
+                                "shares": {"$sum": "$shares"},
+                                "value": {"$sum": {"$multiply": ["$shares", "$price"]}},
+                                "users": {"$sum": 1}}})
+    return pipeline
+
+
+class MongoUserRepository(UserRepository):
+    """Class storing the users in the users collection"""
+
+    async def find_page(self, limit, cursor, projection=None):
+        return await find_page(db_client.users, {}, projection or USER_PROJECTION, limit, cursor)
+
+    def stream(self, limit, cursor, projection=None):
+        return find_documents(db_client.users, {}, projection or USER_PROJECTION, limit, cursor)
+
+    async def find_one(self, field, value):
+        return await db_client.users.find_one({field: value})
+
+    async def insert(self, user):
+        return (await db_client.users.insert_one(user)).inserted_id
+
+    async def update(self, user_id, fields):
+        return (await db_client.users.update_one({"_id": user_id}, {"$set": fields})).modified_count
+
+    async def delete(self, user_id):
+        return await db_client.users.find_one_and_delete({"_id": user_id})
+
+    async def clear(self):
+        await db_client.users.delete_many({})
+
+
+class MongoAssetRepository(AssetRepository):
+    """Class storing the assets in the assets collection"""
+
+    async def find_page(self, user_id, limit, cursor, projection=None):
+        return await find_page(db_client.assets, {"user_id": user_id}, projection or ASSET_PROJECTION,
+                               limit, cursor)
+
+    def stream(self, user_id, limit, cursor, projection=None):
+        return find_documents(db_client.assets, {"user_id": user_id}, projection or ASSET_PROJECTION,
+                              limit, cursor)
+
+    async def find_one(self, user_id, field, value):
+        return await db_client.assets.find_one({field: value, "user_id": user_id}, ASSET_PROJECTION)
+
+    async def find_by_users(self, user_id=None):
+        filters = {"user_id": user_id} if user_id else {}
+        return await db_client.assets.find(filters, HOLDINGS_PROJECTION).to_list(None)
+
+    async def insert(self, asset):
+        return (await db_client.assets.insert_one(asset)).inserted_id
+
+    async def update(self, user_id, asset_id, fields):
+        return await db_client.assets.find_one_and_update({"_id": asset_id, "user_id": user_id},
+                                                          {"$set": fields},
+                                                          return_document=ReturnDocument.BEFORE)
+
+    async def trade(self, user_id, asset_id, shares, price):
+        filters = {"_id": asset_id, "user_id": user_id}
+        if shares < 0:
+            # The filter rejects selling more shares than the asset has
+            return await db_client.assets.find_one_and_update({**filters, "shares": {"$gte": -shares}},
+                                                              {"$inc": {"shares": shares}},
+                                                              projection=ASSET_PROJECTION,
+                                                              return_document=ReturnDocument.AFTER)
+
+        # Both fields are calculated from the values before the update, the shares
+        # bought before the first trade were paid at the price the asset was saved with
+        paid = {"$multiply": [{"$ifNull": ["$avg_price", "$price"]}, "$shares"]}
+        update = [{"$set": {"avg_price": {"$divide": [{"$add": [paid, price * shares]}, {"$add": ["$shares", shares]}]},
+                            "shares": {"$add": ["$shares", shares]}}}]
+        return await db_client.assets.find_one_and_update(filters, update, projection=ASSET_PROJECTION,
+                                                          return_document=ReturnDocument.AFTER)
+
+    async def delete(self, user_id, asset_id):
+        return await db_client.assets.find_one_and_delete({"_id": asset_id, "user_id": user_id})
+
+    async def write_many(self, user_id, assets, upsert):
+        # A single unordered bulk operation, so one error doesn't stop the rest
+        if upsert:
+            operations = [UpdateOne({"user_id": user_id, "mnemonic": asset["mnemonic"]},
+                                    {"$set": {"price": asset["price"], "shares": asset["shares"]}},
+                                    upsert=True)
+                          for asset in assets]
+            try:
+                result = (await db_client.assets.bulk_write(operations, ordered=False)).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+        else:
+            documents = [{**asset, "user_id": user_id} for asset in assets]
+            try:
+                await db_client.assets.insert_many(documents, ordered=False)
+                result = {"writeErrors": []}
+            except BulkWriteError as e:
+                result = e.details
+
+        upserted = {item["index"] for item in result.get("upserted", [])}
+        errors = {error["index"]: error for error in result["writeErrors"]}
+        statuses = []
+
+        for index in range(len(assets)):
+            if index in errors:
+                duplicated = errors[index]["code"] == DUPLICATE_KEY_ERROR
+                statuses.append(("duplicated" if duplicated else "failed", errors[index].get("errmsg")))
+            elif upsert and index not in upserted:
+                statuses.append(("updated", None))
+            else:
+                statuses.append(("inserted", None))
+        return statuses
+
+    async def set_prices(self, prices, fields):
+        result = await db_client.assets.bulk_write(
+            [UpdateMany({"mnemonic": mnemonic}, {"$set": {"price": price, **fields}})
+             for mnemonic, price in prices.items()],
+            ordered=False)
+        return result.matched_count, result.modified_count
+
+    async def holders(self, mnemonics):
+        if not mnemonics:
+            return []
+        return await db_client.assets.distinct("user_id", {"mnemonic": {"$in": mnemonics}})
+
+    def summaries(self, user_ids=None):
+        match = {"user_id": {"$in": user_ids}} if user_ids is not None else None
+        return db_client.assets.aggregate(summaries_pipeline(match))
+
+    def rollups(self, mnemonics=None):
+        match = {"mnemonic": {"$in": mnemonics}} if mnemonics is not None else None
+        return db_client.assets.aggregate(rollups_pipeline(match))
+
+    async def portfolio(self, user_id, top=None, sort=None):
+        result = await db_client.assets.aggregate(portfolio_pipeline(user_id, top, sort)).to_list(None)
+
+        if top is not None:
+            result = (result[0]["top"] + result[0]["other"]) if result else []
+
+        return result
+
+    async def clear(self):
+        await db_client.assets.delete_many({})
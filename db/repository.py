@@ -0,0 +1,24 @@
+"""Repositories of the users and the assets"""
+
+import os
+from db.repositories.base import UserRepository, AssetRepository
+from db.repositories.memory import MemoryUserRepository, MemoryAssetRepository
+from db.repositories.mongo import MongoUserRepository, MongoAssetRepository
+
+# Where the users and the assets are stored: mongo (default) or memory
+repository_backend = os.getenv("REPOSITORY_BACKEND", "mongo")
+
+BACKENDS = {"mongo": (MongoUserRepository, MongoAssetRepository),
+            "memory": (MemoryUserRepository, MemoryAssetRepository)}
+
+
+def create_repositories(backend: str) -> tuple[UserRepository, AssetRepository]:
+    """Create the repositories of the backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown repository backend: {backend}")
+
+    users, assets = BACKENDS[backend]
+    return users(), assets()
+
+
+users_repository, assets_repository = create_repositories(repository_backend)
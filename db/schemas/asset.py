@@ -1,11 +1,19 @@
 """Asset schema"""
 
+# Fields read from the database for asset_schema
+ASSET_PROJECTION = {"user_id": 1, "mnemonic": 1, "price": 1, "shares": 1, "avg_price": 1}
+
+# Fields of asset_schema, the clients can ask for some of them with fields=
+ASSET_FIELDS = ("id", "user_id", "mnemonic", "price", "shares", "avg_price")
+
+
 def asset_schema(asset) -> dict:
     return {"id": str(asset["_id"]),
             "user_id": asset["user_id"],
             "mnemonic": asset["mnemonic"],
             "price": asset["price"],
-            "shares": asset["shares"]}
+            "shares": asset["shares"],
+            "avg_price": asset.get("avg_price")}
 
 
 def assets_schema(assets) -> list:
@@ -0,0 +1,13 @@
+"""Rollup schema"""
+
+
+def rollup_schema(rollup) -> dict:
+    return {"mnemonic": rollup["_id"],
+            "shares": rollup["shares"],
+            "value": rollup["value"],
+            "users": rollup["users"],
+            "updated_at": rollup["updated_at"]}
+
+
+def rollups_schema(rollups) -> list:
+    return [rollup_schema(rollup) for rollup in rollups]
@@ -1,5 +1,12 @@
 """User schema"""
 
+# Fields read from the database for user_schema
+USER_PROJECTION = {"username": 1, "email": 1}
+
+# Fields of user_schema, the clients can ask for some of them with fields=
+USER_FIELDS = ("id", "username", "email")
+
+
 def user_schema(user) -> dict:
     return {"id": str(user["_id"]),
             "username": user["username"],
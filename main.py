@@ -9,10 +9,59 @@ Some important notes:
 - Redocly doc: http://127.0.0.1:8000/redoc
 """
 
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Response, status
+from fastapi.responses import PlainTextResponse
+from db.client import db_client, database_ready, ping
+from db.indexes import create_indexes, missing_unique_indexes
 from routers import users, assets
+from routers.helpers.password_helper import password_pool, measure_verify_time
+from routers.helpers.metrics_helper import MetricsMiddleware, render_metrics, PROMETHEUS_MEDIA_TYPE
+from routers.helpers.compression_helper import CompressionMiddleware
+from routers.helpers.history_helper import create_history_collection, snapshot_loop, snapshot_interval
+from routers.helpers.rollups_helper import rollup_loop, rollup_interval
+from routers.helpers.denylist_helper import load_revocations, revocations_loop
+from routers.helpers.portfolio_helper import versions_loop
+from routers.helpers.events_helper import events_ping_seconds
+from routers.helpers.users_helper import token_lifetime
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Connect to the database, create the indexes, load the token revocations, measure
+       the time to verify a password and start the background jobs when the server
+       starts, and stop them when it stops"""
+    db_client.connect()
+    if not await ping():
+        raise RuntimeError("The database is not reachable, check MONGO_URI")
+    await create_indexes()
+    # The users and the assets are inserted without checking for duplicates first
+    missing = await missing_unique_indexes()
+    if missing:
+        raise RuntimeError(f"Missing unique indexes: {', '.join(missing)}, "
+                           "remove the duplicates found by python3 -m cli indexes and restart")
+    await create_history_collection()
+    await load_revocations()
+    await measure_verify_time()
+    snapshots = asyncio.create_task(snapshot_loop(snapshot_interval)) if snapshot_interval > 0 else None
+    rollups = asyncio.create_task(rollup_loop(rollup_interval)) if rollup_interval > 0 else None
+    revocations = asyncio.create_task(revocations_loop(token_lifetime()))
+    versions = asyncio.create_task(versions_loop(events_ping_seconds))
+    yield
+    for task in (snapshots, rollups, revocations, versions):
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    password_pool.shutdown()
+    db_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+# The last middleware added runs first, so the latency includes the compression
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(users.router)
 app.include_router(assets.router)
 
@@ -21,3 +70,25 @@ async def root():
     """The root of the API"""
 
     return {"message": "Hi AssetMap 2024!"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics of the requests, the database commands and the passwords for Prometheus"""
+
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    """The process is running and the event loop answers"""
+
+    return {"status": "alive"}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness(response: Response):
+    """The database answers, so the API can receive traffic"""
+
+    if not await database_ready():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable"}
+
+    return {"status": "ready"}
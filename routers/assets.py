@@ -1,16 +1,33 @@
 """Assets module"""
 
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
-from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Literal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation, DuplicateKeyError
 from bson import ObjectId
 from db.models.user import User
-from db.models.asset import Asset, NewAsset, PortfolioItem
-from db.schemas.asset import asset_schema, assets_schema
-from db.client import db_client
-from routers.helpers.users_helper import get_current_user
-from routers.helpers.assets_helper import search_asset
-from routers.helpers.helper import check_id
+from db.models.asset import Asset, NewAsset, Trade, PortfolioItem, BulkImportReport, HistoryPoint
+from db.models.price import PriceQuote, PriceUpdate
+from db.models.analytics import PortfolioAnalytics, TargetAllocation, RebalanceTrade
+from db.models.rollup import HoldingRollup, RollupDrift
+from db.schemas.asset import asset_schema, ASSET_FIELDS
+from db.schemas.rollup import rollup_schema, rollups_schema
+from db.repository import assets_repository
+from routers.helpers.users_helper import get_current_user, get_admin_user
+from routers.helpers.assets_helper import duplicated_asset_exception, asset_before_trade
+from routers.helpers.portfolio_helper import apply_asset_change, get_portfolio, rebuild_summaries, portfolio_stream
+from routers.helpers.portfolio_helper import find_summary
+from routers.helpers.events_helper import EVENT_STREAM_MEDIA_TYPE
+from routers.helpers.bulk_helper import import_assets, MEDIA_TYPES
+from routers.helpers.prices_helper import apply_prices
+from routers.helpers.rollups_helper import apply_rollup_change, refresh_rollups, reconcile_rollups
+from routers.helpers.rollups_helper import find_rollups, find_rollup
+from routers.helpers.history_helper import get_history
+from routers.helpers.cache_helper import data_version, summary_version, versioned_response
+from routers.helpers.analytics_helper import analyze, rebalance, check_targets, load_holdings, market_prices
+from routers.helpers.helper import check_cursor, check_id, json_response, ndjson_response, wants_ndjson, MAX_PAGE_SIZE
+from routers.helpers.helper import sparse_fields
 
 router = APIRouter(prefix="/asset",
                    tags=["asset"],
@@ -18,47 +35,166 @@ router = APIRouter(prefix="/asset",
 
 
 @router.get("/", response_model=list[Asset])
-async def assets(user: Annotated[User, Depends(get_current_user)],):
-    """Get all assets for the user in session from the database"""
-    return assets_schema(db_client.assets.find({"user_id": user.id}))
+async def assets(user: Annotated[User, Depends(get_current_user)],
+                 request: Request,
+                 limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+                 cursor: str | None = None,
+                 fields: Annotated[str | None, Query(description=f"Some of: {', '.join(ASSET_FIELDS)}")] = None,
+                 accept: Annotated[str | None, Header()] = None):
+    """Get a page of assets for the user in session from the database, the cursor
+       of the next page is in the X-Next-Cursor header. With the header
+       Accept: application/x-ndjson all the assets are streamed one per line.
+       With fields=mnemonic,shares only those fields are read and returned.
+       The response has an ETag and with If-None-Match it can be a 304"""
+    check_cursor(cursor)
+    projection, schema = sparse_fields(fields, ASSET_FIELDS, asset_schema)
+
+    if wants_ndjson(accept):
+        return ndjson_response(assets_repository.stream(user.id, limit, cursor, projection), schema)
+
+    async def build():
+        page, next_cursor = await assets_repository.find_page(user.id, limit, cursor, projection)
+        return [schema(asset) for asset in page], {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    return await versioned_response(request, user.id, await data_version(user.id), build)
 
 
 @router.get("/portfolio", response_model=list[PortfolioItem])
-async def portfolio(user: Annotated[User, Depends(get_current_user)],):
-    """Calculate the percentage of your portfolio for each asset"""
-    assets_db = assets_schema(db_client.assets.find({"user_id": user.id}))
-    # Total money in my portfolio
-    total = sum(asset['shares']*asset['price'] for asset in assets_db)
-    # Calculating the percentage by asset
-    portfolio_items = []
-    for asset in assets_db:
-        portfolio_item = PortfolioItem()
-        portfolio_item.mnemonic = asset['mnemonic']
-        portfolio_item.percentage = (asset['shares']*asset['price']*100)/total
-        portfolio_items.append(portfolio_item)
-
-    return portfolio_items
+async def portfolio(user: Annotated[User, Depends(get_current_user)],
+                    request: Request,
+                    top: Annotated[int | None, Query(ge=1)] = None,
+                    sort: Literal["percentage", "mnemonic"] | None = None):
+    """Calculate the percentage of your portfolio for each asset,
+       with top you get the N biggest assets and the rest grouped as OTHER.
+       The response has an ETag and with If-None-Match it can be a 304"""
+    summary = await find_summary(user.id)
+
+    async def build():
+        return await get_portfolio(user, summary, top, sort), {}
+
+    return await versioned_response(request, user.id, summary_version(summary), build)
+
+
+@router.get("/portfolio/events")
+async def portfolio_events(user: Annotated[User, Depends(get_current_user)]):
+    """Server-Sent Events with your portfolio and then a delta each time your assets
+       or their prices change, instead of polling the portfolio"""
+    return StreamingResponse(portfolio_stream(user.id), media_type=EVENT_STREAM_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/portfolio/history", response_model=list[HistoryPoint])
+async def portfolio_history(user: Annotated[User, Depends(get_current_user)],
+                            start: datetime | None = None,
+                            end: datetime | None = None,
+                            interval: Literal["raw", "day", "week", "month"] = "day",
+                            weights: bool = False):
+    """Value of your portfolio over time (the last year by default), grouped by day,
+       week or month with the last value of each one. With weights=true each point
+       has the percentage of each asset"""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=365)
+
+    return await get_history(user.id, start, end, interval, weights)
+
+
+@router.get("/analytics", response_model=PortfolioAnalytics)
+async def analytics(user: Annotated[User, Depends(get_current_user)],
+                    top: Annotated[int, Query(ge=1)] = 5):
+    """Concentration of your portfolio: Herfindahl-Hirschman index, effective
+       number of assets and percentage in the top N assets"""
+    return analyze(await load_holdings(user.id), top)
+
+
+@router.post("/rebalance", response_model=list[RebalanceTrade])
+async def rebalance_portfolio(targets: list[TargetAllocation],
+                              user: Annotated[User, Depends(get_current_user)]):
+    """Trades needed to reach the target percentages (they should sum 100),
+       the assets without a target are sold"""
+    check_targets(targets)
+    holdings = await load_holdings(user.id)
+    held = set(holdings.mnemonics.tolist())
+    new = [target.mnemonic for target in targets if target.mnemonic not in held]
+
+    return rebalance(holdings, targets, await market_prices(new) if new else {})
 
 
 @router.post("/", response_model=Asset, status_code=status.HTTP_201_CREATED)
 async def save_asset(asset: NewAsset, user: Annotated[User, Depends(get_current_user)],):
     """Saving a new asset in the database if the mnemonic is unique"""
 
-    if isinstance(search_asset("mnemonic", asset.mnemonic, user), Asset):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="The asset exists, please choose another mnemonic.")
-
     asset_dict = dict(asset)
 
     # Adding the user id to the asset dict
     asset_dict["user_id"] = user.id
 
-    inserted_id = db_client.assets.insert_one(asset_dict).inserted_id
+    # The unique index (user_id, mnemonic) rejects the duplicated assets
+    try:
+        inserted_id = await assets_repository.insert(asset_dict)
+    except DuplicateKeyError as e:
+        raise duplicated_asset_exception() from e
+
+    await apply_asset_change(user.id, None, asset_dict)
+    await apply_rollup_change(None, asset_dict)
+
+    # The saved asset is the one sent with its new id, there is no need to read it
+    return json_response(asset_schema({**asset_dict, "_id": inserted_id}), status_code=status.HTTP_201_CREATED)
+
+
+@router.post("/bulk", response_model=BulkImportReport)
+async def save_assets(request: Request, user: Annotated[User, Depends(get_current_user)],
+                      upsert: bool = False):
+    """Saving many assets from a CSV (with mnemonic,price,shares header) or NDJSON body,
+       the rows are written in batches and with upsert the existing assets are updated"""
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"The body should be one of: {', '.join(MEDIA_TYPES)}.")
+
+    report = await import_assets(user.id, request.stream(), media_type, upsert)
+
+    if report.inserted or report.updated:
+        # Forced so the version changes even if only prices or shares were swapped
+        await rebuild_summaries(user.id, force=True)
+        await refresh_rollups(sorted({row.mnemonic for row in report.rows
+                                      if row.status in ("inserted", "updated")}))
+
+    return report
+
+
+@router.post("/prices", response_model=PriceUpdate)
+async def update_prices(quotes: list[PriceQuote], _: Annotated[User, Depends(get_admin_user)]):
+    """Set the market price of the mnemonics in the assets of every user,
+       it's only allowed for admins"""
+    return await apply_prices(quotes)
+
 
-    new_asset = asset_schema(db_client.assets.find_one({"_id": inserted_id}))
+@router.get("/rollups", response_model=list[HoldingRollup])
+async def rollups(_: Annotated[User, Depends(get_admin_user)],
+                  limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+                  sort: Literal["value", "users", "shares"] = "value"):
+    """Get the holdings of every user by mnemonic from the rollups, the biggest
+       first, without reading the assets. It's only allowed for admins"""
+    return json_response(rollups_schema(await find_rollups(sort, limit or MAX_PAGE_SIZE)))
 
-    return Asset(**new_asset)
+
+@router.get("/rollups/{mnemonic}", response_model=HoldingRollup)
+async def rollup(mnemonic: str, _: Annotated[User, Depends(get_admin_user)]):
+    """Get the total shares, money and number of holders of a mnemonic,
+       it's only allowed for admins"""
+    found = await find_rollup(mnemonic)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nobody holds the mnemonic")
+
+    return json_response(rollup_schema(found))
+
+
+@router.post("/rollups/reconcile", response_model=list[RollupDrift])
+async def reconcile(_: Annotated[User, Depends(get_admin_user)], dry_run: bool = False):
+    """Compare the rollups with the assets and fix the drift (only report it with dry_run),
+       it's only allowed for admins"""
+    return await reconcile_rollups(dry_run)
 
 
 @router.put("/", response_model=Asset)
@@ -69,11 +205,12 @@ async def update_user(asset: Asset, user: Annotated[User, Depends(get_current_us
     asset_dict = dict(asset)
     del asset_dict["id"]
     del asset_dict["user_id"]
-
-    filters = {"_id": ObjectId(asset.id), "user_id": user.id}
+    del asset_dict["avg_price"] # Only the trades change it
 
     try:
-        found = db_client.assets.update_one(filters, {"$set": asset_dict})
+        found = await assets_repository.update(user.id, ObjectId(asset.id), asset_dict)
+    except DuplicateKeyError as e:
+        raise duplicated_asset_exception() from e
     except OperationFailure as e:
         return {"error": f"Database operation failed: {e}"}
     except ConnectionFailure as e:
@@ -83,10 +220,37 @@ async def update_user(asset: Asset, user: Annotated[User, Depends(get_current_us
     except PyMongoError as e:
         return {"error": f"Unexpected MongoDB error: {e}"}
 
-    if found.modified_count == 0:
+    if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
 
-    return search_asset("_id", ObjectId(asset.id), user)
+    # The asset before the change with the new fields is the saved one, there is no need to read it
+    updated = {**found, **asset_dict}
+    await apply_asset_change(user.id, found, updated)
+    await apply_rollup_change(found, updated)
+
+    return json_response(asset_schema(updated))
+
+
+@router.post("/{asset_id}/trade", response_model=Asset)
+async def trade_asset(asset_id: str, trade: Trade, user: Annotated[User, Depends(get_current_user)]):
+    """Buy or sell shares of the asset with one atomic write, so concurrent trades
+       don't overwrite each other. A buy sets the avg_price to the average price paid,
+       the price stays the market price"""
+    check_id(asset_id) # Check if an Id is not a valid Id for ObjectId
+
+    shares = trade.shares if trade.side == "buy" else -trade.shares
+    updated = await assets_repository.trade(user.id, ObjectId(asset_id), shares, trade.price)
+
+    if not updated:
+        if not await assets_repository.find_one(user.id, "_id", ObjectId(asset_id)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="There are not enough shares to sell.")
+
+    before = asset_before_trade(updated, trade)
+    await apply_asset_change(user.id, before, updated)
+    await apply_rollup_change(before, updated)
+
+    return json_response(asset_schema(updated))
 
 
 @router.delete("/{asset_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -94,9 +258,11 @@ async def delete_asset(asset_id: str, user: Annotated[User, Depends(get_current_
     """Delete the asset from the database based on the Id"""
     check_id(asset_id) # Check if an Id is not a valid Id for ObjectId
 
-    filters = {"_id": ObjectId(asset_id), "user_id": user.id}
-
-    found = db_client.assets.find_one_and_delete(filters)
+    found = await assets_repository.delete(user.id, ObjectId(asset_id))
 
     if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+
+    await apply_asset_change(user.id, found, None)
+    await apply_rollup_change(found, None)
+
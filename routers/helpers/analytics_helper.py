@@ -0,0 +1,177 @@
+"""Analytics helper
+
+The holdings are loaded as NumPy columns (shares and price) so every metric is
+calculated with array operations instead of a loop by asset.
+"""
+
+import numpy as np
+from fastapi import HTTPException, status
+from pymongo import UpdateOne
+from db.models.analytics import PortfolioAnalytics, TargetAllocation, RebalanceTrade
+from db.client import db_client
+from db.repository import assets_repository
+
+# Analytics written in each bulk operation of the batch mode
+BATCH_SIZE = 1000
+
+
+class Holdings:
+    """Class representing a list of assets as columns"""
+
+    def __init__(self, mnemonics, shares, prices, user_ids=None):
+        self.mnemonics = np.asarray(mnemonics, dtype=object)
+        self.shares = np.asarray(shares, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.user_ids = np.asarray(user_ids, dtype=object) if user_ids is not None else None
+
+    @classmethod
+    def from_documents(cls, documents: list, with_user=False) -> "Holdings":
+        """Build the columns from the asset documents"""
+        return cls([document["mnemonic"] for document in documents],
+                   [document["shares"] for document in documents],
+                   [document["price"] for document in documents],
+                   [document["user_id"] for document in documents] if with_user else None)
+
+    @property
+    def values(self) -> np.ndarray:
+        """Money invested in each asset"""
+        return self.shares * self.prices
+
+
+def portfolio_weights(values: np.ndarray) -> np.ndarray:
+    """Weight of each asset in the portfolio (0 if there is no money)"""
+    total = values.sum()
+    if total == 0:
+        return np.zeros_like(values)
+    return values / total
+
+
+def concentration_index(weights: np.ndarray) -> float:
+    """Herfindahl-Hirschman index, the sum of the squared weights"""
+    return float(np.dot(weights, weights))
+
+
+def top_exposure(weights: np.ndarray, top: int) -> float:
+    """Weight of the N biggest assets"""
+    if top >= weights.size:
+        return float(weights.sum())
+    return float(np.partition(weights, -top)[-top:].sum())
+
+
+def analyze(holdings: Holdings, top: int) -> PortfolioAnalytics:
+    """Calculate the analytics of a portfolio"""
+    values = holdings.values
+    weights = portfolio_weights(values)
+    hhi = concentration_index(weights)
+
+    return PortfolioAnalytics(total=float(values.sum()),
+                              holdings=int(values.size),
+                              concentration_index=hhi,
+                              effective_holdings=(1 / hhi) if hhi else 0.0,
+                              top=top,
+                              top_exposure=top_exposure(weights, top) * 100)
+
+
+def rebalance(holdings: Holdings, targets: list[TargetAllocation], prices: dict) -> list[RebalanceTrade]:
+    """Trades needed to move the portfolio to the target percentages, the assets
+       without a target are sold and the targets not held are bought at the
+       price in `prices` (if there is no price the shares are unknown)"""
+    target_weights = {target.mnemonic: target.percentage / 100 for target in targets}
+    held = set(holdings.mnemonics.tolist())
+    new = [mnemonic for mnemonic in target_weights if mnemonic not in held]
+
+    mnemonics = np.concatenate([holdings.mnemonics, np.asarray(new, dtype=object)])
+    values = np.concatenate([holdings.values, np.zeros(len(new))])
+    unit_prices = np.concatenate([holdings.prices, [prices.get(mnemonic, np.nan) for mnemonic in new]])
+    wanted = np.array([target_weights.get(mnemonic, 0.0) for mnemonic in mnemonics])
+
+    current = portfolio_weights(values)
+    trade_values = wanted * values.sum() - values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trade_shares = np.trunc(trade_values / unit_prices)
+    known = np.isfinite(trade_shares)
+
+    return [RebalanceTrade(mnemonic=mnemonic,
+                           current_percentage=current_weight * 100,
+                           target_percentage=wanted_weight * 100,
+                           value=value,
+                           shares=int(shares) if is_known else None)
+            for mnemonic, current_weight, wanted_weight, value, shares, is_known
+            in zip(mnemonics.tolist(), current.tolist(), wanted.tolist(),
+                   trade_values.tolist(), trade_shares.tolist(), known.tolist())]
+
+
+def check_targets(targets: list[TargetAllocation]):
+    """The targets should be unique and sum 100%"""
+    if len({target.mnemonic for target in targets}) != len(targets):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each mnemonic can have only one target.")
+
+    if not np.isclose(sum(target.percentage for target in targets), 100):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The target percentages should sum 100.")
+
+
+def batch_analyze(holdings: Holdings, top: int) -> dict:
+    """Calculate the analytics of every user in the holdings in one pass,
+       it returns a column by metric and the user_ids column"""
+    users, index = np.unique(holdings.user_ids.astype(str), return_inverse=True)
+    count = users.size
+    values = holdings.values
+
+    totals = np.bincount(index, weights=values, minlength=count)
+    user_totals = totals[index]
+    weights = np.divide(values, user_totals, out=np.zeros_like(values), where=user_totals != 0)
+    hhi = np.bincount(index, weights=weights * weights, minlength=count)
+
+    # Rank of each asset inside the portfolio of its user, by weight
+    order = np.lexsort((-weights, index))
+    sorted_index = index[order]
+    starts = np.searchsorted(sorted_index, np.arange(count))
+    in_top = (np.arange(order.size) - starts[sorted_index]) < top
+    exposure = np.bincount(sorted_index[in_top], weights=weights[order][in_top], minlength=count)
+
+    return {"user_ids": users,
+            "total": totals,
+            "holdings": np.bincount(index, minlength=count),
+            "concentration_index": hhi,
+            "effective_holdings": np.divide(1, hhi, out=np.zeros_like(hhi), where=hhi != 0),
+            "top_exposure": exposure * 100}
+
+
+async def load_holdings(user_id: str) -> Holdings:
+    """Load the assets of the user as columns"""
+    documents = await assets_repository.find_by_users(user_id)
+    return Holdings.from_documents(documents)
+
+
+async def market_prices(mnemonics: list) -> dict:
+    """Last price of the price feed for each mnemonic"""
+    found = db_client.prices.find({"_id": {"$in": mnemonics}}, {"price": 1})
+    return {price["_id"]: price["price"] async for price in found}
+
+
+async def analyze_all_users(top: int) -> int:
+    """Calculate the analytics of every user with a single read of the assets
+       and save them in the analytics collection, it returns the number of users"""
+    documents = await assets_repository.find_by_users()
+    if not documents:
+        return 0
+
+    columns = batch_analyze(Holdings.from_documents(documents, with_user=True), top)
+    operations = [UpdateOne({"_id": user_id},
+                            {"$set": {"total": float(columns["total"][i]),
+                                      "holdings": int(columns["holdings"][i]),
+                                      "concentration_index": float(columns["concentration_index"][i]),
+                                      "effective_holdings": float(columns["effective_holdings"][i]),
+                                      "top": top,
+                                      "top_exposure": float(columns["top_exposure"][i])}},
+                            upsert=True)
+                  for i, user_id in enumerate(columns["user_ids"].tolist())]
+
+    for start in range(0, len(operations), BATCH_SIZE):
+        await db_client.analytics.bulk_write(operations[start:start + BATCH_SIZE], ordered=False)
+
+    return len(operations)
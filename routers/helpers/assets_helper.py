@@ -1,26 +1,29 @@
 """Assets helper"""
 
-from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation
-from db.models.asset import Asset
+from fastapi import HTTPException, status
+from db.models.asset import PortfolioItem, Trade
 from db.models.user import User
-from db.schemas.asset import asset_schema
-from db.client import db_client
-
-
-def search_asset(field: str, key: str, user: User):
-    """Search an asset in the database, it should be from the same user"""
-    try:
-        found = db_client.assets.find_one({field: key, "user_id": user.id})
-
-        if not found:
-            return None
-
-        return Asset(**asset_schema(found))
-    except OperationFailure as e:
-        return {"error": f"Database operation failed: {e}"}
-    except ConnectionFailure as e:
-        return {"error": f"Failed to connect to database: {e}"}
-    except InvalidOperation as e:
-        return {"error": f"Invalid database operation: {e}"}
-    except PyMongoError as e:
-        return {"error": f"Unexpected MongoDB error: {e}"}
+from db.repository import assets_repository
+
+
+async def calculate_portfolio(user: User, top: int | None = None, sort: str | None = None) -> list:
+    """Calculate the portfolio of the user from the assets"""
+    return [PortfolioItem(**item) for item in await assets_repository.portfolio(user.id, top, sort)]
+
+
+def duplicated_asset_exception() -> HTTPException:
+    """The error returned when the user already has an asset with the mnemonic"""
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="The asset exists, please choose another mnemonic.")
+
+
+def asset_before_trade(after: dict, trade: Trade) -> dict:
+    """The asset before the trade, calculated from the asset returned by the trade"""
+    if trade.side == "sell":
+        return {**after, "shares": after["shares"] + trade.shares}
+
+    # The money paid before the buy is the money paid after it without the bought shares
+    shares = after["shares"] - trade.shares
+    avg_price = (after["avg_price"] * after["shares"] - trade.price * trade.shares) / shares if shares else None
+    return {**after, "shares": shares, "avg_price": avg_price}
@@ -0,0 +1,102 @@
+"""Bulk import helper"""
+
+import csv
+import json
+from pydantic import ValidationError
+from db.models.asset import NewAsset, BulkRowResult, BulkImportReport
+from db.repository import assets_repository
+from routers.helpers.helper import NDJSON_MEDIA_TYPE
+
+# Rows written to the database in each bulk operation
+BATCH_SIZE = 1000
+
+# Supported formats of the body
+CSV_MEDIA_TYPE = "text/csv"
+MEDIA_TYPES = (CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE)
+
+
+async def stream_lines(stream):
+    """Split the chunks of the request body in lines"""
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace").rstrip("\r")
+
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def read_rows(stream, media_type: str):
+    """Yield the number and the data of each row in the CSV or NDJSON body,
+       the data is None when the row can't be parsed"""
+    header = None
+    row = 0
+
+    async for line in stream_lines(stream):
+        if not line.strip():
+            continue
+
+        if media_type == CSV_MEDIA_TYPE:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            row += 1
+            yield row, dict(zip(header, values))
+        else:
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError:
+                yield row, None
+
+
+def validation_message(error: ValidationError) -> str:
+    """Short description of the validation errors"""
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}"
+                     for err in error.errors())
+
+
+def validate_row(row: int, data) -> tuple[dict | None, BulkRowResult | None]:
+    """Validate the row against NewAsset, it returns the asset or the error"""
+    if not isinstance(data, dict):
+        return None, BulkRowResult(row=row, status="invalid", error="The row is not valid.")
+
+    try:
+        return dict(NewAsset(**data)), None
+    except ValidationError as e:
+        return None, BulkRowResult(row=row, mnemonic=data.get("mnemonic"), status="invalid",
+                                   error=validation_message(e))
+
+
+async def write_batch(user_id: str, batch: list, upsert: bool, report: BulkImportReport):
+    """Write the (row, asset) pairs with a single unordered bulk operation"""
+    statuses = await assets_repository.write_many(user_id, [asset for _, asset in batch], upsert)
+
+    for (row, asset), (result, error) in zip(batch, statuses):
+        report.add(BulkRowResult(row=row, mnemonic=asset["mnemonic"], status=result, error=error))
+
+
+async def import_assets(user_id: str, stream, media_type: str, upsert: bool) -> BulkImportReport:
+    """Validate the rows of the stream and write them in batches"""
+    report = BulkImportReport()
+    batch = []
+
+    async for row, data in read_rows(stream, media_type):
+        asset, error = validate_row(row, data)
+        if error:
+            report.add(error)
+            continue
+
+        batch.append((row, asset))
+        if len(batch) == BATCH_SIZE:
+            await write_batch(user_id, batch, upsert, report)
+            batch = []
+
+    if batch:
+        await write_batch(user_id, batch, upsert, report)
+
+    report.rows.sort(key=lambda item: item.row)
+    return report
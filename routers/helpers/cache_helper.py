@@ -0,0 +1,125 @@
+"""Response cache helper
+
+Every write of the assets of a user increments the version of their portfolio
+summary, so the version identifies the state of all the asset data of the user.
+The responses built from that data get a strong ETag from the user, the version
+and the url, the clients sending it back in If-None-Match get a 304 without
+querying the assets, and the encoded bodies are kept in a small in-process cache.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from fastapi import Request, Response, status
+from db.client import db_client
+from routers.helpers.helper import dump_json, JSON_MEDIA_TYPE
+from routers.helpers.metrics_helper import CACHE_LOOKUPS
+from routers.helpers.singleflight_helper import single_flight
+
+# Number of responses kept in memory, 0 disables the cache
+cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Bytes of the bodies kept in memory by each worker, a page of 1000 assets is about 113 KiB
+cache_bytes = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# The clients can keep the responses but they should always revalidate them
+CACHE_CONTROL = "private, no-cache"
+
+
+async def data_version(user_id: str) -> int:
+    """Version of the asset data of the user, 0 if they never had assets"""
+    summary = await single_flight.run("version", (user_id,),
+                                      lambda: db_client.portfolios.find_one({"_id": user_id}, {"version": 1}))
+
+    return summary_version(summary)
+
+
+def summary_version(summary: dict | None) -> int:
+    """Version of a portfolio summary, 0 if it doesn't exist"""
+    return summary.get("version", 0) if summary else 0
+
+
+def make_etag(user_id: str, version: int, request: Request) -> str:
+    """Strong ETag of the response for the user in the given version"""
+    digest = hashlib.sha1(f"{user_id}:{request.url.path}?{request.url.query}".encode()).hexdigest()
+
+    return f'"{version}-{digest[:16]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check the If-None-Match header, the comparison is weak like the RFC says"""
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """Class keeping the last encoded responses by user, version and url,
+       up to size responses and max_bytes bytes of bodies"""
+
+    def __init__(self, size: int, max_bytes: int):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: tuple) -> tuple[bytes, dict] | None:
+        """Get a response and mark it as the most recent one"""
+        entry = self._entries.get(key)
+        if entry is None:
+            CACHE_LOOKUPS.inc("miss")
+            return None
+
+        CACHE_LOOKUPS.inc("hit")
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, body: bytes, headers: dict):
+        """Save a response removing the oldest ones when it's full,
+           a body bigger than the whole cache is not saved"""
+        if self.size <= 0 or len(body) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[0])
+        self._entries[key] = (body, headers)
+        self._bytes += len(body)
+        while len(self._entries) > self.size or self._bytes > self.max_bytes:
+            _, (oldest, _) = self._entries.popitem(last=False)
+            self._bytes -= len(oldest)
+
+    def clear(self):
+        """Remove all the responses"""
+        self._entries.clear()
+        self._bytes = 0
+
+
+response_cache = ResponseCache(cache_size, cache_bytes)
+
+
+async def versioned_response(request: Request, user_id: str, version: int, build) -> Response:
+    """Answer 304 if the client has the current version, otherwise use the cached
+       body or call build, that returns the content and the extra headers. The
+       concurrent requests of the same response share one build"""
+    etag = make_etag(user_id, version, request)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = (user_id, version, request.url.path, request.url.query)
+    cached = response_cache.get(key)
+    if cached is None:
+        async def encode():
+            content, extra_headers = await build()
+            return dump_json(content), extra_headers
+
+        cached = await single_flight.run("response", key, encode)
+        response_cache.put(key, *cached)
+
+    body, extra_headers = cached
+    return Response(content=body, media_type=JSON_MEDIA_TYPE, headers={**headers, **extra_headers})
@@ -0,0 +1,179 @@
+"""Compression helper
+
+The responses bigger than COMPRESSION_MINIMUM_SIZE are compressed with the best
+encoding the client accepts: brotli or gzip. The NDJSON streams are compressed
+chunk by chunk and the event streams and the media that is already compressed
+are sent as they are. A compressed body is another representation of the same
+response, so its ETag is sent as weak (If-None-Match compares them weakly).
+"""
+
+import asyncio
+import os
+import zlib
+import brotli
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+# This module doesn't use the database, so it loads the .env file itself
+load_dotenv()
+minimum_size = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+gzip_level = int(os.getenv("GZIP_LEVEL", "6"))
+brotli_quality = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Media types that are never compressed
+EXCLUDED_MEDIA_TYPES = ("text/event-stream", "image/", "audio/", "video/", "font/woff",
+                        "application/zip", "application/gzip")
+
+# Bigger chunks are compressed in a thread, so the event loop is not blocked
+THREAD_MINIMUM_SIZE = 256 * 1024
+
+
+class GzipCompressor:
+    """Class compressing the chunks of a body with gzip"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes, last: bool) -> bytes:
+        """Compress the chunk, the output of every chunk can be decoded right away"""
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliCompressor:
+    """Class compressing the chunks of a body with brotli"""
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes, last: bool) -> bytes:
+        """Compress the chunk, the output of every chunk can be decoded right away"""
+        compressed = self._compressor.process(chunk)
+        return compressed + (self._compressor.finish() if last else self._compressor.flush())
+
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Quality of each encoding of the Accept-Encoding header"""
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            qualities[name.strip()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: str, available: tuple) -> str | None:
+    """The available encoding (in order of preference) with the highest quality
+       accepted by the client, None to send the body as it is"""
+    qualities = accepted_encodings(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(headers: Headers, status_code: int) -> bool:
+    """Check if a response can be compressed by its status and headers"""
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return (status_code not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and not media_type.startswith(EXCLUDED_MEDIA_TYPES))
+
+
+class CompressedSend:
+    """Class wrapping the send of a response: it holds the start message until
+       the first chunk of the body shows if it's worth compressing"""
+
+    def __init__(self, send, compressor_factory, encoding: str | None, minimum_size: int):
+        self._send = send
+        self.compressor_factory = compressor_factory
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._compressor = None
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if compressible(headers, message["status"]):
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                if self.encoding:
+                    # Sent with the first chunk of the body
+                    self._start = message
+                    return
+            await self._send(message)
+            return
+
+        if self._start is not None and message["type"] == "http.response.body":
+            await self._send_first(message)
+            return
+
+        if self._start is not None:
+            await self._send(self._start)
+            self._start = None
+
+        if self._compressor is not None and message["type"] == "http.response.body":
+            message["body"] = await self._compress(message.get("body", b""), not message.get("more_body", False))
+
+        await self._send(message)
+
+    async def _send_first(self, message):
+        """Send the start message and the first chunk, compressed if it's big enough or a stream"""
+        start, self._start = self._start, None
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if more_body or len(body) >= self.minimum_size:
+            self._compressor = self.compressor_factory()
+            message["body"] = await self._compress(body, not more_body)
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+
+        await self._send(start)
+        await self._send(message)
+
+    async def _compress(self, chunk: bytes, last: bool) -> bytes:
+        """Compress a chunk of the body"""
+        if len(chunk) >= THREAD_MINIMUM_SIZE:
+            return await asyncio.to_thread(self._compressor.compress, chunk, last)
+        return self._compressor.compress(chunk, last)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing the responses with the encoding negotiated
+       with the Accept-Encoding header"""
+
+    def __init__(self, app, minimum_size: int = minimum_size, gzip_level: int = gzip_level,
+                 brotli_quality: int = brotli_quality):
+        self.app = app
+        self.minimum_size = minimum_size
+        # In order of preference
+        self.compressors = {"br": lambda: BrotliCompressor(brotli_quality),
+                            "gzip": lambda: GzipCompressor(gzip_level)}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), tuple(self.compressors))
+        compressed_send = CompressedSend(send, self.compressors.get(encoding), encoding, self.minimum_size)
+        await self.app(scope, receive, compressed_send)
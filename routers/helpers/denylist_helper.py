@@ -0,0 +1,76 @@
+"""Token denylist helper
+
+The access tokens are checked without reading the database, so the tokens of a
+user that is deleted or changes the password are revoked by saving the time of
+the change: every token of the user issued before it is rejected. The times are
+kept in memory, saved in the revocations collection and reloaded periodically
+so every worker knows them. They are removed when the tokens issued before them
+are expired anyway, so the list stays small.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import PyMongoError
+from db.client import db_client
+
+# The .env file is already loaded by db.client
+revocation_sync_seconds = int(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+
+
+class TokenDenylist:
+    """Class keeping, by user id, the time before which their tokens are revoked"""
+
+    def __init__(self):
+        self._revoked: dict[str, float] = {}
+
+    def revoke(self, user_id: str, revoked_at: float):
+        """Revoke the tokens of the user issued before the time"""
+        self._revoked[user_id] = max(revoked_at, self._revoked.get(user_id, 0))
+
+    def is_revoked(self, user_id: str, issued_at: float) -> bool:
+        """Check if a token of the user issued at the time is revoked"""
+        revoked_at = self._revoked.get(user_id)
+        return revoked_at is not None and issued_at < revoked_at
+
+    def prune(self, oldest: float):
+        """Remove the revocations older than the oldest token that can still be valid"""
+        self._revoked = {user_id: revoked_at for user_id, revoked_at in self._revoked.items()
+                         if revoked_at >= oldest}
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+denylist = TokenDenylist()
+
+
+async def revoke_user_tokens(user_id: str, lifetime: timedelta):
+    """Revoke every token of the user issued until now, lifetime is how long
+       the last of them can still be valid"""
+    now = datetime.now(timezone.utc)
+    denylist.revoke(user_id, now.timestamp())
+    # The TTL index removes the revocation when every revoked token is expired
+    await db_client.revocations.update_one({"_id": user_id},
+                                           {"$max": {"revoked_at": now.timestamp(), "expires_at": now + lifetime}},
+                                           upsert=True)
+
+
+async def load_revocations():
+    """Load the revocations saved by every worker that are still needed"""
+    now = datetime.now(timezone.utc)
+    async for revocation in db_client.revocations.find({"expires_at": {"$gt": now}}):
+        denylist.revoke(revocation["_id"], revocation["revoked_at"])
+
+
+async def revocations_loop(lifetime: timedelta):
+    """Background task reloading the revocations of the other workers and
+       removing the ones older than the lifetime of the tokens"""
+    while True:
+        await asyncio.sleep(revocation_sync_seconds)
+        try:
+            await load_revocations()
+        except PyMongoError as e:
+            print(f"Error loading the token revocations: {e}")
+        denylist.prune(time.time() - lifetime.total_seconds())
@@ -0,0 +1,92 @@
+"""Events helper
+
+An in-process hub sends events to the subscribers of each channel (a user id).
+Every subscriber is a small bounded queue, so an idle connection only costs the
+queue and its waiting task, and publishing to a channel without subscribers is a
+dict lookup. The hub also keeps the last version sent to each channel, so one
+task by worker can find the channels changed by other workers.
+"""
+
+import asyncio
+import os
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from routers.helpers.helper import dump_json
+
+# This module doesn't use the database, so it loads the .env file itself
+load_dotenv()
+events_ping_seconds = int(os.getenv("EVENTS_PING_SECONDS", "30"))
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# Sent instead of the events a slow subscriber missed, it has to reload the state
+RESYNC = ("resync", None)
+
+
+class EventHub:
+    """Class publishing events to the subscribers of each channel in the process"""
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._channels: dict[str, set[asyncio.Queue]] = {}
+        self._versions: dict[str, int] = {}
+
+    @contextmanager
+    def subscribe(self, channel: str):
+        """Queue receiving the (name, data) events of the channel while the context is open"""
+        queue = asyncio.Queue(self.queue_size)
+        self._channels.setdefault(channel, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._channels[channel]
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._channels[channel]
+                self._versions.pop(channel, None)
+
+    def subscribed(self, channels=None) -> list:
+        """The channels with subscribers (all of them without channels)"""
+        if channels is None:
+            return list(self._channels)
+        return [channel for channel in channels if channel in self._channels]
+
+    def seen(self, channel: str, version: int):
+        """Keep the version sent to the subscribers of the channel"""
+        if channel in self._channels:
+            self._versions[channel] = max(version, self._versions.get(channel, version))
+
+    def version(self, channel: str) -> int:
+        """The last version sent to the subscribers of the channel, 0 if none"""
+        return self._versions.get(channel, 0)
+
+    def publish(self, channel: str, name: str, data):
+        """Send the event to every subscriber of the channel without waiting"""
+        for queue in self._channels.get(channel, ()):
+            try:
+                queue.put_nowait((name, data))
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def metrics(self) -> dict:
+        """Number of channels and subscribers"""
+        return {"channels": len(self._channels),
+                "subscribers": sum(len(subscribers) for subscribers in self._channels.values())}
+
+
+portfolio_hub = EventHub()
+
+
+def sse_message(name: str, data, event_id=None) -> bytes:
+    """Encode an event in the Server-Sent Events format"""
+    lines = [f"event: {name}".encode()]
+    if event_id is not None:
+        lines.append(f"id: {event_id}".encode())
+    lines.append(b"data: " + dump_json(data))
+    return b"\n".join(lines) + b"\n\n"
+
+
+# A comment line, it keeps the proxies from closing an idle connection
+SSE_PING = b": ping\n\n"
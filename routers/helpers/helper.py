@@ -1,7 +1,16 @@
 """General helper"""
 
+import orjson
 from bson import ObjectId
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from db.pagination import decode_cursor, InvalidCursor
+
+# Pagination of the list endpoints
+MAX_PAGE_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
 
 def check_id(user_id: str):
     """Check if an Id is not a valid Id for ObjectId"""
@@ -9,3 +18,81 @@ def check_id(user_id: str):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The ID does not exist.")
+
+
+def check_cursor(cursor: str | None):
+    """Check if the cursor of a list endpoint is a cursor of a previous page"""
+    if cursor is None:
+        return
+
+    try:
+        decode_cursor(cursor)
+    except InvalidCursor as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The cursor is not valid.") from exc
+
+
+def parse_fields(fields: str | None, allowed: tuple) -> tuple | None:
+    """The fields asked with fields=a,b in the order of allowed, None for all of them"""
+    if fields is None:
+        return None
+
+    asked = {field.strip() for field in fields.split(",")} - {""}
+    if not asked or not asked <= set(allowed):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The fields should be some of: {', '.join(allowed)}.")
+
+    return tuple(field for field in allowed if field in asked)
+
+
+def sparse_fields(fields: str | None, allowed: tuple, schema) -> tuple[dict | None, object]:
+    """Projection and schema returning only the fields asked with fields=, without
+       them there is no projection (the repository reads all the fields) and the
+       full schema is used. Like the full schemas, the id is the _id as a string and
+       the other fields keep their name"""
+    selected = parse_fields(fields, allowed)
+    if selected is None:
+        return None, schema
+
+    def sparse_schema(document: dict) -> dict:
+        return {field: str(document["_id"]) if field == "id" else document.get(field) for field in selected}
+
+    # The _id is always read, the pages need it for the cursor
+    return {"_id": 1, **{field: 1 for field in selected if field != "id"}}, sparse_schema
+
+
+def wants_ndjson(accept: str | None) -> bool:
+    """Check if the client asked for a NDJSON stream"""
+    return accept is not None and NDJSON_MEDIA_TYPE in accept
+
+
+def ndjson_response(documents, schema) -> StreamingResponse:
+    """Stream the documents one per line as they come from the async iterable"""
+    async def lines():
+        async for document in documents:
+            yield orjson.dumps(schema(document), option=orjson.OPT_APPEND_NEWLINE)
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def json_default(value):
+    """Encode the values that orjson doesn't support natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dump_json(content) -> bytes:
+    """Encode the content as JSON with orjson"""
+    return orjson.dumps(content, default=json_default)
+
+
+def json_response(content, status_code: int = status.HTTP_200_OK, headers: dict | None = None) -> Response:
+    """Response for content built by the schemas from trusted database documents,
+       it's encoded directly so the response model doesn't validate it again"""
+    return Response(content=dump_json(content), status_code=status_code,
+                    media_type=JSON_MEDIA_TYPE, headers=headers)
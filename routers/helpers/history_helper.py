@@ -0,0 +1,141 @@
+"""Portfolio history helper
+
+A snapshot job saves the value and the weights of every portfolio in a
+time-series collection (a regular collection on servers before MongoDB 5.0),
+and the history is downsampled by the database when it's read.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+from db.models.asset import HistoryPoint
+from db.client import db_client
+from routers.helpers.portfolio_helper import unescape_mnemonic
+from routers.helpers.jobs_helper import claim_due_job
+
+# The .env file is already loaded by db.client
+snapshot_interval = int(os.getenv("SNAPSHOT_INTERVAL_MINUTES", "1440"))
+
+HISTORY_COLLECTION = "portfolio_history"
+SNAPSHOT_JOB = "portfolio_snapshot"
+
+# Snapshots written in each insert
+BATCH_SIZE = 1000
+
+# Points returned without downsampling
+MAX_RAW_POINTS = 1000
+
+DAY_MS = 24 * 60 * 60 * 1000
+_day = {"$dateFromParts": {"year": {"$year": "$ts"}, "month": {"$month": "$ts"}, "day": {"$dayOfMonth": "$ts"}}}
+
+# Start of the bucket of each snapshot, the weeks start on Monday
+BUCKETS = {
+    "day": _day,
+    "week": {"$subtract": [_day, {"$multiply": [{"$mod": [{"$add": [{"$dayOfWeek": "$ts"}, 5]}, 7]}, DAY_MS]}]},
+    "month": {"$dateFromParts": {"year": {"$year": "$ts"}, "month": {"$month": "$ts"}}},
+}
+
+
+async def create_history_collection():
+    """Create the time-series collection for the snapshots"""
+    try:
+        await db_client.create_collection(
+            HISTORY_COLLECTION,
+            timeseries={"timeField": "ts", "metaField": "user_id", "granularity": "hours"})
+    except CollectionInvalid:
+        return  # It already exists
+    except (OperationFailure, NotImplementedError):
+        # The server doesn't support time-series collections
+        await db_client[HISTORY_COLLECTION].create_index([("user_id", ASCENDING), ("ts", ASCENDING)])
+
+
+def snapshot_document(summary: dict, ts: datetime) -> dict:
+    """Value and weights of a portfolio summary at the time of the snapshot"""
+    total = summary["total"]
+    weights = {field: (item["value"] * 100 / total) if total else 0.0
+               for field, item in summary["items"].items() if item["count"] > 0}
+
+    return {"ts": ts, "user_id": summary["_id"], "total": total, "weights": weights}
+
+
+async def take_snapshots(ts: datetime | None = None) -> int:
+    """Save a snapshot of every portfolio summary, it returns the number of snapshots"""
+    ts = ts or datetime.now(timezone.utc)
+    batch = []
+    count = 0
+
+    async for summary in db_client.portfolios.find({}, {"total": 1, "items": 1}):
+        batch.append(snapshot_document(summary, ts))
+        if len(batch) == BATCH_SIZE:
+            await db_client[HISTORY_COLLECTION].insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        await db_client[HISTORY_COLLECTION].insert_many(batch, ordered=False)
+        count += len(batch)
+
+    return count
+
+
+async def run_due_snapshot(interval: timedelta) -> bool:
+    """Take the snapshots if it's time, only one worker wins each run"""
+    now = await claim_due_job(SNAPSHOT_JOB, interval)
+    if now is None:
+        return False
+
+    await take_snapshots(now)
+    return True
+
+
+async def snapshot_loop(interval_minutes: int):
+    """Background task taking the snapshots every interval"""
+    interval = timedelta(minutes=interval_minutes)
+    while True:
+        try:
+            await run_due_snapshot(interval)
+        except PyMongoError as e:
+            print(f"Error taking the portfolio snapshots: {e}")
+        await asyncio.sleep(min(interval.total_seconds(), 60))
+
+
+def history_pipeline(user_id: str, start: datetime, end: datetime,
+                     interval: str, with_weights: bool) -> list:
+    """Aggregation pipeline for the history of a user, the snapshots are grouped by
+       interval and each bucket has the last value (raw returns every snapshot)"""
+    pipeline = [{"$match": {"user_id": user_id, "ts": {"$gte": start, "$lte": end}}},
+                {"$sort": {"ts": 1}}]
+
+    if interval == "raw":
+        pipeline.append({"$limit": MAX_RAW_POINTS})
+        fields = {"_id": 0, "ts": 1, "total": 1}
+        if with_weights:
+            fields["weights"] = 1
+        pipeline.append({"$project": fields})
+        return pipeline
+
+    group = {"_id": BUCKETS[interval], "total": {"$last": "$total"}}
+    if with_weights:
+        group["weights"] = {"$last": "$weights"}
+
+    pipeline += [{"$group": group},
+                 {"$sort": {"_id": 1}},
+                 {"$addFields": {"ts": "$_id"}},
+                 {"$project": {"_id": 0}}]
+    return pipeline
+
+
+async def get_history(user_id: str, start: datetime, end: datetime,
+                      interval: str, with_weights: bool) -> list[HistoryPoint]:
+    """Get the history of the portfolio of the user"""
+    pipeline = history_pipeline(user_id, start, end, interval, with_weights)
+    points = await db_client[HISTORY_COLLECTION].aggregate(pipeline).to_list(None)
+
+    for point in points:
+        if "weights" in point:
+            point["weights"] = {unescape_mnemonic(field): weight
+                                for field, weight in point["weights"].items()}
+
+    return [HistoryPoint(**point) for point in points]
@@ -0,0 +1,26 @@
+"""Jobs helper
+
+The periodic jobs run in every worker, but each run is claimed in the jobs
+collection, so only one worker does it:
+
+{"_id": "portfolio_snapshot", "next_run": ...}
+"""
+
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from db.client import db_client
+
+
+async def claim_due_job(name: str, interval: timedelta) -> datetime | None:
+    """Claim the run of the job if it's due and schedule the next one after the interval,
+       it returns the time of the run or None if it's not due or another worker won it"""
+    now = datetime.now(timezone.utc)
+    try:
+        # If the job is not due the filter doesn't match and the upsert fails
+        await db_client.jobs.find_one_and_update(
+            {"_id": name, "next_run": {"$lte": now}},
+            {"$set": {"next_run": now + interval}}, upsert=True)
+    except DuplicateKeyError:
+        return None
+
+    return now
@@ -0,0 +1,174 @@
+"""Metrics helper
+
+Counters and histograms kept in memory and exported in the Prometheus text
+format by GET /metrics. Recording a value is a dict lookup and a few additions,
+so they can be used in the hot paths (every request and every database command).
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Route label of the requests that don't match any route
+UNMATCHED_ROUTE = "unmatched"
+
+
+def escape_label(value) -> str:
+    """Escape a label value for the text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    """Labels of a sample like {method="GET",route="/asset/"}"""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Class representing a counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *values, amount: float = 1):
+        """Increment the counter of the label values"""
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values) -> float:
+        """Current value of the label values"""
+        return self._values.get(values, 0)
+
+    def samples(self) -> list[str]:
+        """Lines of the text format"""
+        return [f"{self.name}{format_labels(self.labels, values)} {value}"
+                for values, value in self._values.items()]
+
+
+class Histogram:
+    """Class representing a histogram with labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # By label values: the count of each bucket (the last one is +Inf), the sum and the count
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, amount: float, *values):
+        """Record a value for the label values"""
+        data = self._values.get(values)
+        if data is None:
+            data = self._values[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect_left(self.buckets, amount)] += 1
+        data[1] += amount
+        data[2] += 1
+
+    @contextmanager
+    def time(self, *values):
+        """Record the seconds spent inside the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *values)
+
+    def count(self, *values) -> int:
+        """Number of values recorded for the label values"""
+        data = self._values.get(values)
+        return data[2] if data else 0
+
+    def samples(self) -> list[str]:
+        """Lines of the text format, the buckets are cumulative"""
+        lines = []
+        for values, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                labels = format_labels(self.labels, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds",
+                            "Time to answer the HTTP requests by route", ("method", "route"))
+REQUESTS = Counter("http_requests_total",
+                   "HTTP requests by route and status code", ("method", "route", "status"))
+COMMAND_SECONDS = Histogram("mongodb_command_duration_seconds",
+                            "Time of the MongoDB commands by collection", ("collection", "command"))
+COMMAND_FAILURES = Counter("mongodb_command_failures_total",
+                           "Failed MongoDB commands by collection", ("collection", "command"))
+SLOW_COMMANDS = Counter("mongodb_slow_commands_total",
+                        "MongoDB commands slower than SLOW_QUERY_MS", ("collection", "command"))
+PASSWORD_SECONDS = Histogram("password_duration_seconds",
+                             "Time to hash or verify a password, waiting for a worker included",
+                             ("operation",))
+TOKEN_SECONDS = Histogram("token_decode_duration_seconds", "Time to decode the access tokens")
+THROTTLED = Counter("password_throttled_total",
+                    "Password requests rejected by the IP or username limits or the lockout", ("reason",))
+COALESCED = Counter("coalesced_queries_total",
+                    "Database queries saved by sharing the result of an identical one in flight", ("operation",))
+CACHE_LOOKUPS = Counter("response_cache_lookups_total",
+                        "Lookups of the in-process response cache by result (hit or miss)", ("result",))
+
+METRICS = [REQUEST_SECONDS, REQUESTS, COMMAND_SECONDS, COMMAND_FAILURES, SLOW_COMMANDS,
+           PASSWORD_SECONDS, TOKEN_SECONDS, THROTTLED, COALESCED, CACHE_LOOKUPS]
+
+
+def render_metrics() -> str:
+    """All the metrics in the Prometheus text format"""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines += metric.samples()
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency and the status code of each request
+       by route template, so the ids in the paths don't create new series"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router saves the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_ROUTE)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], path)
+            REQUESTS.inc(scope["method"], path, status_code)
@@ -0,0 +1,197 @@
+"""Password helper"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from passlib.hash import bcrypt
+from routers.helpers.users_helper import pwd_context
+from routers.helpers.metrics_helper import PASSWORD_SECONDS
+
+# The .env file is already loaded by users_helper
+pool_kind = os.getenv("PASSWORD_POOL_KIND", "thread")
+pool_workers = int(os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 1)))
+pool_queue_limit = int(os.getenv("PASSWORD_POOL_QUEUE_LIMIT", str(pool_workers * 4)))
+
+
+def _hash(password: str) -> str:
+    """Hash a password (it runs inside a worker)"""
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash (it runs inside a worker)"""
+    return pwd_context.verify(password, hashed_password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify a password and hash it again if the hash doesn't follow the current
+       policy (it runs inside a worker)"""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _dummy_verify():
+    """Verify a password against a fixed hash, to measure the time of a
+       verification (it runs inside a worker)"""
+    pwd_context.dummy_verify()
+
+
+class PasswordPool:
+    """Class running the bcrypt work in a bounded pool of workers,
+       so the event loop keeps serving other requests"""
+
+    def __init__(self, kind: str, workers: int, queue_limit: int):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password pool kind: {kind}")
+
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Executor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._active = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        self._seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        """Create the executor the first time it's needed"""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="password")
+        return self._executor
+
+    async def run(self, func, *args):
+        """Run the function in the pool, if the queue is full it returns a 503 error"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        if self._slots.locked() and self._queued >= self.queue_limit:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The server is busy, please try again later.",
+                headers={"Retry-After": "1"})
+
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+
+        self._active += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._seconds += time.perf_counter() - start
+            self._completed += 1
+            self._active -= 1
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        """Current state of the pool"""
+        return {"kind": self.kind,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "average_ms": (self._seconds * 1000 / self._completed) if self._completed else 0.0}
+
+    def shutdown(self):
+        """Stop the workers"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = PasswordPool(pool_kind, pool_workers, pool_queue_limit)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    with PASSWORD_SECONDS.time("hash"):
+        return await password_pool.run(_hash, password)
+
+
+class VerifyTime:
+    """Class keeping the moving average of the time to verify a password,
+       waiting for a worker included"""
+
+    def __init__(self, weight: float = 0.1):
+        self.weight = weight
+        self.seconds: float | None = None
+
+    def add(self, seconds: float):
+        """Add the time of a verification"""
+        if self.seconds is None:
+            self.seconds = seconds
+        else:
+            self.seconds += self.weight * (seconds - self.seconds)
+
+
+verify_time = VerifyTime()
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop"""
+    with PASSWORD_SECONDS.time("verify"):
+        return await password_pool.run(_verify, password, hashed_password)
+
+
+async def verify_and_update_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify a password without blocking the event loop, it returns if it's valid and
+       the new hash if the stored one has to be replaced"""
+    start = time.perf_counter()
+    with PASSWORD_SECONDS.time("verify"):
+        result = await password_pool.run(_verify_and_update, password, hashed_password)
+    verify_time.add(time.perf_counter() - start)
+    return result
+
+
+async def measure_verify_time():
+    """Verify a password once in the pool to have the time of a verification
+       before the first login, it runs when the server starts"""
+    start = time.perf_counter()
+    await password_pool.run(_dummy_verify)
+    verify_time.add(time.perf_counter() - start)
+
+
+async def fake_verify_password():
+    """Take as long as a password verification without the work, so an unknown
+       username answers in the same time as a wrong password. The time is measured
+       when the server starts and then follows the real verifications"""
+    await asyncio.sleep(verify_time.seconds or 0)
+
+
+def hash_seconds(rounds: int, samples: int = 3) -> float:
+    """Best time in seconds to hash a password with the bcrypt cost"""
+    handler = bcrypt.using(rounds=rounds)
+    best = float("inf")
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration password")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 4, max_rounds: int = 16) -> tuple[int, dict]:
+    """The highest bcrypt cost that hashes within the target in this host, and the
+       time in milliseconds of each cost measured. Each cost doubles the time, so
+       it stops at the first one over the target"""
+    times = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        times[rounds] = hash_seconds(rounds) * 1000
+        if times[rounds] > target_ms:
+            break
+
+    within = [rounds for rounds, ms in times.items() if ms <= target_ms]
+    return (max(within) if within else min_rounds), times
@@ -0,0 +1,311 @@
+"""Portfolio helper
+
+Every user has a summary document in the portfolios collection with the total
+money and the money by mnemonic, it's updated on each asset write so reading
+the portfolio is a single document fetch:
+
+{"_id": user_id, "version": 3, "total": 150.0,
+ "items": {"AAA": {"value": 100.0, "count": 1}, "BBB": {"value": 50.0, "count": 1}}}
+"""
+
+import asyncio
+import math
+from pymongo import ReturnDocument, UpdateOne
+from db.models.asset import PortfolioItem
+from db.models.user import User
+from db.client import db_client
+from db.repository import assets_repository
+from db.repositories.base import OTHER_MNEMONIC
+from routers.helpers.assets_helper import calculate_portfolio
+from pymongo.errors import PyMongoError
+from routers.helpers.events_helper import portfolio_hub, sse_message, events_ping_seconds, SSE_PING, RESYNC
+from routers.helpers.singleflight_helper import single_flight
+
+# Summaries written in each bulk operation
+BATCH_SIZE = 1000
+
+# Mnemonics are used as field names, so these characters are escaped
+ESCAPED_CHARS = {".": "\uff0e", "$": "\uff04"}
+
+
+def escape_mnemonic(mnemonic: str) -> str:
+    """Convert a mnemonic into a valid field name"""
+    for char, replacement in ESCAPED_CHARS.items():
+        mnemonic = mnemonic.replace(char, replacement)
+    return mnemonic
+
+
+def unescape_mnemonic(field: str) -> str:
+    """Convert a field name back into the mnemonic"""
+    for char, replacement in ESCAPED_CHARS.items():
+        field = field.replace(replacement, char)
+    return field
+
+
+def asset_value(asset: dict) -> float:
+    """Money invested in an asset"""
+    return asset["shares"] * asset["price"]
+
+
+async def apply_asset_change(user_id: str, before: dict | None, after: dict | None):
+    """Update the summary of the user with the change of an asset,
+       before is None for a new asset and after is None for a deleted asset"""
+    increments = {"total": 0, "version": 1}
+
+    for asset, sign in ((before, -1), (after, 1)):
+        if asset is None:
+            continue
+        field = f"items.{escape_mnemonic(asset['mnemonic'])}"
+        value = asset_value(asset) * sign
+        increments["total"] += value
+        increments[f"{field}.value"] = increments.get(f"{field}.value", 0) + value
+        increments[f"{field}.count"] = increments.get(f"{field}.count", 0) + sign
+
+    summary = await db_client.portfolios.find_one_and_update(
+        {"_id": user_id}, {"$inc": increments},
+        upsert=True, return_document=ReturnDocument.AFTER)
+    single_flight.invalidate(owners=[user_id])
+
+    # The summary didn't exist, so the previous assets of the user are not there.
+    # Without drift the rebuild doesn't write, so the first asset is published here
+    if summary["version"] == 1:
+        if not await rebuild_summaries(user_id):
+            await publish_summaries([user_id])
+        return
+
+    # Removing the mnemonics without assets
+    empty = {f"items.{field}": "" for field, item in summary["items"].items() if item["count"] <= 0}
+    if empty:
+        filters = {"_id": user_id, **{f"{field}.count": {"$lte": 0} for field in empty}}
+        await db_client.portfolios.update_one(filters, {"$unset": empty})
+
+    mnemonics = {asset["mnemonic"] for asset in (before, after) if asset is not None}
+    publish_portfolio(user_id, "delta", delta_event(summary, mnemonics))
+
+
+async def find_summary(user_id: str) -> dict | None:
+    """The summary of the user, the concurrent reads share one query"""
+    return await single_flight.run("portfolio", (user_id,),
+                                   lambda: db_client.portfolios.find_one({"_id": user_id}))
+
+
+def summary_portfolio(summary: dict, top: int | None = None, sort: str | None = None) -> list:
+    """Calculate the percentage of each asset from the summary of the user"""
+    total = summary["total"]
+    items = [PortfolioItem(mnemonic=unescape_mnemonic(field),
+                           percentage=(item["value"] * 100 / total) if total else 0)
+             for field, item in summary["items"].items() if item["count"] > 0]
+
+    sort_keys = {"percentage": lambda item: (-item.percentage, item.mnemonic),
+                 "mnemonic": lambda item: item.mnemonic}
+
+    if top is None:
+        return sorted(items, key=sort_keys[sort]) if sort else items
+
+    items.sort(key=sort_keys["percentage"])
+    top_items, other_items = items[:top], items[top:]
+    if sort:
+        top_items.sort(key=sort_keys[sort])
+    if other_items:
+        top_items.append(PortfolioItem(mnemonic=OTHER_MNEMONIC,
+                                       percentage=sum(item.percentage for item in other_items)))
+    return top_items
+
+
+async def get_portfolio(user: User, summary: dict | None,
+                        top: int | None = None, sort: str | None = None) -> list:
+    """Get the portfolio of the user from their summary, if the user doesn't
+       have a summary yet it's calculated from the assets"""
+    if summary is None:
+        return await calculate_portfolio(user, top, sort)
+
+    return summary_portfolio(summary, top, sort)
+
+
+def group_summary(group: dict) -> dict:
+    """Convert a result of the summaries pipeline into the summary fields"""
+    return {"total": group["total"],
+            "items": {escape_mnemonic(item["mnemonic"]): {"value": item["value"],
+                                                          "count": item["count"]}
+                      for item in group["items"]}}
+
+
+def summary_drift(expected: dict, stored: dict | None) -> list:
+    """Mnemonics where the stored summary is different from the expected one"""
+    stored_items = stored["items"] if stored else {}
+    stored_items = {field: item for field, item in stored_items.items() if item["count"] > 0}
+    drift = []
+
+    for field in sorted(expected["items"].keys() | stored_items.keys()):
+        expected_item = expected["items"].get(field, {"value": 0, "count": 0})
+        stored_item = stored_items.get(field, {"value": 0, "count": 0})
+        if (expected_item["count"] != stored_item["count"]
+                or not math.isclose(expected_item["value"], stored_item["value"],
+                                    rel_tol=1e-9, abs_tol=1e-6)):
+            drift.append(unescape_mnemonic(field))
+
+    stored_total = stored["total"] if stored else 0
+    if not math.isclose(expected["total"], stored_total, rel_tol=1e-9, abs_tol=1e-6):
+        drift.append("total")
+
+    return drift
+
+
+async def rebuild_summaries(user_id: str | None = None, dry_run: bool = False,
+                            force: bool = False) -> list:
+    """Rebuild the summaries from the assets collection (all of them if there is no user)
+       and return the users where the stored summary was different, with force the
+       summaries are written (and their version incremented) even without drift"""
+    report = []
+    seen = set()
+
+    async for group in assets_repository.summaries([user_id] if user_id else None):
+        seen.add(group["_id"])
+        await check_summary(group["_id"], group_summary(group), dry_run, force, report)
+
+    # Users with a summary but without assets
+    filters = {"_id": user_id} if user_id else {}
+    async for stored in db_client.portfolios.find(filters, {"_id": 1}):
+        if stored["_id"] not in seen:
+            await check_summary(stored["_id"], {"total": 0, "items": {}}, dry_run, force, report)
+
+    return report
+
+
+async def check_summary(user_id: str, expected: dict, dry_run: bool, force: bool, report: list):
+    """Compare the stored summary with the expected one and fix it"""
+    stored = await db_client.portfolios.find_one({"_id": user_id})
+    drift = summary_drift(expected, stored)
+
+    if drift:
+        report.append({"user_id": user_id, "drift": drift,
+                       "expected_total": expected["total"],
+                       "stored_total": stored["total"] if stored else None})
+
+    if not dry_run and (drift or force or stored is None):
+        await db_client.portfolios.update_one(
+            {"_id": user_id}, {"$set": expected, "$inc": {"version": 1}}, upsert=True)
+        single_flight.invalidate(owners=[user_id])
+        await publish_summaries([user_id])
+
+
+async def refresh_summaries(user_ids: list) -> int:
+    """Recalculate the summaries of the users from their assets,
+       with one aggregation and one bulk write for each batch of users"""
+    refreshed = 0
+
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        operations = []
+        seen = set()
+
+        async for group in assets_repository.summaries(batch):
+            seen.add(group["_id"])
+            operations.append(UpdateOne({"_id": group["_id"]},
+                                        {"$set": group_summary(group), "$inc": {"version": 1}},
+                                        upsert=True))
+
+        # Users without assets anymore
+        operations += [UpdateOne({"_id": user_id},
+                                 {"$set": {"total": 0, "items": {}}, "$inc": {"version": 1}},
+                                 upsert=True)
+                       for user_id in batch if user_id not in seen]
+
+        if operations:
+            await db_client.portfolios.bulk_write(operations, ordered=False)
+            refreshed += len(operations)
+            single_flight.invalidate(owners=batch)
+            await publish_summaries(batch)
+
+    return refreshed
+
+
+def summary_items(summary: dict, fields=None) -> list:
+    """Money and percentage of the mnemonics of the summary (all of them without fields)"""
+    total = summary["total"]
+    fields = summary["items"].keys() if fields is None else fields
+    return [{"mnemonic": unescape_mnemonic(field),
+             "value": summary["items"][field]["value"],
+             "percentage": (summary["items"][field]["value"] * 100 / total) if total else 0}
+            for field in fields if summary["items"].get(field, {"count": 0})["count"] > 0]
+
+
+def portfolio_event(summary: dict | None) -> dict:
+    """The whole portfolio of the user for the event stream"""
+    if summary is None:
+        return {"version": 0, "total": 0, "items": []}
+    return {"version": summary["version"], "total": summary["total"], "items": summary_items(summary)}
+
+
+def delta_event(summary: dict, mnemonics: set) -> dict:
+    """The changed mnemonics of the portfolio for the event stream, the percentages of the
+       other mnemonics change with the total, the clients calculate them with their values"""
+    fields = [escape_mnemonic(mnemonic) for mnemonic in sorted(mnemonics)]
+    changed = summary_items(summary, fields)
+    present = {item["mnemonic"] for item in changed}
+    return {"version": summary["version"], "total": summary["total"], "changed": changed,
+            "removed": [mnemonic for mnemonic in sorted(mnemonics) if mnemonic not in present]}
+
+
+def publish_portfolio(user_id: str, name: str, data: dict):
+    """Send an event with a version of the portfolio to the streams of the user"""
+    portfolio_hub.seen(user_id, data["version"])
+    portfolio_hub.publish(user_id, name, data)
+
+
+async def publish_summaries(user_ids: list):
+    """Send the whole portfolio to the users with open event streams"""
+    subscribed = portfolio_hub.subscribed(user_ids)
+    if subscribed:
+        async for summary in db_client.portfolios.find({"_id": {"$in": subscribed}}):
+            publish_portfolio(summary["_id"], "portfolio", portfolio_event(summary))
+
+
+async def check_versions() -> int:
+    """Compare the versions sent to the open event streams with the stored ones, in one
+       query for each batch of users, and resync the portfolios changed by other workers.
+       It returns the number of users resynced"""
+    subscribed = portfolio_hub.subscribed()
+    resynced = 0
+
+    for start in range(0, len(subscribed), BATCH_SIZE):
+        batch = subscribed[start:start + BATCH_SIZE]
+        async for stored in db_client.portfolios.find({"_id": {"$in": batch}}, {"version": 1}):
+            if stored["version"] > portfolio_hub.version(stored["_id"]):
+                portfolio_hub.publish(stored["_id"], *RESYNC)
+                resynced += 1
+
+    return resynced
+
+
+async def versions_loop(interval_seconds: int):
+    """Background task checking the versions of the open event streams every interval"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await check_versions()
+        except PyMongoError as e:
+            print(f"Error checking the versions of the event streams: {e}")
+
+
+async def portfolio_stream(user_id: str):
+    """Server-Sent Events with the portfolio of the user and then its changes.
+       The changes made by other workers come as a resync from versions_loop,
+       so an idle stream only gets a ping without any query"""
+    with portfolio_hub.subscribe(user_id) as queue:
+        data = portfolio_event(await db_client.portfolios.find_one({"_id": user_id}))
+        portfolio_hub.seen(user_id, data["version"])
+        yield sse_message("portfolio", data, data["version"])
+
+        while True:
+            try:
+                name, data = await asyncio.wait_for(queue.get(), events_ping_seconds)
+            except asyncio.TimeoutError:
+                yield SSE_PING
+                continue
+
+            if name == "resync":
+                name, data = "portfolio", portfolio_event(await db_client.portfolios.find_one({"_id": user_id}))
+                portfolio_hub.seen(user_id, data["version"])
+
+            yield sse_message(name, data, data["version"])
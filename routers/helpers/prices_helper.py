@@ -0,0 +1,81 @@
+"""Prices helper"""
+
+from datetime import datetime, timezone
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from db.models.price import PriceQuote, PriceUpdate
+from db.client import db_client
+from db.repository import assets_repository
+from routers.helpers.bulk_helper import read_rows, validation_message
+from routers.helpers.portfolio_helper import refresh_summaries
+from routers.helpers.rollups_helper import refresh_rollups
+
+# Quotes written in each bulk operation
+BATCH_SIZE = 1000
+
+
+async def next_price_version() -> int:
+    """Get a new version number for a price feed"""
+    counter = await db_client.counters.find_one_and_update(
+        {"_id": "prices"}, {"$inc": {"version": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER)
+
+    return counter["version"]
+
+
+async def apply_prices(quotes: list[PriceQuote]) -> PriceUpdate:
+    """Set the new prices in the assets of every user with one bulk write for
+       each batch of quotes and refresh the portfolios of the holders"""
+    # If a mnemonic comes more than once the last price wins
+    prices = {quote.mnemonic: quote.price for quote in quotes}
+    mnemonics = list(prices)
+    version = await next_price_version()
+    updated_at = datetime.now(timezone.utc)
+    matched = modified = 0
+
+    for start in range(0, len(mnemonics), BATCH_SIZE):
+        batch = mnemonics[start:start + BATCH_SIZE]
+        batch_matched, batch_modified = await assets_repository.set_prices(
+            {mnemonic: prices[mnemonic] for mnemonic in batch},
+            {"price_version": version, "price_updated_at": updated_at})
+        matched += batch_matched
+        modified += batch_modified
+
+        await db_client.prices.bulk_write(
+            [UpdateOne({"_id": mnemonic},
+                       {"$set": {"price": prices[mnemonic], "version": version, "updated_at": updated_at}},
+                       upsert=True)
+             for mnemonic in batch],
+            ordered=False)
+
+    holders = await assets_repository.holders(mnemonics)
+    refreshed = await refresh_summaries(holders)
+    await refresh_rollups(mnemonics)
+
+    return PriceUpdate(version=version, updated_at=updated_at, quotes=len(prices),
+                       assets_matched=matched, assets_modified=modified,
+                       portfolios_refreshed=refreshed)
+
+
+async def file_chunks(path: str, size: int = 65536):
+    """Read a file in chunks"""
+    with open(path, "rb") as file:
+        while chunk := file.read(size):
+            yield chunk
+
+
+async def read_price_file(path: str, media_type: str) -> tuple[list[PriceQuote], list[str]]:
+    """Read the quotes of a CSV (with mnemonic,price header) or NDJSON file,
+       it returns the quotes and the errors of the wrong rows"""
+    quotes, errors = [], []
+
+    async for row, data in read_rows(file_chunks(path), media_type):
+        if not isinstance(data, dict):
+            errors.append(f"row {row}: The row is not valid.")
+            continue
+        try:
+            quotes.append(PriceQuote(**data))
+        except ValidationError as e:
+            errors.append(f"row {row}: {validation_message(e)}")
+
+    return quotes, errors
@@ -0,0 +1,159 @@
+"""Rollups helper
+
+The holdings of every user are summed by mnemonic in the rollups collection, so
+the reports across users read one small document by mnemonic instead of scanning
+the assets:
+
+{"_id": "AAA", "shares": 150.0, "value": 1500.0, "users": 2, "updated_at": ...}
+
+They are updated with each asset write, recalculated for the mnemonics of the
+bulk imports and the price feeds, and reconciled with the assets by a job.
+"""
+
+import asyncio
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import PyMongoError
+from db.client import db_client
+from db.repository import assets_repository
+from routers.helpers.portfolio_helper import asset_value
+from routers.helpers.jobs_helper import claim_due_job
+
+# The .env file is already loaded by db.client
+rollup_interval = int(os.getenv("ROLLUP_INTERVAL_MINUTES", "60"))
+
+RECONCILE_JOB = "rollups_reconcile"
+
+# Rollups written in each bulk operation
+BATCH_SIZE = 1000
+
+ROLLUP_FIELDS = ("shares", "value", "users")
+
+
+async def apply_rollup_change(before: dict | None, after: dict | None):
+    """Update the rollups with the change of an asset, before is None for
+       a new asset and after is None for a deleted asset"""
+    increments = {}
+
+    for asset, sign in ((before, -1), (after, 1)):
+        if asset is None:
+            continue
+        item = increments.setdefault(asset["mnemonic"], {"shares": 0, "value": 0, "users": 0})
+        item["shares"] += asset["shares"] * sign
+        item["value"] += asset_value(asset) * sign
+        item["users"] += sign
+
+    now = datetime.now(timezone.utc)
+    operations = [UpdateOne({"_id": mnemonic}, {"$inc": item, "$set": {"updated_at": now}}, upsert=True)
+                  for mnemonic, item in increments.items()]
+
+    # Removing the mnemonics without holders
+    released = [mnemonic for mnemonic, item in increments.items() if item["users"] < 0]
+    if released:
+        operations.append(DeleteMany({"_id": {"$in": released}, "users": {"$lte": 0}}))
+
+    await db_client.rollups.bulk_write(operations, ordered=True)
+
+
+async def refresh_rollups(mnemonics: list) -> int:
+    """Recalculate the rollups of the mnemonics from the assets,
+       with one aggregation and one bulk write for each batch"""
+    refreshed = 0
+    now = datetime.now(timezone.utc)
+
+    for start in range(0, len(mnemonics), BATCH_SIZE):
+        batch = mnemonics[start:start + BATCH_SIZE]
+        operations = []
+        seen = set()
+
+        async for group in assets_repository.rollups(batch):
+            seen.add(group["_id"])
+            operations.append(UpdateOne({"_id": group["_id"]},
+                                        {"$set": {**rollup_fields(group), "updated_at": now}},
+                                        upsert=True))
+
+        # Mnemonics without holders anymore
+        gone = [mnemonic for mnemonic in batch if mnemonic not in seen]
+        if gone:
+            operations.append(DeleteMany({"_id": {"$in": gone}}))
+
+        if operations:
+            await db_client.rollups.bulk_write(operations, ordered=False)
+            refreshed += len(seen)
+
+    return refreshed
+
+
+async def find_rollups(sort: str, limit: int) -> list:
+    """The rollups with the biggest sort field first (value, users or shares)"""
+    found = db_client.rollups.find({}).sort([(sort, -1), ("_id", 1)]).limit(limit)
+    return await found.to_list(None)
+
+
+async def find_rollup(mnemonic: str) -> dict | None:
+    """The rollup of the mnemonic, None if nobody holds it"""
+    return await db_client.rollups.find_one({"_id": mnemonic})
+
+
+def rollup_fields(group: dict) -> dict:
+    """The fields of a rollup from a result of the rollups aggregation"""
+    return {field: group[field] for field in ROLLUP_FIELDS}
+
+
+def rollup_drift(expected: dict, stored: dict | None) -> list:
+    """Fields where the stored rollup is different from the expected one"""
+    stored = stored or {"shares": 0, "value": 0, "users": 0}
+    return [field for field in ROLLUP_FIELDS
+            if not math.isclose(expected[field], stored.get(field, 0), rel_tol=1e-9, abs_tol=1e-6)]
+
+
+async def reconcile_rollups(dry_run: bool = False) -> list:
+    """Compare every rollup with the assets and fix the ones with drift,
+       it returns the mnemonics with drift and the fields"""
+    stored = {rollup["_id"]: rollup async for rollup in db_client.rollups.find({})}
+    now = datetime.now(timezone.utc)
+    report = []
+    operations = []
+
+    async for group in assets_repository.rollups():
+        drift = rollup_drift(group, stored.pop(group["_id"], None))
+        if drift:
+            report.append({"mnemonic": group["_id"], "drift": drift})
+            operations.append(UpdateOne({"_id": group["_id"]},
+                                        {"$set": {**rollup_fields(group), "updated_at": now}},
+                                        upsert=True))
+
+    # Rollups of mnemonics without assets
+    report += [{"mnemonic": mnemonic, "drift": list(ROLLUP_FIELDS)} for mnemonic in sorted(stored)]
+    if stored:
+        operations.append(DeleteMany({"_id": {"$in": list(stored)}}))
+
+    if not dry_run:
+        for start in range(0, len(operations), BATCH_SIZE):
+            await db_client.rollups.bulk_write(operations[start:start + BATCH_SIZE], ordered=False)
+
+    return report
+
+
+async def run_due_reconciliation(interval: timedelta) -> bool:
+    """Reconcile the rollups if it's time, only one worker wins each run"""
+    if await claim_due_job(RECONCILE_JOB, interval) is None:
+        return False
+
+    report = await reconcile_rollups()
+    if report:
+        print(f"{len(report)} rollups with drift fixed")
+    return True
+
+
+async def rollup_loop(interval_minutes: int):
+    """Background task reconciling the rollups every interval"""
+    interval = timedelta(minutes=interval_minutes)
+    while True:
+        try:
+            await run_due_reconciliation(interval)
+        except PyMongoError as e:
+            print(f"Error reconciling the rollups: {e}")
+        await asyncio.sleep(min(interval.total_seconds(), 60))
@@ -0,0 +1,53 @@
+"""Single flight helper
+
+The identical reads that arrive while one is in flight (several tabs of the same
+user, retries) await that database call and share its result instead of sending
+their own query. Every key starts with its owner (the user id of the asset reads),
+so the writes forget the calls in flight of the owner and the reads coming after
+them send a new query. The shared results must not be modified by the callers.
+"""
+
+import asyncio
+from routers.helpers.metrics_helper import COALESCED
+
+
+class SingleFlight:
+    """Class keeping the database calls in flight by operation and key"""
+
+    def __init__(self):
+        self._calls: dict[tuple, asyncio.Future] = {}
+        self._queries = 0
+        self._saved = 0
+
+    async def run(self, operation: str, key: tuple, call):
+        """Await call() or the result of the call of the operation with the same key in flight"""
+        flight = (operation, key)
+        future = self._calls.get(flight)
+        if future is not None:
+            self._saved += 1
+            COALESCED.inc(operation)
+            return await asyncio.shield(future)
+
+        future = self._calls[flight] = asyncio.ensure_future(call())
+        self._queries += 1
+        try:
+            # Shielded, so a client that disconnects doesn't cancel the query of the others
+            return await asyncio.shield(future)
+        finally:
+            if self._calls.get(flight) is future:
+                del self._calls[flight]
+
+    def invalidate(self, operation: str | None = None, owners=None):
+        """Forget the calls in flight of the operation and the owners (every one without them),
+           the callers already waiting get their result and the next ones send a new query"""
+        owners = None if owners is None else set(owners)
+        self._calls = {(name, key): future for (name, key), future in self._calls.items()
+                       if not ((operation is None or name == operation)
+                               and (owners is None or key[0] in owners))}
+
+    def metrics(self) -> dict:
+        """Calls in flight, queries sent and queries saved"""
+        return {"in_flight": len(self._calls), "queries": self._queries, "saved": self._saved}
+
+
+single_flight = SingleFlight()
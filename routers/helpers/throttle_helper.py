@@ -0,0 +1,233 @@
+"""Throttle helper
+
+The endpoints that hash or verify passwords are limited by client IP and by
+username before any bcrypt work, with token buckets, and the usernames with too
+many wrong passwords are locked for a while. The buckets are kept in the process
+(memory backend) or in MongoDB (mongo backend), so the limits hold across workers.
+Behind a load balancer the client IP is read from X-Forwarded-For, only when the
+request comes from one of the TRUSTED_PROXIES.
+"""
+
+import ipaddress
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+from db.client import db_client
+from routers.helpers.metrics_helper import THROTTLED
+
+# The .env file is already loaded by db.client
+throttle_backend = os.getenv("THROTTLE_BACKEND", "memory")
+# Password requests by client IP and by username per minute, 0 disables the limit
+ip_per_minute = int(os.getenv("THROTTLE_IP_PER_MINUTE", "20"))
+username_per_minute = int(os.getenv("THROTTLE_USERNAME_PER_MINUTE", "5"))
+# Wrong passwords in a row that lock the username, 0 disables the lockout
+lockout_failures = int(os.getenv("LOCKOUT_FAILURES", "5"))
+lockout_seconds = int(os.getenv("LOCKOUT_SECONDS", "300"))
+# Comma separated addresses or networks of the proxies in front of the API
+trusted_proxies = [ipaddress.ip_network(proxy.strip(), strict=False)
+                   for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+
+
+class ThrottleBackend(ABC):
+    """Class representing the storage of the token buckets and the failure counters
+
+       The buckets use the generic cell rate algorithm: only the time when the
+       bucket is full again (tat) is saved, so taking a token is one atomic write."""
+
+    @abstractmethod
+    async def take(self, key: str, interval: float, capacity: int, now: float) -> float:
+        """Take a token of the bucket, that gets one every interval seconds up to the capacity.
+           It returns 0 if there was a token, otherwise the seconds until the next one"""
+
+    @abstractmethod
+    async def failures(self, key: str, now: float) -> tuple[int, float]:
+        """Number of failures of the key and when they are forgotten"""
+
+    @abstractmethod
+    async def add_failure(self, key: str, window: float, now: float) -> int:
+        """Count a failure, the failures are forgotten window seconds after the last one.
+           It returns the number of failures"""
+
+    @abstractmethod
+    async def reset(self, key: str):
+        """Forget the failures of the key"""
+
+
+class MemoryThrottleBackend(ThrottleBackend):
+    """Class keeping the buckets and the failures in the process"""
+
+    # The expired entries are removed when there are more keys than this
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._tats: dict[str, float] = {}
+        self._failures: dict[str, tuple[int, float]] = {}
+
+    async def take(self, key, interval, capacity, now):
+        if len(self._tats) > self.MAX_KEYS:
+            self._tats = {bucket: tat for bucket, tat in self._tats.items() if tat > now}
+
+        tat = max(self._tats.get(key, now), now)
+        limit = now + (capacity - 1) * interval
+        if tat > limit:
+            return tat - limit
+
+        self._tats[key] = tat + interval
+        return 0
+
+    async def failures(self, key, now):
+        count, expires = self._failures.get(key, (0, now))
+        return (count, expires) if expires > now else (0, now)
+
+    async def add_failure(self, key, window, now):
+        if len(self._failures) > self.MAX_KEYS:
+            self._failures = {name: value for name, value in self._failures.items() if value[1] > now}
+
+        count, _ = await self.failures(key, now)
+        self._failures[key] = (count + 1, now + window)
+        return count + 1
+
+    async def reset(self, key):
+        self._failures.pop(key, None)
+
+
+class MongoThrottleBackend(ThrottleBackend):
+    """Class keeping the buckets and the failures in MongoDB, shared by every worker.
+       The TTL indexes remove them when they expire"""
+
+    async def take(self, key, interval, capacity, now):
+        limit = now + (capacity - 1) * interval
+        bucket = await db_client.throttle.find_one_and_update(
+            {"_id": key},
+            [{"$set": {"tat": {"$max": [{"$ifNull": ["$tat", now]}, now]}}},
+             {"$set": {"allowed": {"$lte": ["$tat", limit]}}},
+             {"$set": {"tat": {"$cond": ["$allowed", {"$add": ["$tat", interval]}, "$tat"]},
+                       "expires_at": datetime.fromtimestamp(limit + interval, timezone.utc)}}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER)
+
+        return 0 if bucket["allowed"] else bucket["tat"] - limit
+
+    async def failures(self, key, now):
+        found = await db_client.lockouts.find_one({"_id": key})
+        if found is None or found["expires"] <= now:
+            return 0, now
+        return found["failures"], found["expires"]
+
+    async def add_failure(self, key, window, now):
+        found = await db_client.lockouts.find_one_and_update(
+            {"_id": key},
+            [{"$set": {"failures": {"$cond": [{"$gt": [{"$ifNull": ["$expires", 0]}, now]},
+                                              {"$add": ["$failures", 1]},
+                                              1]},
+                       "expires": now + window,
+                       "expires_at": datetime.fromtimestamp(now + window, timezone.utc)}}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER)
+
+        return found["failures"]
+
+    async def reset(self, key):
+        await db_client.lockouts.delete_one({"_id": key})
+
+
+BACKENDS = {"memory": MemoryThrottleBackend, "mongo": MongoThrottleBackend}
+
+
+def too_many_requests(seconds: float) -> HTTPException:
+    """The error returned when the client has to wait"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many attempts, please try again later.",
+        headers={"Retry-After": str(max(1, math.ceil(seconds)))})
+
+
+def is_trusted(address: str, proxies: list) -> bool:
+    """Check if the address belongs to one of the trusted proxies"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_ip(request: Request, proxies: list | None = None) -> str:
+    """The address of the client. If the request comes from a trusted proxy, it's
+       the last address of X-Forwarded-For that is not a trusted proxy (the ones
+       before it could be sent by the client)"""
+    proxies = trusted_proxies if proxies is None else proxies
+    address = request.client.host if request.client else "unknown"
+    if not is_trusted(address, proxies):
+        return address
+
+    forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        address = hop
+        if not is_trusted(hop, proxies):
+            break
+    return address
+
+
+class PasswordThrottle:
+    """Class limiting the password requests by IP and by username, and locking
+       the usernames after too many wrong passwords"""
+
+    def __init__(self, backend: ThrottleBackend, ip_rate: int, username_rate: int,
+                 max_failures: int, lockout: int):
+        self.backend = backend
+        self.ip_rate = ip_rate
+        self.username_rate = username_rate
+        self.max_failures = max_failures
+        self.lockout = lockout
+
+    async def _take(self, key: str, rate: int, reason: str):
+        """Take a token of the bucket of the key, the rate is by minute"""
+        if rate <= 0:
+            return
+
+        wait = await self.backend.take(key, 60 / rate, rate, time.time())
+        if wait > 0:
+            THROTTLED.inc(reason)
+            raise too_many_requests(wait)
+
+    async def check(self, request: Request, username: str | None = None):
+        """Raise a 429 error if the client or the username has to wait"""
+        await self._take(f"ip:{client_ip(request)}", self.ip_rate, "ip")
+
+        if username is None:
+            return
+
+        if self.max_failures > 0:
+            now = time.time()
+            failures, expires = await self.backend.failures(f"user:{username}", now)
+            if failures >= self.max_failures:
+                THROTTLED.inc("lockout")
+                raise too_many_requests(expires - now)
+
+        await self._take(f"user:{username}", self.username_rate, "username")
+
+    async def failed(self, username: str):
+        """Count a wrong password of the username"""
+        if self.max_failures > 0:
+            await self.backend.add_failure(f"user:{username}", self.lockout, time.time())
+
+    async def succeeded(self, username: str):
+        """Forget the wrong passwords of the username"""
+        if self.max_failures > 0:
+            await self.backend.reset(f"user:{username}")
+
+
+def create_throttle(backend: str) -> PasswordThrottle:
+    """Create the throttle with the backend and the limits of the environment"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown throttle backend: {backend}")
+
+    return PasswordThrottle(BACKENDS[backend](), ip_per_minute, username_per_minute,
+                            lockout_failures, lockout_seconds)
+
+
+password_throttle = create_throttle(throttle_backend)
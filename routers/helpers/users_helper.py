@@ -1,60 +1,134 @@
 """Users helper"""
 
+from datetime import datetime, timedelta, timezone
 from typing import Annotated
 import os
-from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from bson import ObjectId
 import jwt
 from jwt.exceptions import InvalidTokenError, DecodeError
-from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation
+from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation, DuplicateKeyError
 from passlib.context import CryptContext
 from db.models.user import User, UserDB
 from db.schemas.user import user_schema, user_db_schema
-from db.client import db_client
+from db.repository import users_repository
+from routers.helpers.metrics_helper import TOKEN_SECONDS
+from routers.helpers.denylist_helper import denylist
+from routers.helpers.singleflight_helper import single_flight
 
-# Load environment variables from .env file
-load_dotenv()
+# The .env file is already loaded by db.client, through db.repository
 secret_key = os.getenv("SECRET_KEY")
 algorithm = os.getenv("ALGORITHM")
 access_token_duration = int(os.getenv("ACCESS_TOKEN_DURATION"))
+# Minutes the refresh tokens are valid, a week by default
+refresh_token_duration = int(os.getenv("REFRESH_TOKEN_DURATION", "10080"))
+# Cost of bcrypt, python3 -m cli bcrypt-cost finds the right one for the host
+bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Comma separated usernames allowed to use the admin endpoints
+admin_usernames = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
 router = APIRouter(prefix="/user",
                    tags=["user"],
                    responses={status.HTTP_404_NOT_FOUND: {"message": "No encontrado"}})
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# The passwords hashed with another cost are hashed again on the next login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=bcrypt_rounds,
+                           bcrypt__min_rounds=bcrypt_rounds, bcrypt__max_rounds=bcrypt_rounds)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    """This method check if the user is authenticated"""
-    credentials_exception = HTTPException(
+
+def credentials_exception() -> HTTPException:
+    """The error returned when the token is not valid"""
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials",
         headers={"WWW-Authenticate": "Bearer"})
 
+
+def token_lifetime() -> timedelta:
+    """How long the longest token is valid, so how long a revocation is needed"""
+    return timedelta(minutes=max(access_token_duration, refresh_token_duration))
+
+
+def create_token(claims: dict, token_type: str, minutes: int) -> str:
+    """Sign a token of the type with the claims, it expires in the minutes"""
+    now = datetime.now(timezone.utc)
+    payload = {**claims,
+               "type": token_type,
+               # With decimals, so a token issued right after a revocation isn't revoked
+               "iat": now.timestamp(),
+               "exp": now + timedelta(minutes=minutes)}
+    return jwt.encode(payload, secret_key, algorithm=algorithm)
+
+
+def create_tokens(user: User) -> dict:
+    """The short lived access token, with the claims needed to authenticate the
+       user without reading the database, and the refresh token to get new ones"""
+    claims = {"sub": user.username, "uid": user.id, "email": user.email}
+
+    return {
+        "access_token": create_token(claims, ACCESS_TOKEN, access_token_duration),
+        "token_type": "bearer",
+        "expires_in": access_token_duration * 60,
+        "refresh_token": create_token({"sub": user.username, "uid": user.id}, REFRESH_TOKEN, refresh_token_duration)
+    }
+
+
+def decode_token(token: str, token_type: str) -> dict:
+    """Check the signature, the expiration, the type and the revocations of the token"""
     try:
-        username = jwt.decode(token, secret_key, algorithms=[algorithm]).get("sub")
-        if username is None:
-            raise credentials_exception
+        with TOKEN_SECONDS.time():
+            claims = jwt.decode(token, secret_key, algorithms=[algorithm])
     except DecodeError as exc:
-        raise credentials_exception from exc
+        raise credentials_exception() from exc
     except InvalidTokenError as exc:
-        raise credentials_exception from exc
+        raise credentials_exception() from exc
+
+    # The tokens without type were issued before the refresh tokens, they are access tokens
+    if claims.get("sub") is None or claims.get("type", ACCESS_TOKEN) != token_type:
+        raise credentials_exception()
+
+    if "uid" in claims and denylist.is_revoked(claims["uid"], claims.get("iat", 0)):
+        raise credentials_exception()
 
-    user = search_user("username", username)
+    return claims
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    """This method check if the user is authenticated, the user comes from the
+       claims of the token without reading the database"""
+    claims = decode_token(token, ACCESS_TOKEN)
+
+    if "uid" in claims:
+        return User(id=claims["uid"], username=claims["sub"], email=claims["email"])
+
+    # The tokens issued before the user id was in the claims
+    user = await search_user("username", claims["sub"])
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+
+    return user
+
+
+async def get_admin_user(user: Annotated[User, Depends(get_current_user)]):
+    """This method check if the authenticated user is an admin"""
+    if user.username not in admin_usernames:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to use this endpoint.")
 
     return user
 
 
-def search_user(field: str, key, with_id=False):
-    """Search a user in the database"""
+async def search_user(field: str, key, with_id=False):
+    """Search a user in the database, the concurrent searches of the same user share one query"""
     try:
-        found = db_client.users.find_one({field: key})
+        found = await single_flight.run("user", (field, str(key)),
+                                        lambda: users_repository.find_one(field, key))
 
         if not found:
             return None
@@ -71,3 +145,12 @@ def search_user(field: str, key, with_id=False):
         return {"error": f"Invalid database operation: {e}"}
     except PyMongoError as e:
         return {"error": f"Unexpected MongoDB error: {e}"}
+
+
+def duplicated_user_exception(error: DuplicateKeyError) -> HTTPException:
+    """The error returned when the email or the username already exist"""
+    field = "username" if "username" in (error.details or {}).get("keyPattern", {}) else "email"
+
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"The user exists, please choose another {field}.")
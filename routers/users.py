@@ -1,18 +1,23 @@
 """Users module"""
 
-from datetime import datetime, timedelta, timezone
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from bson import ObjectId
-import jwt
-from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation
-from db.models.user import User, NewUser, PasswordUpdateRequest
-from db.schemas.user import user_schema, users_schema
-from db.client import db_client
-from routers.helpers.users_helper import secret_key, algorithm, access_token_duration, pwd_context
-from routers.helpers.users_helper import get_current_user, search_user
-from routers.helpers.helper import check_id
+from pymongo.errors import PyMongoError, OperationFailure, ConnectionFailure, InvalidOperation, DuplicateKeyError
+from db.models.user import User, NewUser, PasswordUpdateRequest, RefreshRequest
+from db.schemas.user import user_schema, USER_FIELDS
+from db.repository import users_repository
+from routers.helpers.users_helper import get_current_user, search_user, duplicated_user_exception
+from routers.helpers.users_helper import create_tokens, decode_token, credentials_exception, token_lifetime
+from routers.helpers.users_helper import REFRESH_TOKEN
+from routers.helpers.denylist_helper import revoke_user_tokens
+from routers.helpers.singleflight_helper import single_flight
+from routers.helpers.throttle_helper import password_throttle
+from routers.helpers.password_helper import hash_password, verify_and_update_password, fake_verify_password
+from routers.helpers.password_helper import password_pool
+from routers.helpers.helper import check_cursor, check_id, json_response, ndjson_response, wants_ndjson, MAX_PAGE_SIZE
+from routers.helpers.helper import sparse_fields
 
 router = APIRouter(prefix="/user",
                    tags=["user"],
@@ -20,9 +25,31 @@ router = APIRouter(prefix="/user",
 
 
 @router.get("/", response_model=list[User])
-async def users(_: Annotated[User, Depends(get_current_user)],):
-    """Get all users from the database"""
-    return users_schema(db_client.users.find())
+async def users(_: Annotated[User, Depends(get_current_user)],
+                limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+                cursor: str | None = None,
+                fields: Annotated[str | None, Query(description=f"Some of: {', '.join(USER_FIELDS)}")] = None,
+                accept: Annotated[str | None, Header()] = None):
+    """Get a page of users from the database, the cursor of the next page is in
+       the X-Next-Cursor header. With the header Accept: application/x-ndjson
+       all the users are streamed one per line. With fields=id,username only
+       those fields are read and returned"""
+    check_cursor(cursor)
+    projection, schema = sparse_fields(fields, USER_FIELDS, user_schema)
+
+    if wants_ndjson(accept):
+        return ndjson_response(users_repository.stream(limit, cursor, projection), schema)
+
+    page, next_cursor = await users_repository.find_page(limit, cursor, projection)
+
+    return json_response([schema(user) for user in page],
+                         headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+
+@router.get("/password/metrics")
+async def password_metrics(_: Annotated[User, Depends(get_current_user)]):
+    """Get the state of the pool that hashes and verifies passwords"""
+    return password_pool.metrics()
 
 
 @router.get("/{user_id}")  # Path
@@ -30,29 +57,30 @@ async def get_user(user_id: str, _: Annotated[User, Depends(get_current_user)]):
     """Get the user from the database based on the Id"""
     check_id(user_id)
 
-    return search_user("_id", ObjectId(user_id))
+    return await search_user("_id", ObjectId(user_id))
 
 
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
-async def save_user(user: NewUser):
-    """Saving a new user in the database if the email is unique,
+async def save_user(user: NewUser, request: Request):
+    """Saving a new user in the database if the email and username are unique,
        it's not necesary to be authenticated"""
-
-    if isinstance(search_user("email", user.email), User):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="The user exists, please choose another email.")
+    await password_throttle.check(request)
 
     user_dict = dict(user)
 
     # Encrypt the password
-    user_dict["password"] = pwd_context.hash(user_dict["password"])
+    user_dict["password"] = await hash_password(user_dict["password"])
 
-    inserted_id = db_client.users.insert_one(user_dict).inserted_id
+    # The unique indexes reject the duplicated users
+    try:
+        inserted_id = await users_repository.insert(user_dict)
+    except DuplicateKeyError as e:
+        raise duplicated_user_exception(e) from e
+    single_flight.invalidate("user")
 
-    new_user = user_schema(db_client.users.find_one({"_id": inserted_id}))
+    new_user = await users_repository.find_one("_id", inserted_id)
 
-    return User(**new_user)
+    return json_response(user_schema(new_user), status_code=status.HTTP_201_CREATED)
 
 
 @router.put("/", response_model=User)
@@ -64,7 +92,9 @@ async def update_user(user: User, _: Annotated[User, Depends(get_current_user)])
     del user_dict["id"]
 
     try:
-        found = db_client.users.update_one({"_id": ObjectId(user.id)}, {"$set": user_dict})
+        modified = await users_repository.update(ObjectId(user.id), user_dict)
+    except DuplicateKeyError as e:
+        raise duplicated_user_exception(e) from e
     except OperationFailure as e:
         return {"error": f"Database operation failed: {e}"}
     except ConnectionFailure as e:
@@ -74,24 +104,32 @@ async def update_user(user: User, _: Annotated[User, Depends(get_current_user)])
     except PyMongoError as e:
         return {"error": f"Unexpected MongoDB error: {e}"}
 
-    if found.modified_count == 0:
+    if modified == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    return search_user("_id", ObjectId(user.id))
+    # The searches in flight could return the old user
+    single_flight.invalidate("user")
+
+    # The tokens have the old username and email
+    await revoke_user_tokens(user.id, token_lifetime())
+
+    return await search_user("_id", ObjectId(user.id))
 
 
 @router.patch("/password/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def update_password(user_id: str, request: PasswordUpdateRequest, _: Annotated[User, Depends(get_current_user)]):
+async def update_password(user_id: str, request: PasswordUpdateRequest, http_request: Request,
+                          user: Annotated[User, Depends(get_current_user)]):
     """Update the password from the database based on the Id"""
     check_id(user_id) # Check if an Id is not a valid Id for ObjectId
+    await password_throttle.check(http_request, user.username)
 
     # The data I want to update
     user_dict = {
-        "password": pwd_context.hash(request.password)
+        "password": await hash_password(request.password)
     }
 
     try:
-        found = db_client.users.update_one({"_id": ObjectId(user_id)}, {"$set": user_dict})
+        modified = await users_repository.update(ObjectId(user_id), user_dict)
     except OperationFailure as e:
         return {"error": f"Database operation failed: {e}"}
     except ConnectionFailure as e:
@@ -101,8 +139,12 @@ async def update_password(user_id: str, request: PasswordUpdateRequest, _: Annot
     except PyMongoError as e:
         return {"error": f"Unexpected MongoDB error: {e}"}
 
-    if found.modified_count == 0:
+    if modified == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    single_flight.invalidate("user")
+
+    # The sessions opened with the old password are closed
+    await revoke_user_tokens(user_id, token_lifetime())
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -110,28 +152,54 @@ async def delete_user(user_id: str, _: Annotated[User, Depends(get_current_user)
     """Delete the user from the database based on the Id"""
     check_id(user_id) # Check if an Id is not a valid Id for ObjectId
 
-    found = db_client.users.find_one_and_delete({"_id": ObjectId(user_id)})
+    found = await users_repository.delete(ObjectId(user_id))
 
     if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    single_flight.invalidate("user")
+
+    await revoke_user_tokens(user_id, token_lifetime())
 
 
 @router.post("/login")
-async def login(form: Annotated[OAuth2PasswordRequestForm, Depends()],):
-    """This method allow you to login in the app"""
-    user = search_user("username", form.username, True)
+async def login(form: Annotated[OAuth2PasswordRequestForm, Depends()], request: Request):
+    """This method allow you to login in the app, the client IP and the username
+       are throttled before checking the password and the password is hashed
+       again if the bcrypt cost changed"""
+    await password_throttle.check(request, form.username)
+
+    user = await search_user("username", form.username, True)
     if not user:
+        # Without hashing, but as slow as a wrong password
+        await fake_verify_password()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Username is incorrect")
 
-    if not pwd_context.verify(form.password, user.password):
+    valid, new_hash = await verify_and_update_password(form.password, user.password)
+    if not valid:
+        await password_throttle.failed(form.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Please verify your credentials")
 
-    access_token = {"sub": user.username,
-                    "exp": datetime.now(timezone.utc) + timedelta(minutes=access_token_duration)}
+    await password_throttle.succeeded(form.username)
+
+    # The hash had an old cost, the password is only known now to hash it again
+    if new_hash:
+        await users_repository.update(ObjectId(user.id), {"password": new_hash})
+        single_flight.invalidate("user")
+
+    return create_tokens(user)
+
+
+@router.post("/refresh")
+async def refresh(request: RefreshRequest):
+    """Get new tokens with the refresh token, the user is read again so the
+       new access token has the current username and email"""
+    claims = decode_token(request.refresh_token, REFRESH_TOKEN)
+
+    user = await search_user("_id", ObjectId(claims["uid"])) if ObjectId.is_valid(claims.get("uid")) else None
+    if not isinstance(user, User):
+        raise credentials_exception()
+
+    return create_tokens(user)
 
-    return {
-        "access_token": jwt.encode(access_token, secret_key, algorithm=algorithm),
-        "token_type": "bearer"
-    }
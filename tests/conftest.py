@@ -0,0 +1,19 @@
+"""Test configuration"""
+
+import os
+
+# The tests run against the in-process MongoDB stand-in unless TEST_MONGO_URI is set
+os.environ["MONGO_URI"] = os.getenv("TEST_MONGO_URI", "mongomock://localhost")
+# The users and the assets can be kept in memory with TEST_REPOSITORY_BACKEND=memory
+os.environ["REPOSITORY_BACKEND"] = os.getenv("TEST_REPOSITORY_BACKEND", "mongo")
+os.environ.setdefault("SECRET_KEY", "asset_map_test_secret_key_0123456789")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_DURATION", "30")
+os.environ.setdefault("ADMIN_USERNAMES", "test_admin_user")
+os.environ.setdefault("SNAPSHOT_INTERVAL_MINUTES", "0")
+os.environ.setdefault("ROLLUP_INTERVAL_MINUTES", "0")
+# The lowest bcrypt cost keeps the tests fast
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The tests log in many times from the same client, the throttle is tested with its own limits
+os.environ.setdefault("THROTTLE_IP_PER_MINUTE", "0")
+os.environ.setdefault("THROTTLE_USERNAME_PER_MINUTE", "0")
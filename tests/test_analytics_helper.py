@@ -0,0 +1,64 @@
+"""Testing the portfolio analytics"""
+
+import pytest
+from db.models.analytics import TargetAllocation
+from routers.helpers.analytics_helper import Holdings, analyze, batch_analyze, rebalance
+
+def test_analyze():
+    """
+    Test case to verify the concentration of a portfolio.
+    """
+    holdings = Holdings(["AAA", "BBB", "CCC"], [6, 3, 1], [10.0, 10.0, 10.0])
+
+    result = analyze(holdings, top=1)
+
+    assert result.total == 100
+    assert result.concentration_index == pytest.approx(0.36 + 0.09 + 0.01)
+    assert result.effective_holdings == pytest.approx(1 / 0.46)
+    assert result.top_exposure == pytest.approx(60)
+
+def test_analyze_without_money():
+    """
+    Test case to verify the analytics of an empty portfolio.
+    """
+    result = analyze(Holdings([], [], []), top=5)
+
+    assert (result.total, result.concentration_index, result.effective_holdings) == (0, 0, 0)
+
+def test_rebalance():
+    """
+    Test case to verify the trades needed to reach the targets.
+    """
+    holdings = Holdings(["AAA", "BBB"], [8, 2], [10.0, 10.0])
+    targets = [TargetAllocation(mnemonic="AAA", percentage=50),
+               TargetAllocation(mnemonic="NEW", percentage=25),
+               TargetAllocation(mnemonic="UNKNOWN", percentage=25)]
+
+    trades = {trade.mnemonic: trade for trade in rebalance(holdings, targets, {"NEW": 5.0})}
+
+    assert (trades["AAA"].value, trades["AAA"].shares) == (-30, -3)
+    assert (trades["BBB"].value, trades["BBB"].shares) == (-20, -2)
+    assert (trades["NEW"].value, trades["NEW"].shares) == (25, 5)
+    assert (trades["UNKNOWN"].value, trades["UNKNOWN"].shares) == (25, None)
+
+def test_batch_analyze_matches_single_user():
+    """
+    Test case to verify that the batch mode gives the same result as each portfolio.
+    """
+    portfolios = {"u1": (["AAA", "BBB", "CCC"], [6, 3, 1], [10.0, 20.0, 5.0]),
+                  "u2": (["AAA"], [4], [0.0]),
+                  "u3": (["BBB", "DDD"], [1, 1], [30.0, 10.0])}
+    rows = [(user_id, mnemonic, shares, price)
+            for user_id, columns in portfolios.items() for mnemonic, shares, price in zip(*columns)]
+    rows.reverse()
+    holdings = Holdings([row[1] for row in rows], [row[2] for row in rows],
+                        [row[3] for row in rows], [row[0] for row in rows])
+
+    columns = batch_analyze(holdings, top=2)
+
+    for i, user_id in enumerate(columns["user_ids"]):
+        expected = analyze(Holdings(*portfolios[user_id]), top=2)
+        assert columns["total"][i] == pytest.approx(expected.total)
+        assert columns["holdings"][i] == expected.holdings
+        assert columns["concentration_index"][i] == pytest.approx(expected.concentration_index)
+        assert columns["top_exposure"][i] == pytest.approx(expected.top_exposure)
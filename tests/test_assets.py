@@ -0,0 +1,592 @@
+"""Testing all Asset module endpoints"""
+
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import jwt
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from main import app
+from db.client import db_client
+from db.repository import users_repository, assets_repository
+from routers.helpers.users_helper import secret_key, algorithm
+from routers.helpers.portfolio_helper import rebuild_summaries, portfolio_stream, check_versions
+from routers.helpers.events_helper import EventHub, portfolio_hub, RESYNC
+from routers.helpers.rollups_helper import refresh_rollups
+from routers.helpers.history_helper import HISTORY_COLLECTION, take_snapshots, run_due_snapshot
+
+client = TestClient(app)
+
+user_dict = {
+    "username": "test_asset_user",
+    "email": "test_asset_email@gmail.com",
+    "password": "test_password"
+}
+
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    """Start the app once so the tests and the helpers share its event loop"""
+    with client:
+        yield
+
+@pytest.fixture(name="headers")
+def fixture_headers():
+    """Create a user for the test and return the authorization headers"""
+    user_id = client.portal.call(insert_user, user_dict.copy())
+    yield auth_headers(user_dict["username"])
+    #Cleaning up
+    client.portal.call(remove_user, user_id)
+
+@pytest.fixture(name="admin_headers")
+def fixture_admin_headers():
+    """Create an admin user for the test and return the authorization headers"""
+    admin_dict = {"username": "test_admin_user", "email": "test_admin@gmail.com", "password": "-"}
+    user_id = client.portal.call(insert_user, admin_dict)
+    yield auth_headers(admin_dict["username"])
+    #Cleaning up
+    client.portal.call(remove_user, user_id)
+
+def test_asset_list_not_authenticated():
+    """
+    Test case to verify that an unauthenticated user cannot access the asset list endpoint.
+    """
+    response = client.get("/asset/")
+    assert response.status_code == 401
+    assert response.json() == {'detail': 'Not authenticated'}
+
+def test_create_asset_failed(headers):
+    """
+    Test case to fail creating a duplicated asset or an asset without a mnemonic.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+
+    response = client.post("/asset/", headers=headers,
+                           json={"mnemonic": "AAA", "price": 12.0, "shares": 1})
+
+    assert response.status_code == 404
+    assert response.json()['detail'] == "The asset exists, please choose another mnemonic."
+
+    response = client.post("/asset/", headers=headers,
+                           json={"mnemonic": "", "price": 12.0, "shares": 1})
+
+    assert response.status_code == 422
+    assert len(client.get("/asset/", headers=headers).json()) == 1
+
+def test_asset_list_pages(headers):
+    """
+    Test case to verify that the asset list is paginated with a cursor.
+    """
+    save_assets(headers, [(f"M{i}", 1.0, i) for i in range(5)])
+
+    mnemonics = []
+    response = client.get("/asset/?limit=2", headers=headers)
+    while True:
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        mnemonics += [asset["mnemonic"] for asset in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        response = client.get(f"/asset/?limit=2&cursor={response.headers['X-Next-Cursor']}",
+                              headers=headers)
+
+    assert mnemonics == ["M0", "M1", "M2", "M3", "M4"]
+
+    response = client.get("/asset/?cursor=not-a-cursor", headers=headers)
+    assert response.status_code == 400
+
+def test_asset_list_ndjson(headers):
+    """
+    Test case to verify that the asset list can be streamed as NDJSON.
+    """
+    save_assets(headers, [(f"M{i}", 1.0, i) for i in range(3)])
+
+    response = client.get("/asset/", headers={**headers, "Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["mnemonic"] for line in lines] == ["M0", "M1", "M2"]
+    assert set(lines[0]) == {"id", "user_id", "mnemonic", "price", "shares", "avg_price"}
+
+def test_bulk_import_csv(headers):
+    """
+    Test case to verify the bulk import of a CSV file with some wrong rows.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+    body = "mnemonic,price,shares\nBBB,25.5,2\nAAA,11,1\nCCC,not_a_price,3\n\nDDD,1,10\n"
+
+    response = client.post("/asset/bulk", headers={**headers, "Content-Type": "text/csv"},
+                           content=body)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (2, 0, 2)
+    assert [(row["row"], row["mnemonic"], row["status"]) for row in report["rows"]] == [
+        (1, "BBB", "inserted"), (2, "AAA", "duplicated"), (3, "CCC", "invalid"), (4, "DDD", "inserted")]
+    assert len(client.get("/asset/portfolio", headers=headers).json()) == 3
+
+def test_bulk_import_ndjson_upsert(headers):
+    """
+    Test case to verify the bulk import of a NDJSON body updating the existing assets.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+    body = '{"mnemonic": "AAA", "price": 20.0, "shares": 5}\n{"mnemonic": "BBB", "price": 100, "shares": 1}\nnot json'
+
+    response = client.post("/asset/bulk?upsert=true",
+                           headers={**headers, "Content-Type": "application/x-ndjson"}, content=body)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 1, 1)
+    assert client.get("/asset/portfolio?sort=mnemonic", headers=headers).json() == [
+        {"mnemonic": "AAA", "percentage": 50.0}, {"mnemonic": "BBB", "percentage": 50.0}]
+
+    response = client.post("/asset/bulk", headers={**headers, "Content-Type": "application/json"},
+                           content="[]")
+    assert response.status_code == 415
+
+def test_portfolio(headers):
+    """
+    Test case to verify the percentage of each asset in the portfolio.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BBB", 25.0, 2), ("CCC", 1.0, 0)])
+
+    response = client.get("/asset/portfolio", headers=headers)
+
+    assert response.status_code == 200
+    assert sorted((item["mnemonic"], item["percentage"]) for item in response.json()) == [
+        ("AAA", 50.0), ("BBB", 50.0), ("CCC", 0.0)]
+
+def test_portfolio_top_and_sort(headers):
+    """
+    Test case to verify that the portfolio can group the smallest assets.
+    """
+    save_assets(headers, [("AAA", 10.0, 6), ("BBB", 10.0, 3), ("CCC", 10.0, 1)])
+
+    response = client.get("/asset/portfolio?top=1", headers=headers)
+    assert response.json() == [{"mnemonic": "AAA", "percentage": 60.0},
+                               {"mnemonic": "OTHER", "percentage": 40.0}]
+
+    response = client.get("/asset/portfolio?top=2&sort=mnemonic", headers=headers)
+    assert [item["mnemonic"] for item in response.json()] == ["AAA", "BBB", "OTHER"]
+
+    response = client.get("/asset/portfolio?sort=percentage", headers=headers)
+    assert [item["mnemonic"] for item in response.json()] == ["AAA", "BBB", "CCC"]
+
+def test_portfolio_empty_and_zero(headers):
+    """
+    Test case to verify the portfolio without assets or without money.
+    """
+    response = client.get("/asset/portfolio", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
+
+    save_assets(headers, [("AAA", 0.0, 5)])
+    response = client.get("/asset/portfolio?top=1", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{"mnemonic": "AAA", "percentage": 0.0}]
+
+def test_portfolio_summary_follows_asset_changes(headers):
+    """
+    Test case to verify that the portfolio summary is updated on every asset change.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BRK.B", 25.0, 2)])
+    asset = client.get("/asset/", headers=headers).json()[0]
+
+    asset["shares"] = 15
+    response = client.put("/asset/", headers=headers, json=asset)
+    assert response.status_code == 200
+    response = client.get("/asset/portfolio?sort=mnemonic", headers=headers)
+    assert response.json() == [{"mnemonic": "AAA", "percentage": 75.0},
+                               {"mnemonic": "BRK.B", "percentage": 25.0}]
+
+    response = client.delete(f"/asset/{asset['id']}", headers=headers)
+    assert response.status_code == 204
+    response = client.get("/asset/portfolio", headers=headers)
+    assert response.json() == [{"mnemonic": "BRK.B", "percentage": 100.0}]
+
+    assert client.portal.call(rebuild_summaries, None, True) == []
+
+def test_trade(headers):
+    """
+    Test case to verify the buys and sells of an asset, the average price and the summaries.
+    """
+    save_assets(headers, [("AAA", 10.0, 10), ("BBB", 5.0, 4)])
+    asset = client.get("/asset/", headers=headers).json()[0]
+    url = f"/asset/{asset['id']}/trade"
+
+    response = client.post(url, headers=headers, json={"side": "buy", "shares": 10, "price": 20.0})
+    assert response.status_code == 200
+    assert (response.json()["shares"], response.json()["price"], response.json()["avg_price"]) == (20, 10.0, 15.0)
+
+    response = client.post(url, headers=headers, json={"side": "sell", "shares": 5, "price": 30.0})
+    assert (response.json()["shares"], response.json()["price"], response.json()["avg_price"]) == (15, 10.0, 15.0)
+    assert client.get("/asset/", headers=headers).json()[0] == response.json()
+
+    response = client.post(url, headers=headers, json={"side": "sell", "shares": 16, "price": 30.0})
+    assert response.status_code == 409
+    response = client.post(url, headers=headers, json={"side": "sell", "shares": 0, "price": 30.0})
+    assert response.status_code == 422
+    response = client.post("/asset/66a0f0f0f0f0f0f0f0f0f0f0/trade", headers=headers,
+                           json={"side": "buy", "shares": 1, "price": 1.0})
+    assert response.status_code == 404
+
+    assert client.get("/asset/portfolio?sort=mnemonic", headers=headers).json() == [
+        {"mnemonic": "AAA", "percentage": pytest.approx(150 / 170 * 100)},
+        {"mnemonic": "BBB", "percentage": pytest.approx(20 / 170 * 100)}]
+    assert client.portal.call(rebuild_summaries, None, True) == []
+
+def test_portfolio_events(headers, admin_headers):
+    """
+    Test case to verify that the event stream sends the portfolio and then the changes of the assets and prices.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+    asset = client.get("/asset/", headers=headers).json()[0]
+    assert client.get("/asset/portfolio/events").status_code == 401
+
+    events = portfolio_stream(asset["user_id"])
+    event = read_event(events)
+    assert event["event"] == "portfolio"
+    assert event["data"]["items"] == [{"mnemonic": "AAA", "value": 50.0, "percentage": 100.0}]
+
+    save_assets(headers, [("BBB", 25.0, 2)])
+    event = read_event(events)
+    assert event["event"] == "delta"
+    assert int(event["id"]) == event["data"]["version"]
+    assert (event["data"]["total"], event["data"]["changed"], event["data"]["removed"]) == (
+        100.0, [{"mnemonic": "BBB", "value": 50.0, "percentage": 50.0}], [])
+
+    client.delete(f"/asset/{asset['id']}", headers=headers)
+    assert read_event(events)["data"]["removed"] == ["AAA"]
+
+    client.post("/asset/prices", headers=admin_headers, json=[{"mnemonic": "BBB", "price": 30.0}])
+    event = read_event(events)
+    assert event["event"] == "portfolio"
+    assert event["data"]["items"] == [{"mnemonic": "BBB", "value": 60.0, "percentage": 100.0}]
+
+    client.portal.call(events.aclose)
+    assert portfolio_hub.metrics()["subscribers"] == 0
+
+def test_portfolio_events_first_asset(headers):
+    """
+    Test case to verify that a stream opened before the first asset of the user gets it right away.
+    """
+    user_id = str(client.portal.call(users_repository.find_one, "username", user_dict["username"])["_id"])
+    events = portfolio_stream(user_id)
+    assert read_event(events)["data"] == {"version": 0, "total": 0, "items": []}
+
+    save_assets(headers, [("AAA", 10.0, 5)])
+    # Sooner than the version check of versions_loop
+    event = read_event(events, timeout=1)
+    assert (event["event"], event["data"]["version"]) == ("portfolio", 1)
+    assert event["data"]["items"] == [{"mnemonic": "AAA", "value": 50.0, "percentage": 100.0}]
+
+    client.portal.call(events.aclose)
+
+def test_portfolio_events_from_other_workers(headers):
+    """
+    Test case to verify that the version check resyncs only the streams whose portfolio was changed elsewhere.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+    user_id = client.get("/asset/", headers=headers).json()[0]["user_id"]
+    events = portfolio_stream(user_id)
+    version = read_event(events)["data"]["version"]
+    assert client.portal.call(check_versions) == 0
+
+    # Another worker changes the summary, this one doesn't publish anything
+    client.portal.call(db_client.portfolios.update_one, {"_id": user_id}, {"$inc": {"version": 1}})
+    assert client.portal.call(check_versions) == 1
+    event = read_event(events)
+    assert (event["event"], event["data"]["version"]) == ("portfolio", version + 1)
+    assert client.portal.call(check_versions) == 0
+
+    client.portal.call(events.aclose)
+    assert portfolio_hub.version(user_id) == 0
+
+def test_event_hub_slow_subscriber():
+    """
+    Test case to verify that a subscriber with a full queue gets a resync instead of the missed events.
+    """
+    hub = EventHub(queue_size=2)
+    with hub.subscribe("u1") as queue, hub.subscribe("u1") as other:
+        for version in range(3):
+            hub.publish("u1", "delta", {"version": version})
+        hub.publish("u2", "delta", {"version": 0})
+        other.get_nowait()
+
+        assert hub.subscribed(["u1", "u2"]) == ["u1"]
+        hub.seen("u1", 3)
+        hub.seen("u1", 2)
+        hub.seen("u2", 5)
+        assert (hub.version("u1"), hub.version("u2")) == (3, 0)
+        assert [queue.get_nowait() for _ in range(queue.qsize())] == [RESYNC]
+    assert hub.metrics() == {"channels": 0, "subscribers": 0}
+
+def test_conditional_get(headers):
+    """
+    Test case to verify the ETag of the assets and the portfolio and the 304 responses.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BBB", 25.0, 2)])
+
+    for url in ("/asset/", "/asset/portfolio"):
+        response = client.get(url, headers=headers)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+        response = client.get(f"{url}?limit=1", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+
+    etags = [client.get(url, headers=headers).headers["ETag"] for url in ("/asset/", "/asset/portfolio")]
+    asset = client.get("/asset/", headers=headers).json()[0]
+    client.put("/asset/", headers=headers, json={**asset, "price": 20.0})
+
+    for url, etag in zip(("/asset/", "/asset/portfolio"), etags):
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+    assert client.get("/asset/", headers=headers).json()[0]["price"] == 20.0
+
+    etag = client.get("/asset/", headers=headers).headers["ETag"]
+    response = client.post("/asset/bulk?upsert=true", headers={**headers, "Content-Type": "text/csv"},
+                           content="mnemonic,price,shares\nAAA,5.0,20\n")
+    assert response.status_code == 200
+    assert client.get("/asset/", headers={**headers, "If-None-Match": etag}).status_code == 200
+
+def test_rebuild_portfolio_summaries(headers):
+    """
+    Test case to verify that the drift of a summary is reported and fixed.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BBB", 25.0, 2)])
+    user_id = client.get("/asset/", headers=headers).json()[0]["user_id"]
+    client.portal.call(db_client.portfolios.update_one,
+                       {"_id": user_id}, {"$inc": {"total": 10, "items.AAA.value": 10}})
+
+    report = client.portal.call(rebuild_summaries, None, True)
+    assert [(item["user_id"], item["drift"]) for item in report] == [(user_id, ["AAA", "total"])]
+
+    client.portal.call(rebuild_summaries)
+    assert client.portal.call(rebuild_summaries, None, True) == []
+
+def test_update_prices(headers, admin_headers):
+    """
+    Test case to verify that a price feed updates the assets and the portfolio of every holder, not the price paid.
+    """
+    save_assets(headers, [("AAA", 10.0, 4), ("BBB", 50.0, 1)])
+    save_assets(admin_headers, [("AAA", 12.0, 1)])
+    asset = next(asset for asset in client.get("/asset/", headers=headers).json() if asset["mnemonic"] == "AAA")
+    client.post(f"/asset/{asset['id']}/trade", headers=headers, json={"side": "buy", "shares": 1, "price": 15.0})
+    quotes = [{"mnemonic": "AAA", "price": 20.0}, {"mnemonic": "ZZZ", "price": 1.0}]
+
+    response = client.post("/asset/prices", headers=headers, json=quotes)
+    assert response.status_code == 403
+
+    response = client.post("/asset/prices", headers=admin_headers, json=quotes)
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["quotes"], result["assets_modified"], result["portfolios_refreshed"]) == (2, 2, 2)
+
+    assert sorted((asset["mnemonic"], asset["price"], asset["avg_price"])
+                  for asset in client.get("/asset/", headers=headers).json()) == [("AAA", 20.0, 11.0),
+                                                                                   ("BBB", 50.0, None)]
+    assert client.get("/asset/portfolio?sort=mnemonic", headers=headers).json() == [
+        {"mnemonic": "AAA", "percentage": 200 / 3}, {"mnemonic": "BBB", "percentage": 100 / 3}]
+    assert client.portal.call(rebuild_summaries, None, True) == []
+
+    response = client.post("/asset/prices", headers=admin_headers, json=quotes[:1])
+    assert response.json()["version"] == result["version"] + 1
+
+def test_analytics_and_rebalance(headers):
+    """
+    Test case to verify the analytics and the rebalance endpoints.
+    """
+    save_assets(headers, [("AAA", 10.0, 8), ("BBB", 10.0, 2)])
+
+    response = client.get("/asset/analytics?top=1", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["total"] == 100
+    assert response.json()["top_exposure"] == 80
+
+    targets = [{"mnemonic": "AAA", "percentage": 50}, {"mnemonic": "BBB", "percentage": 50}]
+    response = client.post("/asset/rebalance", headers=headers, json=targets)
+    assert response.status_code == 200
+    assert [(trade["mnemonic"], trade["shares"]) for trade in response.json()] == [("AAA", -3), ("BBB", 3)]
+
+    response = client.post("/asset/rebalance", headers=headers, json=targets[:1])
+    assert response.status_code == 400
+
+def test_portfolio_history(headers):
+    """
+    Test case to verify the history of the portfolio downsampled by the database.
+    """
+    save_assets(headers, [("AAA", 10.0, 5)])
+    user_id = client.get("/asset/", headers=headers).json()[0]["user_id"]
+    # Wednesday 3, Sunday 7 and Monday 8 of January, and 1 of February
+    days = [datetime(2024, 1, 3, 12), datetime(2024, 1, 7, 12), datetime(2024, 1, 8, 12),
+            datetime(2024, 2, 1, 12)]
+    for value, day in enumerate(days, start=1):
+        client.portal.call(db_client[HISTORY_COLLECTION].insert_one,
+                           {"ts": day, "user_id": user_id, "total": value * 10.0, "weights": {"AAA": 100.0}})
+    params = "start=2024-01-01T00:00:00Z&end=2024-12-31T00:00:00Z"
+
+    response = client.get(f"/asset/portfolio/history?{params}&interval=week", headers=headers)
+    assert response.status_code == 200
+    assert [(point["ts"][:10], point["total"]) for point in response.json()] == [
+        ("2024-01-01", 20.0), ("2024-01-08", 30.0), ("2024-01-29", 40.0)]
+
+    response = client.get(f"/asset/portfolio/history?{params}&interval=month&weights=true", headers=headers)
+    assert [(point["ts"][:10], point["total"], point["weights"]) for point in response.json()] == [
+        ("2024-01-01", 30.0, {"AAA": 100.0}), ("2024-02-01", 40.0, {"AAA": 100.0})]
+
+    response = client.get(f"/asset/portfolio/history?{params}&interval=raw", headers=headers)
+    assert [point["total"] for point in response.json()] == [10.0, 20.0, 30.0, 40.0]
+
+    response = client.get(f"/asset/portfolio/history?{params}&interval=day", headers=headers)
+    assert len(response.json()) == 4
+
+def test_portfolio_snapshots(headers):
+    """
+    Test case to verify that the snapshot job saves every portfolio once by interval.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BBB", 50.0, 1)])
+    client.portal.call(db_client.jobs.delete_many, {})
+
+    assert client.portal.call(run_due_snapshot, timedelta(days=1))
+    assert not client.portal.call(run_due_snapshot, timedelta(days=1))
+    assert client.portal.call(take_snapshots) >= 1
+
+    response = client.get("/asset/portfolio/history?interval=raw&weights=true", headers=headers)
+    assert [point["weights"] for point in response.json()] == [{"AAA": 50.0, "BBB": 50.0}] * 2
+
+def test_rollups(headers, admin_headers):
+    """
+    Test case to verify that the rollups follow the asset writes, the bulk imports and the price feeds.
+    """
+    save_assets(headers, [("AAA", 10.0, 5), ("BBB", 50.0, 1)])
+    save_assets(admin_headers, [("AAA", 12.0, 1)])
+
+    assert client.get("/asset/rollups", headers=headers).status_code == 403
+    response = client.get("/asset/rollups", headers=admin_headers)
+    assert response.status_code == 200
+    assert [(item["mnemonic"], item["shares"], item["value"], item["users"]) for item in response.json()] == [
+        ("AAA", 6, 62.0, 2), ("BBB", 1, 50.0, 1)]
+
+    asset = next(asset for asset in client.get("/asset/", headers=headers).json() if asset["mnemonic"] == "BBB")
+    client.put("/asset/", headers=headers, json={**asset, "mnemonic": "CCC"})
+    client.post("/asset/bulk?upsert=true", headers={**headers, "Content-Type": "text/csv"},
+                content="mnemonic,price,shares\nAAA,10.0,10\nDDD,1.0,3\n")
+    client.post("/asset/prices", headers=admin_headers, json=[{"mnemonic": "CCC", "price": 40.0}])
+
+    response = client.get("/asset/rollups/AAA", headers=admin_headers)
+    assert (response.json()["shares"], response.json()["value"], response.json()["users"]) == (11, 112.0, 2)
+    assert client.get("/asset/rollups/BBB", headers=admin_headers).status_code == 404
+    assert client.get("/asset/rollups/CCC", headers=admin_headers).json()["value"] == 40.0
+    assert [item["mnemonic"] for item in client.get("/asset/rollups?sort=shares&limit=2",
+                                                    headers=admin_headers).json()] == ["AAA", "DDD"]
+
+    response = client.post("/asset/rollups/reconcile?dry_run=true", headers=admin_headers)
+    assert response.json() == []
+
+    client.portal.call(db_client.rollups.update_one, {"_id": "AAA"}, {"$inc": {"users": 1}})
+    response = client.post("/asset/rollups/reconcile", headers=admin_headers)
+    assert response.json() == [{"mnemonic": "AAA", "drift": ["users"]}]
+    assert client.get("/asset/rollups/AAA", headers=admin_headers).json()["users"] == 2
+
+def test_asset_list_fields(headers):
+    """
+    Test case to verify that fields= returns only the asked fields in the pages and the NDJSON stream.
+    """
+    save_assets(headers, [(f"M{i}", 1.0, i) for i in range(3)])
+
+    response = client.get("/asset/?fields=shares,mnemonic&limit=2", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{"mnemonic": "M0", "shares": 0}, {"mnemonic": "M1", "shares": 1}]
+    response = client.get(f"/asset/?fields=shares,mnemonic&cursor={response.headers['X-Next-Cursor']}",
+                          headers=headers)
+    assert response.json() == [{"mnemonic": "M2", "shares": 2}]
+
+    response = client.get("/asset/?fields=id,price", headers={**headers, "Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [set(line) for line in lines] == [{"id", "price"}] * 3
+    assert all(ObjectId.is_valid(line["id"]) for line in lines)
+
+    for fields in ("password", "mnemonic,user", ","):
+        assert client.get(f"/asset/?fields={fields}", headers=headers).status_code == 400
+
+def test_compressed_responses(headers):
+    """
+    Test case to verify that the big responses are compressed with gzip and keep a weak ETag that gets a 304.
+    """
+    save_assets(headers, [(f"MNEMONIC{i}", 1.5, i) for i in range(30)])
+
+    response = client.get("/asset/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(response.content)
+    assert len(response.json()) == 30
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/asset/", headers={**headers, "Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = client.get("/asset/", headers={**headers, "Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == etag.removeprefix("W/")
+
+    response = client.get("/asset/?fields=mnemonic&limit=1", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+    response = client.get("/asset/", headers={**headers, "Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert len(response.json()) == 30
+
+    response = client.get("/asset/", headers={**headers, "Accept-Encoding": "gzip",
+                                              "Accept": "application/x-ndjson"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert len(response.text.splitlines()) == 30
+
+# HELPER #
+
+def auth_headers(username: str) -> dict:
+    """Authorization headers with a valid token for the user"""
+
+    access_token = {"sub": username, "exp": datetime.now(timezone.utc) + timedelta(minutes=5)}
+    return {"Authorization": f"Bearer {jwt.encode(access_token, secret_key, algorithm=algorithm)}"}
+
+def read_event(events, timeout: float | None = None) -> dict:
+    """Read the next Server-Sent Event of the stream, waiting at most timeout seconds"""
+
+    message = client.portal.call(asyncio.wait_for, events.__anext__(), timeout).decode()
+    event = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    event["data"] = json.loads(event["data"])
+    return event
+
+def save_assets(headers: dict, assets: list):
+    """Saving the assets using the endpoint"""
+
+    for mnemonic, price, shares in assets:
+        response = client.post("/asset/", headers=headers,
+                               json={"mnemonic": mnemonic, "price": price, "shares": shares})
+        assert response.status_code == 201
+
+async def insert_user(user: dict):
+    """Inserting the user using the app event loop"""
+
+    return str(await users_repository.insert(user))
+
+async def remove_user(user_id: str):
+    """Removing the user and their assets using the app event loop"""
+
+    assets = [asset async for asset in assets_repository.stream(user_id, None, None)]
+    for asset in assets:
+        await assets_repository.delete(user_id, asset["_id"])
+    await refresh_rollups([asset["mnemonic"] for asset in assets])
+    await db_client.portfolios.delete_many({"_id": user_id})
+    await db_client[HISTORY_COLLECTION].delete_many({"user_id": user_id})
+    await users_repository.delete(ObjectId(user_id))
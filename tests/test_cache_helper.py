@@ -0,0 +1,27 @@
+"""Testing the in-process cache of the encoded responses"""
+
+from routers.helpers.cache_helper import ResponseCache
+from routers.helpers.metrics_helper import CACHE_LOOKUPS, render_metrics
+
+def test_cache_limits():
+    """
+    Test case to verify that the oldest responses are removed by number and by bytes and the lookups are counted.
+    """
+    hits, misses = CACHE_LOOKUPS.value("hit"), CACHE_LOOKUPS.value("miss")
+    cache = ResponseCache(size=3, max_bytes=100)
+
+    for key in ("a", "b", "c"):
+        cache.put((key,), b"x" * 40, {})
+    # The bodies are 120 bytes, so the oldest one is removed
+    assert cache.get(("a",)) is None
+    assert cache.get(("b",)) == (b"x" * 40, {})
+
+    cache.put(("big",), b"x" * 101, {})
+    assert cache.get(("big",)) is None
+    cache.put(("d",), b"x" * 10, {})
+    cache.put(("e",), b"x" * 10, {})
+    # Three responses at most, "c" is the oldest one after reading "b"
+    assert [cache.get((key,)) is not None for key in ("b", "c", "d", "e")] == [True, False, True, True]
+
+    assert (CACHE_LOOKUPS.value("hit") - hits, CACHE_LOOKUPS.value("miss") - misses) == (4, 3)
+    assert 'response_cache_lookups_total{result="hit"}' in render_metrics()
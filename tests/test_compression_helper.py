@@ -0,0 +1,33 @@
+"""Testing the negotiation of the response compression"""
+
+import gzip
+import brotli
+from routers.helpers.compression_helper import choose_encoding, BrotliCompressor, GzipCompressor
+
+def test_choose_encoding():
+    """
+    Test case to verify that the accepted encoding with the highest quality is chosen, in order of preference.
+    """
+    available = ("br", "gzip")
+
+    assert choose_encoding("gzip, deflate, br", available) == "br"
+    assert choose_encoding("gzip, deflate", available) == "gzip"
+    assert choose_encoding("br;q=0.5, gzip;q=0.8", available) == "gzip"
+    assert choose_encoding("br;q=0, *", available) == "gzip"
+    assert choose_encoding("GZIP; q=1.0", ("gzip",)) == "gzip"
+    assert choose_encoding("gzip;q=0, identity", available) is None
+    assert choose_encoding("", available) is None
+    assert choose_encoding("gzip;q=oops", available) is None
+
+def test_compressed_streams():
+    """
+    Test case to verify that the chunks of a stream decompress into the whole body with both encodings.
+    """
+    chunk = b'{"mnemonic": "AAA"}\n'
+
+    for compressor, decompress in ((BrotliCompressor(4), brotli.decompress), (GzipCompressor(6), gzip.decompress)):
+        chunks = [compressor.compress(chunk, last=False) for _ in range(3)]
+        # Every chunk can be decoded when it arrives, without waiting for the end
+        assert all(chunks)
+        chunks.append(compressor.compress(b"", last=True))
+        assert decompress(b"".join(chunks)) == chunk * 3
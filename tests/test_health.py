@@ -0,0 +1,51 @@
+"""Testing the health endpoints and the database client"""
+
+import pytest
+from fastapi.testclient import TestClient
+import main
+from db.client import LazyDatabase, DATABASE_NAME
+
+client = TestClient(main.app)
+
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    """Start the app once so the tests share its event loop"""
+    with client:
+        yield
+
+def test_liveness_and_readiness():
+    """
+    Test case to verify the liveness and the readiness of the app.
+    """
+    assert client.get("/health/live").json() == {"status": "alive"}
+
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+def test_readiness_without_database(monkeypatch):
+    """
+    Test case to verify that the app is not ready when the database doesn't answer.
+    """
+    async def database_ready():
+        return False
+
+    monkeypatch.setattr(main, "database_ready", database_ready)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert client.get("/health/live").status_code == 200
+
+def test_lazy_database():
+    """
+    Test case to verify that the client is created on the first use and closed.
+    """
+    database = LazyDatabase(DATABASE_NAME)
+    assert not database.connected
+
+    assert database.assets.name == "assets"
+    assert database["users"].name == "users"
+    assert database.connected
+
+    database.close()
+    assert not database.connected
@@ -0,0 +1,68 @@
+"""Testing the metrics of the requests and the database commands"""
+
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from db.listeners import CommandMetrics, command_filter
+from routers.helpers.metrics_helper import Histogram, COMMAND_SECONDS, SLOW_COMMANDS, REQUESTS
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    """Start the app once so the tests share its event loop"""
+    with client:
+        yield
+
+def test_metrics_endpoint():
+    """
+    Test case to verify that the requests are recorded by route template.
+    """
+    before = REQUESTS.value("GET", "/user/{user_id}", 401)
+    client.get("/user/66a0f0f0f0f0f0f0f0f0f0f0")
+    client.get("/user/66a0f0f0f0f0f0f0f0f0f0f1")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert REQUESTS.value("GET", "/user/{user_id}", 401) == before + 2
+    assert 'http_requests_total{method="GET",route="/user/{user_id}",status="401"}' in response.text
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert "66a0f0f0f0f0f0f0f0f0f0f0" not in response.text
+
+def test_histogram_buckets():
+    """
+    Test case to verify that the histogram buckets are cumulative.
+    """
+    histogram = Histogram("test_seconds", "Test", ("name",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "a")
+
+    assert histogram.samples() == [
+        'test_seconds_bucket{name="a",le="0.1"} 2',
+        'test_seconds_bucket{name="a",le="1.0"} 3',
+        'test_seconds_bucket{name="a",le="+Inf"} 4',
+        'test_seconds_sum{name="a"} 2.65',
+        'test_seconds_count{name="a"} 4']
+
+def test_command_listener(capsys):
+    """
+    Test case to verify that the commands are recorded by collection and the slow ones reported.
+    """
+    listener = CommandMetrics(slow_ms=50)
+    before = COMMAND_SECONDS.count("assets", "find")
+    commands = [({"find": "assets", "filter": {"user_id": "u1"}}, 1000),
+                ({"find": "assets", "filter": {"mnemonic": "AAA"}}, 80000)]
+
+    for request_id, (command, micros) in enumerate(commands):
+        listener.started(SimpleNamespace(connection_id=("db", 27017), request_id=request_id,
+                                         command_name="find", command=command))
+        listener.succeeded(SimpleNamespace(connection_id=("db", 27017), request_id=request_id,
+                                           command_name="find", duration_micros=micros))
+
+    assert COMMAND_SECONDS.count("assets", "find") == before + 2
+    assert SLOW_COMMANDS.value("assets", "find") >= 1
+    assert "{'mnemonic': 'AAA'}" in capsys.readouterr().out
+    assert command_filter("update", {"update": "assets", "updates": [{"q": {"_id": 1}}]}) == {"_id": 1}
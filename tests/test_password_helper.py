@@ -0,0 +1,96 @@
+"""Testing the password worker pool"""
+
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from routers.helpers import password_helper
+from routers.helpers.password_helper import PasswordPool, hash_password, verify_password
+from routers.helpers.password_helper import calibrate_rounds, fake_verify_password, VerifyTime
+from routers.helpers.password_helper import measure_verify_time, _hash, _verify_and_update
+
+def test_hash_and_verify_password():
+    """
+    Test case to verify that the pool hashes and verifies passwords.
+    """
+    async def run():
+        hashed = await hash_password("test_password")
+        return (await verify_password("test_password", hashed),
+                await verify_password("wrong_password", hashed))
+
+    assert asyncio.run(run()) == (True, False)
+
+def test_pool_rejects_when_queue_is_full():
+    """
+    Test case to verify that the pool returns 503 when the queue is full.
+    """
+    pool = PasswordPool("thread", workers=1, queue_limit=1)
+
+    async def run():
+        results = await asyncio.gather(*(pool.run(time.sleep, 0.05) for _ in range(3)),
+                                       return_exceptions=True)
+        return [result for result in results if isinstance(result, HTTPException)]
+
+    rejected = asyncio.run(run())
+    pool.shutdown()
+
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 503
+    assert rejected[0].headers == {"Retry-After": "1"}
+    assert pool.metrics()["completed"] == 2
+    assert pool.metrics()["rejected"] == 1
+
+def test_pool_with_unknown_kind():
+    """
+    Test case to verify that only thread and process pools are allowed.
+    """
+    with pytest.raises(ValueError):
+        PasswordPool("fiber", workers=1, queue_limit=1)
+
+def test_process_pool(monkeypatch):
+    """
+    Test case to verify that the password work, the measure of the verify time included, runs in a process pool.
+    """
+    pool = PasswordPool("process", workers=1, queue_limit=4)
+    monkeypatch.setattr(password_helper, "password_pool", pool)
+    monkeypatch.setattr(password_helper, "verify_time", VerifyTime())
+
+    async def run():
+        hashed = await pool.run(_hash, "test_password")
+        await measure_verify_time()
+        return await pool.run(_verify_and_update, "test_password", hashed)
+
+    try:
+        assert asyncio.run(run()) == (True, None)
+    finally:
+        pool.shutdown()
+
+    assert password_helper.verify_time.seconds > 0
+    assert pool.metrics()["completed"] == 3
+
+def test_calibrate_rounds():
+    """
+    Test case to verify that the calibration picks the highest cost measured within the target.
+    """
+    rounds, times = calibrate_rounds(target_ms=10000, min_rounds=4, max_rounds=6)
+
+    assert rounds == 6
+    assert list(times) == [4, 5, 6]
+
+    rounds, times = calibrate_rounds(target_ms=0, min_rounds=4, max_rounds=6)
+    assert rounds == 4
+    assert list(times) == [4]
+
+def test_fake_verify_without_hashing(monkeypatch):
+    """
+    Test case to verify that the unknown usernames wait the average verification time without using the pool.
+    """
+    monkeypatch.setattr(password_helper, "verify_time", VerifyTime())
+    password_helper.verify_time.add(0.05)
+    completed = password_helper.password_pool.metrics()["completed"]
+
+    start = time.perf_counter()
+    asyncio.run(fake_verify_password())
+
+    assert time.perf_counter() - start >= 0.05
+    assert password_helper.password_pool.metrics()["completed"] == completed
@@ -0,0 +1,154 @@
+"""Testing that the repository backends have the same semantics"""
+
+import asyncio
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from fastapi.testclient import TestClient
+from main import app
+from db.client import db_client
+from db.indexes import create_indexes, missing_unique_indexes, index_report
+from db.repository import create_repositories, BACKENDS
+from db.schemas.asset import ASSET_FIELDS
+from routers.helpers.helper import sparse_fields
+
+@pytest.fixture(name="repositories", params=sorted(BACKENDS))
+def fixture_repositories(request):
+    """Empty repositories of each backend"""
+    users, assets = create_repositories(request.param)
+
+    async def setup():
+        await create_indexes()
+        await users.clear()
+        await assets.clear()
+
+    asyncio.run(setup())
+    yield users, assets
+    asyncio.run(users.clear())
+    asyncio.run(assets.clear())
+
+def test_users_are_unique(repositories):
+    """
+    Test case to verify the ids and the unique usernames and emails.
+    """
+    users, _ = repositories
+
+    async def run():
+        user_id = await users.insert({"username": "a", "email": "a@asset.map", "password": "-"})
+        errors = []
+        for user in ({"username": "b", "email": "a@asset.map"}, {"username": "a", "email": "b@asset.map"}):
+            try:
+                await users.insert({**user, "password": "-"})
+            except DuplicateKeyError as e:
+                errors.append(list(e.details["keyPattern"]))
+        other_id = await users.insert({"username": "b", "email": "b@asset.map", "password": "-"})
+        try:
+            await users.update(other_id, {"email": "a@asset.map"})
+        except DuplicateKeyError as e:
+            errors.append(list(e.details["keyPattern"]))
+        return user_id, errors, await users.find_one("username", "a"), await users.update(user_id, {"email": "c@asset.map"})
+
+    user_id, errors, found, modified = asyncio.run(run())
+
+    assert isinstance(user_id, ObjectId)
+    assert errors == [["email"], ["username"], ["email"]]
+    assert found["_id"] == user_id
+    assert modified == 1
+
+def test_assets_by_user(repositories):
+    """
+    Test case to verify that the assets are scoped by user, paginated and summarized.
+    """
+    _, assets = repositories
+
+    async def run():
+        ids = [await assets.insert({"user_id": "u1", "mnemonic": f"M{i}", "price": 10.0, "shares": i + 1})
+               for i in range(3)]
+        await assets.insert({"user_id": "u2", "mnemonic": "M0", "price": 5.0, "shares": 2})
+        try:
+            await assets.insert({"user_id": "u1", "mnemonic": "M0", "price": 1.0, "shares": 1})
+        except DuplicateKeyError:
+            pass
+        first, cursor = await assets.find_page("u1", 2, None)
+        second, last = await assets.find_page("u1", 2, cursor)
+        foreign = await assets.update("u2", ids[0], {"price": 1.0})
+        before = await assets.update("u1", ids[0], {"price": 20.0})
+        statuses = await assets.write_many("u1", [{"mnemonic": "M1", "price": 1.0, "shares": 1},
+                                                  {"mnemonic": "M9", "price": 1.0, "shares": 1}], upsert=False)
+        summaries = sorted([group async for group in assets.summaries(["u1", "u2"])], key=lambda g: g["_id"])
+        portfolio = await assets.portfolio("u1", top=1, sort="mnemonic")
+        trades = [await assets.trade("u1", ids[2], 3, 20.0), await assets.trade("u1", ids[2], -2, 1.0),
+                  await assets.trade("u1", ids[2], -5, 1.0), await assets.trade("u2", ids[2], 1, 1.0)]
+        matched = await assets.set_prices({"M0": 2.0}, {})
+        rollups = sorted([group async for group in assets.rollups()], key=lambda g: g["_id"])
+        return (ids, first, second, last, foreign, before, statuses, summaries, portfolio, trades, matched, rollups,
+                [group async for group in assets.rollups(["M0", "M5"])],
+                sorted(await assets.holders(["M0", "M9"])), await assets.delete("u2", ids[1]))
+
+    (ids, first, second, last, foreign, before, statuses, summaries, portfolio, trades, matched, rollups,
+     some_rollups, holders, deleted) = asyncio.run(run())
+
+    assert [asset["_id"] for asset in first + second] == ids
+    assert last is None
+    assert foreign is None
+    assert before["price"] == 10.0
+    assert [status for status, _ in statuses] == ["duplicated", "inserted"]
+    assert [(group["_id"], group["total"]) for group in summaries] == [("u1", 71.0), ("u2", 10.0)]
+    assert portfolio == [{"mnemonic": "M2", "percentage": pytest.approx(30 / 71 * 100)},
+                         {"mnemonic": "OTHER", "percentage": pytest.approx(41 / 71 * 100)}]
+    assert [(asset["shares"], asset["price"], asset["avg_price"]) for asset in trades[:2]] == [
+        (6, 10.0, 15.0), (4, 10.0, 15.0)]
+    assert trades[2:] == [None, None]
+    assert matched == (2, 2)
+    assert [(group["_id"], group["shares"], group["value"], group["users"]) for group in rollups] == [
+        ("M0", 3, 6.0, 2), ("M1", 2, 20.0, 1), ("M2", 4, 40.0, 1), ("M9", 1, 1.0, 1)]
+    assert [group["_id"] for group in some_rollups] == ["M0"]
+    assert holders == ["u1", "u2"]
+    assert deleted is None
+
+def test_asset_projections(repositories):
+    """
+    Test case to verify that both backends read only the fields of the projection, even only the id.
+    """
+    _, assets = repositories
+
+    async def run():
+        asset_id = await assets.insert({"user_id": "u1", "mnemonic": "M0", "price": 10.0, "shares": 1})
+        only_id, _ = sparse_fields("id", ASSET_FIELDS, None)
+        some, _ = sparse_fields("id,shares", ASSET_FIELDS, None)
+        return (asset_id, (await assets.find_page("u1", None, None, only_id))[0],
+                [asset async for asset in assets.stream("u1", None, None, some)])
+
+    asset_id, page, streamed = asyncio.run(run())
+
+    assert page == [{"_id": asset_id}]
+    assert streamed == [{"_id": asset_id, "shares": 1}]
+
+def test_missing_unique_index():
+    """
+    Test case to verify that the API doesn't start without a unique index and the duplicates are reported.
+    """
+    duplicates = [{"username": f"test_dup_{i}", "email": "test_dup@gmail.com", "password": "-"} for i in range(2)]
+
+    async def break_index():
+        await create_indexes()
+        await db_client.users.drop_index("email_unique")
+        await db_client.users.insert_many(duplicates)
+        # The index can't be created with the duplicates
+        await create_indexes()
+        return await missing_unique_indexes(), (await index_report())["duplicated"]
+
+    async def fix_index():
+        await db_client.users.delete_many({"email": "test_dup@gmail.com"})
+        await create_indexes()
+        return await missing_unique_indexes()
+
+    missing, duplicated = asyncio.run(break_index())
+    try:
+        assert missing == ["users.email_unique"]
+        assert duplicated == ["users.email_unique {'email': 'test_dup@gmail.com'} x2"]
+        with pytest.raises(RuntimeError, match="users.email_unique"):
+            with TestClient(app):
+                pass
+    finally:
+        assert asyncio.run(fix_index()) == []
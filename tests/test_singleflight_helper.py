@@ -0,0 +1,78 @@
+"""Testing the coalescing of the identical reads in flight"""
+
+import asyncio
+import pytest
+from routers.helpers.singleflight_helper import SingleFlight
+from routers.helpers.metrics_helper import COALESCED
+
+def test_concurrent_calls_share_one_query():
+    """
+    Test case to verify that the concurrent calls with the same key run once and the other keys run apart.
+    """
+    flight = SingleFlight()
+    calls = []
+    saved = COALESCED.value("test_user")
+
+    async def query(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {"key": key}
+
+    async def run():
+        return await asyncio.gather(*(flight.run("test_user", (key,), lambda key=key: query(key))
+                                      for key in ("a", "a", "a", "b")))
+
+    results = asyncio.run(run())
+
+    assert results == [{"key": "a"}, {"key": "a"}, {"key": "a"}, {"key": "b"}]
+    assert calls == ["a", "b"]
+    assert flight.metrics() == {"in_flight": 0, "queries": 2, "saved": 2}
+    assert COALESCED.value("test_user") == saved + 2
+
+def test_invalidated_calls_query_again():
+    """
+    Test case to verify that the callers coming after a write of the owner don't get the result read before it.
+    """
+    flight = SingleFlight()
+    version = {"user_1": 1, "user_2": 1}
+
+    async def query(owner):
+        read = version[owner]
+        await asyncio.sleep(0.01)
+        return read
+
+    async def run():
+        before = [asyncio.ensure_future(flight.run("version", (owner,), lambda owner=owner: query(owner)))
+                  for owner in ("user_1", "user_2")]
+        # The queries read the version and wait
+        await asyncio.sleep(0.001)
+        version["user_1"] = version["user_2"] = 2
+        flight.invalidate(owners=["user_1"])
+        after = [flight.run("version", (owner,), lambda owner=owner: query(owner))
+                 for owner in ("user_1", "user_2")]
+        return await asyncio.gather(*before, *after)
+
+    assert asyncio.run(run()) == [1, 1, 2, 1]
+    assert flight.metrics()["queries"] == 3
+
+def test_failed_call_is_shared():
+    """
+    Test case to verify that every caller gets the error of the shared call and the next call runs again.
+    """
+    flight = SingleFlight()
+
+    async def query():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("database down")
+
+    async def run():
+        results = await asyncio.gather(*(flight.run("user", ("_id", "1"), query) for _ in range(3)),
+                                       return_exceptions=True)
+        return results, flight.metrics()
+
+    results, metrics = asyncio.run(run())
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert metrics == {"in_flight": 0, "queries": 1, "saved": 2}
+    with pytest.raises(ConnectionError):
+        asyncio.run(flight.run("user", ("_id", "1"), query))
@@ -0,0 +1,137 @@
+"""Testing the throttle of the password endpoints"""
+
+import ipaddress
+import time
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from main import app
+from db.client import db_client
+from db.repository import users_repository
+from routers import users
+from routers.helpers.throttle_helper import BACKENDS, PasswordThrottle, MemoryThrottleBackend, client_ip
+from routers.helpers.users_helper import pwd_context
+
+client = TestClient(app)
+
+user_dict = {
+    "username": "test_throttle_user",
+    "email": "test_throttle_user@gmail.com",
+    "password": "test_password"
+}
+
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    """Start the app once so the tests and the helpers share its event loop"""
+    with client:
+        yield
+
+@pytest.fixture(name="throttle")
+def strict_throttle(monkeypatch):
+    """Throttle of the endpoints with small limits"""
+    throttle = PasswordThrottle(MemoryThrottleBackend(), ip_rate=3, username_rate=2, max_failures=2, lockout=60)
+    monkeypatch.setattr(users, "password_throttle", throttle)
+    return throttle
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_token_bucket(backend):
+    """
+    Test case to verify that the bucket allows the capacity at once and then one token each interval.
+    """
+    throttle_backend = BACKENDS[backend]()
+    # The buckets expire with a TTL index, so the times must be recent
+    now = int(time.time())
+
+    async def take_tokens():
+        await db_client.throttle.delete_many({})
+        waits = [await throttle_backend.take("ip:bucket", 10, 3, now) for _ in range(4)]
+        waits.append(await throttle_backend.take("ip:bucket", 10, 3, now + 4))
+        waits.append(await throttle_backend.take("ip:bucket", 10, 3, now + 10))
+        waits.append(await throttle_backend.take("ip:other", 10, 3, now + 10))
+        return waits
+
+    assert client.portal.call(take_tokens) == [0, 0, 0, 10, 6, 0, 0]
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_failure_counters(backend):
+    """
+    Test case to verify that the failures are counted in a window and forgotten after it or after a reset.
+    """
+    throttle_backend = BACKENDS[backend]()
+    now = int(time.time())
+
+    async def count_failures():
+        await db_client.lockouts.delete_many({})
+        counts = [await throttle_backend.add_failure("user:a", 60, now),
+                  await throttle_backend.add_failure("user:a", 60, now + 30)]
+        counts.append((await throttle_backend.failures("user:a", now + 50))[0])
+        counts.append((await throttle_backend.failures("user:a", now + 91))[0])
+        counts.append(await throttle_backend.add_failure("user:a", 60, now + 100))
+        await throttle_backend.reset("user:a")
+        counts.append((await throttle_backend.failures("user:a", now + 100))[0])
+        return counts
+
+    assert client.portal.call(count_failures) == [1, 2, 2, 0, 1, 0]
+
+def test_client_ip_behind_proxies():
+    """
+    Test case to verify that X-Forwarded-For is only used when the request comes from a trusted proxy.
+    """
+    proxies = [ipaddress.ip_network("10.0.0.0/8")]
+
+    def request(host: str, forwarded: str | None = None) -> Request:
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "client": (host, 1234), "headers": headers})
+
+    assert client_ip(request("10.0.0.1", "203.0.113.5"), proxies) == "203.0.113.5"
+    assert client_ip(request("10.0.0.1", "198.51.100.1, 203.0.113.5, 10.0.0.2"), proxies) == "203.0.113.5"
+    assert client_ip(request("203.0.113.9", "198.51.100.1"), proxies) == "203.0.113.9"
+    assert client_ip(request("10.0.0.1"), proxies) == "10.0.0.1"
+    assert client_ip(request("10.0.0.1", "198.51.100.1"), []) == "10.0.0.1"
+
+def test_login_throttled_by_ip(throttle):
+    """
+    Test case to verify that the client gets a 429 with Retry-After after too many requests.
+    """
+    for number in range(throttle.ip_rate):
+        login_data = {"username": f"test_throttle_nobody_{number}", "password": "test_password"}
+        assert client.post("/user/login", data=login_data).status_code == 400
+
+    response = client.post("/user/login", data={"username": "test_throttle_nobody", "password": "test_password"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Creating users shares the limit of the client
+    response = client.post("/user/", json=user_dict)
+    assert response.status_code == 429
+
+def test_login_lockout(throttle):
+    """
+    Test case to verify that the username is locked after too many wrong passwords, even with the right one.
+    """
+    throttle.ip_rate = 0
+    throttle.username_rate = 0
+    client.portal.call(users_repository.insert, {**user_dict, "password": pwd_context.hash(user_dict["password"])})
+
+    wrong_data = {"username": user_dict["username"], "password": "wrong_password"}
+    for _ in range(throttle.max_failures):
+        assert client.post("/user/login", data=wrong_data).status_code == 400
+
+    login_data = {"username": user_dict["username"], "password": user_dict["password"]}
+    response = client.post("/user/login", data=login_data)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= throttle.lockout
+
+    client.portal.call(throttle.backend.reset, f"user:{user_dict['username']}")
+    assert client.post("/user/login", data=login_data).status_code == 200
+    #Cleaning up
+    client.portal.call(remove_user, user_dict["username"])
+
+# HELPER #
+
+async def remove_user(username: str):
+    """Removing the user using the app event loop"""
+
+    found = await users_repository.find_one("username", username)
+    if found:
+        await users_repository.delete(found["_id"])
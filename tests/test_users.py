@@ -1,11 +1,14 @@
 """Testing all User module endpoints"""
 
+import json
+import pytest
 from fastapi.testclient import TestClient
 from main import app
 from db.models.user import User
-from db.client import db_client
+from db.repository import users_repository
 from db.schemas.user import user_schema
-from routers.helpers.users_helper import pwd_context
+from passlib.hash import bcrypt
+from routers.helpers.users_helper import pwd_context, get_current_user, bcrypt_rounds
 
 client = TestClient(app)
 
@@ -15,6 +18,12 @@ user_dict = {
     "password": "test_password"
 }
 
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    """Start the app once so the tests and the helpers share its event loop"""
+    with client:
+        yield
+
 def test_user_list_not_authenticated():
     """
     Test case to verify that an unauthenticated user cannot access the user list endpoint.
@@ -83,6 +92,20 @@ def test_create_user_failed():
     #Cleaning up
     delete_user(user_dict)
 
+def test_create_user_with_duplicated_username():
+    """
+    Test case to fail creating a user with a username that already exists.
+    """
+    #Inserting a user in database
+    save_user(user_dict)
+    #Calling the service with the same username and another email
+    response = client.post("/user/", json={**user_dict, "email": "another_email@gmail.com"})
+
+    assert response.status_code == 404
+    assert response.json()['detail'] == "The user exists, please choose another username."
+    #Cleaning up
+    delete_user(user_dict)
+
 def test_create_user():
     """
     Test case to create a user.
@@ -99,8 +122,134 @@ def test_create_user():
     #Cleaning up
     delete_user(user_dict)
 
+def test_token_without_database():
+    """
+    Test case to verify that the access token authenticates the user without reading the database.
+    """
+    save_user(user_dict)
+    tokens = login(user_dict)
+
+    assert tokens['refresh_token']
+    assert tokens['expires_in'] > 0
+
+    async def search_user_failed(*_):
+        raise AssertionError("The user was read from the database")
+
+    original_find_one = users_repository.find_one
+    users_repository.find_one = search_user_failed
+    try:
+        user = client.portal.call(get_current_user, tokens['access_token'])
+    finally:
+        users_repository.find_one = original_find_one
+
+    assert user.username == user_dict['username']
+    assert user.email == user_dict['email']
+    assert user.id
+    #Cleaning up
+    delete_user(user_dict)
+
+def test_refresh_token():
+    """
+    Test case to verify that the refresh token gives new tokens, and that it can't be used as an access token.
+    """
+    save_user(user_dict)
+    tokens = login(user_dict)
+
+    response = client.get("/user/", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401
+
+    response = client.post("/user/refresh", json={"refresh_token": tokens['access_token']})
+    assert response.status_code == 401
+
+    response = client.post("/user/refresh", json={"refresh_token": tokens['refresh_token']})
+    assert response.status_code == 200
+
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/user/", headers=headers).status_code == 200
+    #Cleaning up
+    delete_user(user_dict)
+
+def test_tokens_revoked_after_password_change():
+    """
+    Test case to verify that the tokens issued before a password change are rejected.
+    """
+    user = save_user(user_dict)
+    tokens = login(user_dict)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.patch(f"/user/password/{user.id}", json={"password": "new_password"}, headers=headers)
+    assert response.status_code == 204
+
+    assert client.get("/user/", headers=headers).status_code == 401
+    response = client.post("/user/refresh", json={"refresh_token": tokens['refresh_token']})
+    assert response.status_code == 401
+
+    new_tokens = login({**user_dict, "password": "new_password"})
+    headers = {"Authorization": f"Bearer {new_tokens['access_token']}"}
+    assert client.get("/user/", headers=headers).status_code == 200
+    #Cleaning up
+    delete_user(user_dict)
+
+def test_tokens_revoked_after_delete():
+    """
+    Test case to verify that the tokens of a deleted user are rejected.
+    """
+    user = save_user(user_dict)
+    tokens = login(user_dict)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    assert client.delete(f"/user/{user.id}", headers=headers).status_code == 204
+
+    assert client.get("/user/", headers=headers).status_code == 401
+    response = client.post("/user/refresh", json={"refresh_token": tokens['refresh_token']})
+    assert response.status_code == 401
+
+def test_user_list_fields():
+    """
+    Test case to verify that fields= returns only the asked fields of the users.
+    """
+    save_user(user_dict)
+    headers = {"Authorization": f"Bearer {login(user_dict)['access_token']}"}
+
+    response = client.get("/user/?fields=username", headers=headers)
+    assert response.status_code == 200
+    assert {"username": user_dict['username']} in response.json()
+    assert all(set(user) == {"username"} for user in response.json())
+
+    response = client.get("/user/?fields=id,email", headers={**headers, "Accept": "application/x-ndjson"})
+    assert all(line.keys() == {"id", "email"} for line in map(json.loads, response.text.splitlines()))
+
+    assert client.get("/user/?fields=password", headers=headers).status_code == 400
+    #Cleaning up
+    delete_user(user_dict)
+
+def test_login_rehashes_old_cost():
+    """
+    Test case to verify that the password hashed with another bcrypt cost is hashed again on login.
+    """
+    old_hash = bcrypt.using(rounds=bcrypt_rounds + 1).hash(user_dict['password'])
+    client.portal.call(insert_user, {**user_dict, "password": old_hash})
+    assert pwd_context.needs_update(old_hash)
+
+    login(user_dict)
+
+    stored = client.portal.call(users_repository.find_one, "username", user_dict['username'])
+    assert stored["password"] != old_hash
+    assert not pwd_context.needs_update(stored["password"])
+    assert pwd_context.verify(user_dict['password'], stored["password"])
+    #Cleaning up
+    delete_user(user_dict)
+
 # HELPER #
 
+def login(user: dict) -> dict:
+    """Login with the endpoint and return the tokens"""
+
+    response = client.post("/user/login", data={"username": user['username'], "password": user['password']})
+    assert response.status_code == 200
+
+    return response.json()
+
 def save_user(user: dict):
     """Saving a new user in the database to use in tests"""
 
@@ -108,15 +257,25 @@ def save_user(user: dict):
     # Encrypt the password
     new_user["password"] = pwd_context.hash(new_user["password"])
 
-    inserted_id = db_client.users.insert_one(new_user).inserted_id
+    return client.portal.call(insert_user, new_user)
+
+def delete_user(user: dict):
+    """Deleting a user from the database after using it in tests"""
+
+    return client.portal.call(remove_user, user['username'])
 
-    new_user = user_schema(db_client.users.find_one({"_id": inserted_id}))
+async def insert_user(user: dict):
+    """Inserting the user using the app event loop"""
+
+    inserted_id = await users_repository.insert(user)
+
+    new_user = user_schema(await users_repository.find_one("_id", inserted_id))
 
     return User(**new_user)
 
-def delete_user(user: dict):
-    """Deleting a user from the database after using it in tests"""
+async def remove_user(username: str):
+    """Removing the user using the app event loop"""
 
-    result = db_client.users.delete_one({"username": user['username']})
+    found = await users_repository.find_one("username", username)
 
-    return result.deleted_count
+    return 1 if found and await users_repository.delete(found["_id"]) else 0